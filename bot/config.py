@@ -1,4 +1,5 @@
 import os
+import socket
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -21,6 +22,118 @@ class Config:
 
     # Database settings
     DB_PATH = 'bot.db'
+    # Количество соединений-читателей в пуле (писатель всегда один)
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '4'))
+
+    # Настройки SQLite (PRAGMA), применяются в Database.init_db.
+    # WAL позволяет читателям (админ-статистика) не блокировать запись баланса.
+    SQLITE_PRAGMAS = {
+        'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000')),
+        'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', '-16000')),  # < 0 — размер в KiB
+        'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', str(128 * 1024 * 1024))),
+        'temp_store': 'MEMORY',
+    }
+
+    # Максимум одновременных запросов к Replicate (остальные ждут в очереди)
+    REPLICATE_MAX_CONCURRENCY = int(os.getenv('REPLICATE_MAX_CONCURRENCY', '4'))
+
+    # Очередь генераций: число воркеров и попыток до возврата токена
+    GENERATION_WORKERS = int(os.getenv('GENERATION_WORKERS', '4'))
+    GENERATION_MAX_ATTEMPTS = int(os.getenv('GENERATION_MAX_ATTEMPTS', '2'))
+
+    # Общий HTTP-клиент (пул keep-alive соединений для исходящих запросов)
+    HTTP_POOL_LIMIT = int(os.getenv('HTTP_POOL_LIMIT', '100'))
+    HTTP_POOL_LIMIT_PER_HOST = int(os.getenv('HTTP_POOL_LIMIT_PER_HOST', '20'))
+    HTTP_DNS_CACHE_TTL = int(os.getenv('HTTP_DNS_CACHE_TTL', '300'))
+    HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', '60'))
+
+    # Предобработка фото перед загрузкой в Replicate (0 — отключить)
+    IMAGE_MAX_EDGE = int(os.getenv('IMAGE_MAX_EDGE', '1536'))
+    IMAGE_JPEG_QUALITY = int(os.getenv('IMAGE_JPEG_QUALITY', '85'))
+    IMAGE_PREPROCESS_WORKERS = int(os.getenv('IMAGE_PREPROCESS_WORKERS', '2'))
+
+    # Кэш результатов генерации (0 — отключить)
+    GENERATION_CACHE_TTL = int(os.getenv('GENERATION_CACHE_TTL', str(24 * 3600)))
+    GENERATION_CACHE_MAX_ENTRIES = int(os.getenv('GENERATION_CACHE_MAX_ENTRIES', '10000'))
+
+    # Режим получения обновлений: polling или webhook
+    DELIVERY_MODE = os.getenv('DELIVERY_MODE', 'polling').lower()
+
+    # Webhook: Telegram и YooKassa обслуживаются одним aiohttp-приложением
+    WEBHOOK_BASE_URL = os.getenv('WEBHOOK_BASE_URL', '').rstrip('/')  # https://bot.example.com
+    WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook/telegram')
+    WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')  # X-Telegram-Bot-Api-Secret-Token
+    WEBAPP_HOST = os.getenv('WEBAPP_HOST', '0.0.0.0')
+    WEBAPP_PORT = int(os.getenv('WEBAPP_PORT', '8080'))
+    YOOKASSA_WEBHOOK_PATH = os.getenv('YOOKASSA_WEBHOOK_PATH', '/webhook/yookassa')
+    YOOKASSA_WEBHOOK_SECRET = os.getenv('YOOKASSA_WEBHOOK_SECRET')  # ?token=... в URL уведомлений
+
+    # Несколько процессов бота (только в режиме webhook: порт делится через SO_REUSEPORT)
+    BOT_WORKERS = int(os.getenv('BOT_WORKERS', '1'))
+    # Сколько процессов запускается на самом деле: в режиме polling всегда один.
+    # По нему делятся общие лимиты и настраиваются кэши процесса
+    BOT_PROCESSES = max(1, BOT_WORKERS) if DELIVERY_MODE == 'webhook' else 1
+    # Идентификатор хоста/инстанса — владелец задач генерации в общей очереди
+    WORKER_ID = os.getenv('WORKER_ID', socket.gethostname())
+    # FSM-хранилище: sqlite/redis (переживают перезапуск, общие для процессов) или memory
+    FSM_STORAGE = os.getenv('FSM_STORAGE', 'sqlite').lower()
+    REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+    # Брошенные сессии FSM старше этого срока (сек) считаются пустыми и удаляются
+    FSM_TTL = int(os.getenv('FSM_TTL', str(7 * 24 * 3600)))
+    FSM_SWEEP_INTERVAL = int(os.getenv('FSM_SWEEP_INTERVAL', '3600'))
+    # Окно объединения записей FSM (мс) и максимум ключей в буфере до сброса
+    FSM_FLUSH_INTERVAL_MS = int(os.getenv('FSM_FLUSH_INTERVAL_MS', '50'))
+    FSM_MAX_PENDING = int(os.getenv('FSM_MAX_PENDING', '1000'))
+    # Аренда задачи генерации (сек): задачу упавшего процесса заберёт другой
+    GENERATION_JOB_LEASE = int(os.getenv('GENERATION_JOB_LEASE', '300'))
+
+    # Лимиты исходящих запросов к Bot API (сообщений в секунду)
+    OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', '30'))
+    OUTBOUND_PRIVATE_CHAT_RATE = float(os.getenv('OUTBOUND_PRIVATE_CHAT_RATE', '1'))
+    OUTBOUND_GROUP_CHAT_RATE = float(os.getenv('OUTBOUND_GROUP_CHAT_RATE', str(20 / 60)))
+    OUTBOUND_MAX_RETRIES = int(os.getenv('OUTBOUND_MAX_RETRIES', '3'))
+
+    # Рассылки: размер пачки получателей и число одновременных отправок
+    BROADCAST_CHUNK_SIZE = int(os.getenv('BROADCAST_CHUNK_SIZE', '100'))
+    BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', '20'))
+
+    # Планировщик отложенных действий: как часто проверять действия других процессов (сек)
+    SCHEDULER_POLL_INTERVAL = float(os.getenv('SCHEDULER_POLL_INTERVAL', '30'))
+
+    # Антифлуд входящих апдейтов: (событий в секунду, всплеск) на пользователя
+    # по типу апдейта; rate 0 — без ограничения. Всплеск сообщений с запасом
+    # под альбом из 10 фото
+    ANTIFLOOD_LIMITS = {
+        'message': (float(os.getenv('ANTIFLOOD_MESSAGE_RATE', '1')), int(os.getenv('ANTIFLOOD_MESSAGE_BURST', '12'))),
+        'callback_query': (float(os.getenv('ANTIFLOOD_CALLBACK_RATE', '2')), int(os.getenv('ANTIFLOOD_CALLBACK_BURST', '8'))),
+        'default': (float(os.getenv('ANTIFLOOD_DEFAULT_RATE', '1')), int(os.getenv('ANTIFLOOD_DEFAULT_BURST', '5'))),
+    }
+    # Удаление мусорных сообщений пачками (delete_messages) раз в N секунд
+    DELETION_BATCH_INTERVAL = float(os.getenv('DELETION_BATCH_INTERVAL', '1'))
+
+    # Кэш записей пользователей в памяти процесса (баланс, профиль); 0 — отключить.
+    # При нескольких процессах (BOT_PROCESSES > 1) записи другого процесса
+    # видны не позже чем через TTL
+    USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '30'))
+    USER_CACHE_MAX_ENTRIES = int(os.getenv('USER_CACHE_MAX_ENTRIES', '10000'))
+
+    # Как часто проверять settings_version (сек): изменения настроек из других процессов
+    SETTINGS_POLL_INTERVAL = float(os.getenv('SETTINGS_POLL_INTERVAL', '10'))
+
+    # Буфер аналитики: запись пачками по размеру или раз в N секунд,
+    # сверх ANALYTICS_MAX_QUEUE события отбрасываются (с подсчётом)
+    ANALYTICS_BATCH_SIZE = int(os.getenv('ANALYTICS_BATCH_SIZE', '200'))
+    ANALYTICS_FLUSH_INTERVAL = float(os.getenv('ANALYTICS_FLUSH_INTERVAL', '2'))
+    ANALYTICS_MAX_QUEUE = int(os.getenv('ANALYTICS_MAX_QUEUE', '20000'))
+
+    # Кэш сводки админ-панели (сек): одновременные обновления у нескольких админов
+    # обслуживаются одним запросом; 0 — без кэша
+    DASHBOARD_CACHE_TTL = float(os.getenv('DASHBOARD_CACHE_TTL', '10'))
+
+    # Экспорт данных админом (/export): строк в пачке чтения
+    EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '5000'))
 
     # Free generations for new users
     FREE_GENERATIONS = 3
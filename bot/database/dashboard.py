@@ -0,0 +1,39 @@
+# bot/database/dashboard.py
+
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Any, List, Mapping, Tuple
+
+
+@dataclass(frozen=True)
+class DashboardSnapshot:
+    """Метрики админ-панели на момент generated_at (Database.get_dashboard_snapshot)"""
+
+    total_users: int = 0
+    new_users_today: int = 0
+    new_users_week: int = 0
+    new_users_month: int = 0
+
+    total_generations: int = 0
+    generations_today: int = 0
+
+    total_payments: int = 0
+    revenue_total: int = 0
+    revenue_today: int = 0
+    revenue_week: int = 0
+    revenue_month: int = 0
+
+    # [(комната/стиль, генераций)], по убыванию
+    popular_rooms: List[Tuple[str, int]] = field(default_factory=list)
+    popular_styles: List[Tuple[str, int]] = field(default_factory=list)
+
+    generated_at: float = field(default_factory=time.time)
+
+    @classmethod
+    def from_row(cls, row: Mapping[str, Any]) -> "DashboardSnapshot":
+        values = dict(row)
+        for key in ("popular_rooms", "popular_styles"):
+            items = json.loads(values.get(key) or "[]")
+            values[key] = sorted(((name, count) for name, count in items), key=lambda item: -item[1])
+        return cls(**values)
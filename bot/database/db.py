@@ -1,11 +1,17 @@
 # bot/database/db.py
 
-import aiosqlite
-from typing import Optional, Dict, Any, List
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, List, AsyncIterator, Tuple
 import logging
 import secrets
 
 from config import config
+from database.pool import ConnectionPool
+from utils.cache import TTLCache
+from database.dashboard import DashboardSnapshot
+from database.migrations import run_migrations
+from database.settings import Settings
 from database.models import (
     CREATE_USERS_TABLE,
     CREATE_PAYMENTS_TABLE,
@@ -21,11 +27,13 @@ from database.models import (
     CREATE_USER,
     UPDATE_BALANCE,
     DECREASE_BALANCE,
-    GET_BALANCE,
+    GET_PROFILE_SNAPSHOT,
     CREATE_PAYMENT,
     GET_PENDING_PAYMENT,
     UPDATE_PAYMENT_STATUS,
+    MARK_PAYMENT_SUCCEEDED,
     LOG_ANALYTICS,
+    LOG_ANALYTICS_BATCH,
     GET_TOTAL_USERS,
     GET_NEW_USERS_TODAY,
     GET_NEW_USERS_WEEK,
@@ -38,15 +46,23 @@ from database.models import (
     GET_REVENUE_MONTH,
     GET_POPULAR_ROOMS,
     GET_POPULAR_STYLES,
+    REBUILD_ROLLUPS,
+    GET_DASHBOARD_SNAPSHOT,
+    EXPORT_TABLES,
     GET_ALL_USERS,
+    GET_USERS_PAGE_FIRST,
+    GET_USERS_PAGE_OLDER,
+    GET_USERS_PAGE_NEWER,
+    SEARCH_USERS,
     GET_USER_BY_REFERRAL_CODE,
     UPDATE_REFERRAL_CODE,
     UPDATE_REFERRED_BY,
     INCREMENT_REFERRALS_COUNT,
     GET_REFERRALS_COUNT,
-    GET_SETTING,
     SET_SETTING,
+    INIT_SETTING,
     GET_ALL_SETTINGS,
+    GET_SETTINGS_VERSION,
     GET_ACTIVE_PACKAGES,
     GET_PACKAGE_BY_ID,
     CREATE_PACKAGE,
@@ -63,20 +79,125 @@ from database.models import (
     GET_USER_PAYOUTS,
     UPDATE_PAYOUT_STATUS,
     GET_PAYOUT_STATS,
+    CREATE_GENERATION_JOB,
+    CLAIM_GENERATION_JOB,
+    REQUEUE_RUNNING_JOBS,
+    RENEW_GENERATION_JOB_LEASE,
+    GET_FSM_STATE,
+    GET_FSM_DATA,
+    SET_FSM_STATE,
+    SET_FSM_DATA,
+    DELETE_EMPTY_FSM_STATE,
+    DELETE_EXPIRED_FSM_STATE,
+    CREATE_BROADCAST,
+    GET_BROADCAST,
+    GET_LAST_BROADCAST,
+    CLAIM_BROADCAST,
+    CHECKPOINT_BROADCAST,
+    FINISH_BROADCAST,
+    CANCEL_BROADCAST,
+    GET_BROADCAST_RECIPIENTS,
+    COUNT_BROADCAST_RECIPIENTS,
+    MARK_USER_BLOCKED,
+    MARK_USER_UNBLOCKED,
+    CREATE_SCHEDULED_ACTION,
+    CLAIM_DUE_ACTIONS,
+    GET_NEXT_ACTION_TIME,
+    COUNT_SCHEDULED_ACTIONS,
+    COMPLETE_GENERATION_JOB,
+    RETRY_GENERATION_JOB,
+    FAIL_GENERATION_JOB,
+    GET_GENERATION_JOB,
+    GET_GENERATION_QUEUE_STATS,
+    SET_GENERATION_JOB_FILE_ID,
+    GET_LAST_SUCCEEDED_GENERATION,
+    GET_CACHED_GENERATION,
+    TOUCH_CACHED_GENERATION,
+    PUT_CACHED_GENERATION,
+    SET_CACHED_GENERATION_FILE_ID,
+    EVICT_EXPIRED_GENERATIONS,
+    EVICT_LRU_GENERATIONS,
+    GET_GENERATION_CACHE_SIZE,
 )
 
 logger = logging.getLogger(__name__)
 
+# Наибольший INTEGER в SQLite (int64)
+_SQLITE_MAX_INT = 2 ** 63 - 1
+
+
+def _is_int64(value: str) -> bool:
+    """Строка из цифр, которую SQLite примет как INTEGER (иначе OverflowError при привязке)"""
+    return value.isascii() and value.isdigit() and int(value) <= _SQLITE_MAX_INT
+
 
 class Database:
     """Асинхронный класс для работы с базой данных"""
 
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, pool_size: int = 4, pragmas: Optional[Dict[str, Any]] = None):
         self.db_path = db_path
+        self.pool = ConnectionPool(db_path, readers=pool_size, pragmas=pragmas)
+        self._pool_lock = asyncio.Lock()
+        # Записи users по user_id. Все изменения users через методы этого
+        # класса сбрасывают запись пользователя (write-through инвалидация)
+        user_cache_ttl = config.USER_CACHE_TTL
+        if config.BOT_PROCESSES > 1:
+            # Изменения других процессов сюда не доходят — держим кэш коротким
+            user_cache_ttl = min(user_cache_ttl, 5)
+        self.user_cache = TTLCache(user_cache_ttl, config.USER_CACHE_MAX_ENTRIES)
+        # Снимок settings; загружается в init_db, обновляется refresh_settings()
+        self.settings = Settings()
+        # Сводка админ-панели: короткий TTL, одновременные запросы ждут один пересчёт
+        self.dashboard_cache = TTLCache(config.DASHBOARD_CACHE_TTL, max_entries=4)
+        self._dashboard_lock = asyncio.Lock()
+
+    # ===== ПУЛ СОЕДИНЕНИЙ =====
+
+    async def _get_pool(self) -> ConnectionPool:
+        """Вернуть открытый пул (открывает его при первом обращении)"""
+        if not self.pool.is_open:
+            async with self._pool_lock:
+                await self.pool.open()
+        return self.pool
+
+    @asynccontextmanager
+    async def _read(self):
+        """Соединение для чтения из пула"""
+        pool = await self._get_pool()
+        async with pool.reader() as conn:
+            yield conn
+
+    @asynccontextmanager
+    async def _write(self):
+        """Эксклюзивное соединение для записи из пула"""
+        pool = await self._get_pool()
+        async with pool.writer() as conn:
+            yield conn
+
+    async def close(self):
+        """Закрыть пул соединений (при остановке бота)"""
+        await self.pool.close()
+
+    def get_pool_stats(self) -> Dict[str, Any]:
+        """Статистика пула соединений"""
+        return self.pool.get_stats()
+
+    async def _log_effective_pragmas(self):
+        """Проверить и залогировать фактические настройки SQLite"""
+        report = await self.pool.verify_pragmas()
+        for name, info in report.items():
+            if info['ok']:
+                logger.info(f"✅ SQLite PRAGMA {name} = {info['writer']}")
+            else:
+                logger.warning(
+                    f"⚠️ SQLite PRAGMA {name}: ожидалось {info['expected']}, "
+                    f"писатель={info['writer']}, читатель={info['reader']}"
+                )
 
     async def init_db(self):
         """Инициализация базы данных со всеми таблицами"""
-        async with aiosqlite.connect(self.db_path) as db:
+        await self._get_pool()
+        async with self._write() as db:
             await db.execute(CREATE_USERS_TABLE)
             await db.execute(CREATE_PAYMENTS_TABLE)
             await db.execute(CREATE_ANALYTICS_TABLE)
@@ -86,10 +207,13 @@ class Database:
             await db.execute(CREATE_REFERRAL_EXCHANGES_TABLE)
             await db.execute(CREATE_REFERRAL_PAYOUTS_TABLE)
             await db.commit()
+
+            # Версионированные миграции схемы (колонки, индексы)
+            await run_migrations(db)
             
             # Инициализация дефолтных настроек
             for key, value in DEFAULT_SETTINGS:
-                await db.execute(SET_SETTING, (key, value))
+                await db.execute(INIT_SETTING, (key, value))
             await db.commit()
             
             # Инициализация дефолтных пакетов
@@ -103,9 +227,12 @@ class Database:
             
             logger.info("✅ Database initialized with all tables")
 
+        await self._log_effective_pragmas()
+        await self.refresh_settings(force=True)
+
     async def init_analytics_table(self):
         """Инициализация таблицы аналитики"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute(CREATE_ANALYTICS_TABLE)
             await db.commit()
             logger.info("✅ Analytics table initialized")
@@ -113,13 +240,19 @@ class Database:
     # ===== СУЩЕСТВУЮЩИЕ МЕТОДЫ (НЕ ИЗМЕНЯТЬ) =====
 
     async def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
-        """Получить пользователя по ID"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        """Получить пользователя по ID (через кэш user_cache)"""
+        cached = self.user_cache.get(user_id)
+        if cached is not None:
+            return dict(cached)
+
+        version = self.user_cache.version
+        async with self._read() as db:
             async with db.execute(GET_USER, (user_id,)) as cursor:
                 row = await cursor.fetchone()
                 if row:
-                    return dict(row)
+                    user = dict(row)
+                    self.user_cache.set(user_id, user, version)
+                    return dict(user)
                 return None
 
     async def create_user(self, user_id: int, username: Optional[str] = None, referrer_code: Optional[str] = None) -> bool:
@@ -136,10 +269,9 @@ class Database:
             return False
 
         # Получаем начальный баланс из настроек
-        welcome_bonus = int(await self.get_setting("welcome_bonus") or "3")
-        initial_balance = welcome_bonus
+        initial_balance = self.settings.welcome_bonus
 
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             # Создаём пользователя
             await db.execute(CREATE_USER, (user_id, username, initial_balance))
             
@@ -148,12 +280,13 @@ class Database:
             await db.execute(UPDATE_REFERRAL_CODE, (ref_code, user_id))
             
             await db.commit()
-            
-            # Если есть реферер, обрабатываем реферальную систему
-            if referrer_code:
-                await self.process_referral(user_id, referrer_code)
-            
-            return True
+        self.user_cache.invalidate(user_id)
+
+        # Если есть реферер, обрабатываем реферальную систему
+        if referrer_code:
+            await self.process_referral(user_id, referrer_code)
+
+        return True
 
     async def process_referral(self, new_user_id: int, referrer_code: str):
         """
@@ -167,10 +300,10 @@ class Database:
         referrer_id = referrer['user_id']
         
         # Получаем бонусы из настроек
-        inviter_bonus = int(await self.get_setting("referral_bonus_inviter") or "2")
-        invited_bonus = int(await self.get_setting("referral_bonus_invited") or "2")
+        inviter_bonus = self.settings.referral_bonus_inviter
+        invited_bonus = self.settings.referral_bonus_invited
         
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             # Устанавливаем referred_by для нового пользователя
             await db.execute(UPDATE_REFERRED_BY, (referrer_id, new_user_id))
             
@@ -182,14 +315,14 @@ class Database:
             await db.execute(UPDATE_BALANCE, (invited_bonus, new_user_id))
             
             await db.commit()
+            self.user_cache.invalidate(referrer_id, new_user_id)
             
             logger.info(f"✅ Referral processed: {referrer_id} invited {new_user_id}")
             return True
 
     async def get_user_by_referral_code(self, referral_code: str) -> Optional[Dict[str, Any]]:
         """Получить пользователя по реферальному коду"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             async with db.execute(GET_USER_BY_REFERRAL_CODE, (referral_code,)) as cursor:
                 row = await cursor.fetchone()
                 if row:
@@ -198,7 +331,7 @@ class Database:
 
     async def get_referrals_count(self, user_id: int) -> int:
         """Получить количество рефералов пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             async with db.execute(GET_REFERRALS_COUNT, (user_id,)) as cursor:
                 row = await cursor.fetchone()
                 return row[0] if row and row[0] else 0
@@ -206,53 +339,75 @@ class Database:
     # === МЕТОДЫ ДЛЯ НАСТРОЕК ===
     
     async def get_setting(self, key: str) -> Optional[str]:
-        """Получить значение настройки"""
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute(GET_SETTING, (key,)) as cursor:
-                row = await cursor.fetchone()
-                return row[0] if row else None
+        """Получить значение настройки (из снимка db.settings, без запроса к БД)"""
+        return self.settings.raw.get(key)
 
     async def set_setting(self, key: str, value: str) -> bool:
         """Установить значение настройки"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute(SET_SETTING, (key, value))
             await db.commit()
-            return True
+        await self.refresh_settings(force=True)
+        return True
 
     async def get_all_settings(self) -> Dict[str, str]:
         """Получить все настройки"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             async with db.execute(GET_ALL_SETTINGS) as cursor:
                 rows = await cursor.fetchall()
                 return {row['key']: row['value'] for row in rows}
 
+    async def refresh_settings(self, force: bool = False) -> bool:
+        """
+        Перечитать settings, если изменился settings_version
+        (изменение в этом или другом процессе). Возвращает True, если снимок обновлён.
+        """
+        async with self._read() as db:
+            async with db.execute(GET_SETTINGS_VERSION) as cursor:
+                row = await cursor.fetchone()
+                version = row[0] if row else 0
+            if not force and version == self.settings.version:
+                return False
+            async with db.execute(GET_ALL_SETTINGS) as cursor:
+                values = {row['key']: row['value'] for row in await cursor.fetchall()}
+
+        self.settings = Settings.from_values(values, version)
+        logger.info(f"⚙️ Настройки загружены (версия {version})")
+        return True
+
     async def get_balance(self, user_id: int) -> int:
-        """Получить баланс пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute(GET_BALANCE, (user_id,)) as cursor:
+        """Получить баланс пользователя (из кэшированной записи users)"""
+        user = await self.get_user(user_id)
+        return user['balance'] if user else 0
+
+    async def get_profile_snapshot(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Данные экрана профиля одним запросом (вместо get_balance + get_user + get_setting ...)"""
+        async with self._read() as db:
+            async with db.execute(GET_PROFILE_SNAPSHOT, (user_id,)) as cursor:
                 row = await cursor.fetchone()
-                return row[0] if row else 0
+                return dict(row) if row else None
 
     async def increase_balance(self, user_id: int, amount: int) -> bool:
         """Увеличить баланс пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute(UPDATE_BALANCE, (amount, user_id))
             await db.commit()
-            return True
+        self.user_cache.invalidate(user_id)
+        return True
 
     async def decrease_balance(self, user_id: int) -> bool:
         """Уменьшить баланс пользователя на 1"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute(DECREASE_BALANCE, (user_id,))
             await db.commit()
-            return True
+        self.user_cache.invalidate(user_id)
+        return True
 
     async def create_payment(self, user_id: int, payment_id: str,
                              amount: int, tokens: int) -> bool:
         """Создать запись о платеже"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self._write() as db:
                 await db.execute(CREATE_PAYMENT,
                                  (user_id, payment_id, amount, tokens, 'pending'))
                 await db.commit()
@@ -262,8 +417,7 @@ class Database:
 
     async def get_pending_payment(self, user_id: int) -> Optional[Dict[str, Any]]:
         """Получить последний пендинг платёж пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             async with db.execute(GET_PENDING_PAYMENT, (user_id,)) as cursor:
                 row = await cursor.fetchone()
                 if row:
@@ -272,133 +426,238 @@ class Database:
 
     async def update_payment_status(self, payment_id: str, status: str) -> bool:
         """Обновить статус платежа"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute(UPDATE_PAYMENT_STATUS, (status, payment_id))
             await db.commit()
             return True
 
+    async def mark_payment_succeeded(self, payment_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Отметить платёж успешным и начислить токены в одной транзакции.
+
+        Срабатывает только для платежа в статусе pending, поэтому повторные
+        уведомления YooKassa и параллельная ручная проверка не начислят
+        токены дважды.
+
+        Returns:
+            Запись платежа, если он был переведён сейчас, иначе None
+        """
+        async with self._write() as db:
+            async with db.execute(MARK_PAYMENT_SUCCEEDED, (payment_id,)) as cursor:
+                row = await cursor.fetchone()
+            if not row:
+                await db.commit()
+                return None
+            payment = dict(row)
+            await db.execute(UPDATE_BALANCE, (payment['tokens'], payment['user_id']))
+            await db.commit()
+        self.user_cache.invalidate(payment['user_id'])
+        return payment
+
     # ===== ANALYTICS METHODS =====
 
     async def log_analytics(self, user_id: int, action: str, room: str = None,
                            style: str = None, status: str = "success", cost: float = 1):
         """Залогировать действие пользователя в аналитику"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute(LOG_ANALYTICS, (user_id, action, room, style, status, cost))
             await db.commit()
 
+    async def log_analytics_batch(self, rows: List[tuple]) -> int:
+        """
+        Записать пачку событий одной транзакцией.
+        rows: (user_id, action, room, style, status, cost, created_at)
+        """
+        async with self._write() as db:
+            await db.executemany(LOG_ANALYTICS_BATCH, rows)
+            await db.commit()
+            return len(rows)
+
     async def get_total_users(self) -> int:
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             async with db.execute(GET_TOTAL_USERS) as cursor:
                 row = await cursor.fetchone()
                 return row[0] if row else 0
 
     async def get_new_users_today(self) -> int:
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             async with db.execute(GET_NEW_USERS_TODAY) as cursor:
                 row = await cursor.fetchone()
                 return row[0] if row else 0
 
     async def get_new_users_week(self) -> int:
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             async with db.execute(GET_NEW_USERS_WEEK) as cursor:
                 row = await cursor.fetchone()
                 return row[0] if row else 0
 
     async def get_new_users_month(self) -> int:
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             async with db.execute(GET_NEW_USERS_MONTH) as cursor:
                 row = await cursor.fetchone()
                 return row[0] if row else 0
 
     async def get_total_generations(self) -> int:
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             async with db.execute(GET_TOTAL_GENERATIONS) as cursor:
                 row = await cursor.fetchone()
                 return row[0] if row else 0
 
     async def get_generations_today(self) -> int:
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             async with db.execute(GET_GENERATIONS_TODAY) as cursor:
                 row = await cursor.fetchone()
                 return row[0] if row else 0
 
     async def get_total_revenue(self) -> float:
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             async with db.execute(GET_TOTAL_REVENUE) as cursor:
                 row = await cursor.fetchone()
                 return row[0] if row else 0
 
     async def get_revenue_today(self) -> float:
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             async with db.execute(GET_REVENUE_TODAY) as cursor:
                 row = await cursor.fetchone()
                 return row[0] if row else 0
 
     async def get_revenue_week(self) -> float:
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             async with db.execute(GET_REVENUE_WEEK) as cursor:
                 row = await cursor.fetchone()
                 return row[0] if row else 0
 
     async def get_revenue_month(self) -> float:
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             async with db.execute(GET_REVENUE_MONTH) as cursor:
                 row = await cursor.fetchone()
                 return row[0] if row else 0
 
     async def get_popular_rooms(self):
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             async with db.execute(GET_POPULAR_ROOMS) as cursor:
                 return await cursor.fetchall()
 
     async def get_popular_styles(self):
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             async with db.execute(GET_POPULAR_STYLES) as cursor:
                 return await cursor.fetchall()
 
+    async def get_dashboard_snapshot(self, top: int = 10, use_cache: bool = True) -> DashboardSnapshot:
+        """
+        Все метрики админ-панели (пользователи, генерации, доход, топ комнат
+        и стилей) одним запросом к дневным агрегатам.
+        """
+        if use_cache:
+            cached = self.dashboard_cache.get(top)
+            if cached is not None:
+                return cached
+
+        async with self._dashboard_lock:
+            # Пока ждали блокировку, сводку мог посчитать другой запрос
+            if use_cache:
+                cached = self.dashboard_cache.get(top)
+                if cached is not None:
+                    return cached
+
+            async with self._read() as db:
+                async with db.execute(GET_DASHBOARD_SNAPSHOT, {'top': top}) as cursor:
+                    snapshot = DashboardSnapshot.from_row(await cursor.fetchone())
+            self.dashboard_cache.set(top, snapshot)
+            return snapshot
+
+    async def rebuild_rollups(self) -> int:
+        """
+        Пересчитать дневные агрегаты статистики из users, analytics и payments.
+        Возвращает число дней с данными.
+        """
+        async with self._write() as db:
+            for statement in REBUILD_ROLLUPS:
+                await db.execute(statement)
+            await db.commit()
+            async with db.execute("SELECT COUNT(*) FROM daily_stats") as cursor:
+                days = (await cursor.fetchone())[0]
+        self.dashboard_cache.clear()
+        return days
+
     async def get_all_users(self):
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             async with db.execute(GET_ALL_USERS) as cursor:
                 return await cursor.fetchall()
 
+    # ===== СПИСОК И ПОИСК ПОЛЬЗОВАТЕЛЕЙ =====
+
+    async def get_users_page(self, limit: int, older_than: Optional[tuple] = None,
+                             newer_than: Optional[tuple] = None) -> List[Dict[str, Any]]:
+        """
+        Страница списка пользователей (новые сверху), keyset-пагинация по (reg_date, user_id).
+
+        Args:
+            limit: число строк
+            older_than: курсор (reg_date, user_id) — строки после него (следующая страница)
+            newer_than: курсор (reg_date, user_id) — строки перед ним (предыдущая страница)
+        """
+        async with self._read() as db:
+            if older_than:
+                query, params = GET_USERS_PAGE_OLDER, (*older_than, limit)
+            elif newer_than:
+                query, params = GET_USERS_PAGE_NEWER, (*newer_than, limit)
+            else:
+                query, params = GET_USERS_PAGE_FIRST, (limit,)
+            async with db.execute(query, params) as cursor:
+                rows = [dict(row) for row in await cursor.fetchall()]
+        if newer_than and not older_than:
+            rows.reverse()
+        return rows
+
+    async def search_users(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Найти пользователей по ID, реферальному коду или началу username"""
+        query = query.strip()
+        prefix = query.lstrip('@')
+        async with self._read() as db:
+            async with db.execute(SEARCH_USERS, {
+                'user_id': int(query) if _is_int64(query) else None,
+                'query': query,
+                'prefix': prefix,
+                # Верхняя граница диапазона «начинается с prefix»
+                'prefix_end': prefix + '\U0010ffff',
+                'limit': limit,
+            }) as cursor:
+                return [dict(row) for row in await cursor.fetchall()]
+
     # ===== НОВЫЕ МЕТОДЫ ДЛЯ PAYMENT PACKAGES =====
 
     async def get_active_packages(self) -> List[Dict[str, Any]]:
         """Получить активные пакеты"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             async with db.execute(GET_ACTIVE_PACKAGES) as cursor:
                 rows = await cursor.fetchall()
                 return [dict(row) for row in rows]
 
     async def get_package_by_id(self, package_id: int) -> Optional[Dict[str, Any]]:
         """Получить пакет по ID"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             async with db.execute(GET_PACKAGE_BY_ID, (package_id,)) as cursor:
                 row = await cursor.fetchone()
                 return dict(row) if row else None
 
     async def create_package(self, tokens: int, price: int, name: str, description: str = "", sort_order: int = 0) -> int:
         """Создать новый пакет"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             cursor = await db.execute(CREATE_PACKAGE, (tokens, price, name, description, sort_order))
             await db.commit()
             return cursor.lastrowid
 
     async def update_package(self, package_id: int, tokens: int, price: int) -> bool:
         """Обновить пакет"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute(UPDATE_PACKAGE, (tokens, price, package_id))
             await db.commit()
             return True
 
     async def toggle_package_status(self, package_id: int) -> bool:
         """Включить/отключить пакет"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute(TOGGLE_PACKAGE_STATUS, (package_id,))
             await db.commit()
             return True
@@ -408,7 +667,7 @@ class Database:
     async def log_referral_earning(self, referrer_id: int, referred_id: int, payment_id: str,
                                    amount: int, commission_percent: int, earnings: int, tokens_given: int) -> bool:
         """Залогировать заработок реферера"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute(LOG_REFERRAL_EARNING, 
                            (referrer_id, referred_id, payment_id, amount, commission_percent, earnings, tokens_given))
             await db.commit()
@@ -416,16 +675,14 @@ class Database:
 
     async def get_user_referral_earnings(self, user_id: int) -> List[Dict[str, Any]]:
         """Получить историю заработков реферера"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             async with db.execute(GET_USER_REFERRAL_EARNINGS, (user_id,)) as cursor:
                 rows = await cursor.fetchall()
                 return [dict(row) for row in rows]
 
     async def get_total_referral_stats(self) -> Dict[str, Any]:
         """Общая статистика реферальной программы"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             async with db.execute(GET_TOTAL_REFERRAL_STATS) as cursor:
                 row = await cursor.fetchone()
                 return dict(row) if row else {'total_referrals': 0, 'total_earnings': 0, 'total_tokens': 0}
@@ -434,23 +691,21 @@ class Database:
 
     async def log_referral_exchange(self, user_id: int, amount: int, tokens: int, exchange_rate: int) -> bool:
         """Залогировать обмен реферального баланса на генерации"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute(LOG_REFERRAL_EXCHANGE, (user_id, amount, tokens, exchange_rate))
             await db.commit()
             return True
 
     async def get_user_exchanges(self, user_id: int) -> List[Dict[str, Any]]:
         """Получить историю обменов пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             async with db.execute(GET_USER_EXCHANGES, (user_id,)) as cursor:
                 rows = await cursor.fetchall()
                 return [dict(row) for row in rows]
 
     async def get_total_exchanges_stats(self) -> Dict[str, Any]:
         """Статистика всех обменов"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             async with db.execute(GET_TOTAL_EXCHANGES_STATS) as cursor:
                 row = await cursor.fetchone()
                 return dict(row) if row else {'count': 0, 'total_amount': 0, 'total_tokens': 0}
@@ -459,38 +714,35 @@ class Database:
 
     async def create_payout_request(self, user_id: int, amount: int, payment_method: str, payment_details: str) -> int:
         """Создать заявку на выплату"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             cursor = await db.execute(CREATE_PAYOUT_REQUEST, (user_id, amount, payment_method, payment_details))
             await db.commit()
             return cursor.lastrowid
 
     async def get_pending_payouts(self) -> List[Dict[str, Any]]:
         """Получить все ожидающие выплаты"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             async with db.execute(GET_PENDING_PAYOUTS) as cursor:
                 rows = await cursor.fetchall()
                 return [dict(row) for row in rows]
 
     async def get_user_payouts(self, user_id: int) -> List[Dict[str, Any]]:
         """Получить историю выплат пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             async with db.execute(GET_USER_PAYOUTS, (user_id,)) as cursor:
                 rows = await cursor.fetchall()
                 return [dict(row) for row in rows]
 
     async def update_payout_status(self, payout_id: int, status: str, admin_id: int, note: str = "") -> bool:
         """Обновить статус выплаты"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute(UPDATE_PAYOUT_STATUS, (status, admin_id, note, payout_id))
             await db.commit()
             return True
 
     async def get_payout_stats(self) -> Dict[str, Any]:
         """Статистика выплат"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             async with db.execute(GET_PAYOUT_STATS) as cursor:
                 row = await cursor.fetchone()
                 return dict(row) if row else {'total_payouts': 0, 'total_paid': 0, 'pending_amount': 0}
@@ -499,17 +751,12 @@ class Database:
 
     async def get_referral_balance(self, user_id: int) -> int:
         """Получить реферальный баланс (руб)"""
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute(
-                "SELECT COALESCE(referral_balance, 0) FROM users WHERE user_id = ?",
-                (user_id,)
-            ) as cursor:
-                row = await cursor.fetchone()
-                return row[0] if row else 0
+        user = await self.get_user(user_id)
+        return (user.get('referral_balance') or 0) if user else 0
 
     async def add_referral_balance(self, user_id: int, amount: int) -> bool:
         """Добавить к реферальному балансу"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute(
                 "UPDATE users SET referral_balance = COALESCE(referral_balance, 0) + ?, "
                 "referral_total_earned = COALESCE(referral_total_earned, 0) + ? "
@@ -517,21 +764,23 @@ class Database:
                 (amount, amount, user_id)
             )
             await db.commit()
-            return True
+        self.user_cache.invalidate(user_id)
+        return True
 
     async def decrease_referral_balance(self, user_id: int, amount: int) -> bool:
         """Уменьшить реферальный баланс"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute(
                 "UPDATE users SET referral_balance = COALESCE(referral_balance, 0) - ? WHERE user_id = ?",
                 (amount, user_id)
             )
             await db.commit()
-            return True
+        self.user_cache.invalidate(user_id)
+        return True
 
     async def get_user_total_earned(self, user_id: int) -> int:
         """Получить общую сумму заработка реферера"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             async with db.execute(
                 "SELECT COALESCE(referral_total_earned, 0) FROM users WHERE user_id = ?",
                 (user_id,)
@@ -543,38 +792,40 @@ class Database:
 
     async def increment_user_generations(self, user_id: int) -> bool:
         """Увеличить счётчик генераций"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute(
                 "UPDATE users SET total_generations = COALESCE(total_generations, 0) + 1 WHERE user_id = ?",
                 (user_id,)
             )
             await db.commit()
-            return True
+        self.user_cache.invalidate(user_id)
+        return True
 
     async def increment_user_payments(self, user_id: int) -> bool:
         """Увеличить счётчик оплат"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute(
                 "UPDATE users SET successful_payments = COALESCE(successful_payments, 0) + 1 WHERE user_id = ?",
                 (user_id,)
             )
             await db.commit()
-            return True
+        self.user_cache.invalidate(user_id)
+        return True
 
     async def add_to_total_spent(self, user_id: int, amount: int) -> bool:
         """Добавить к общей сумме потраченного"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute(
                 "UPDATE users SET total_spent = COALESCE(total_spent, 0) + ? WHERE user_id = ?",
                 (amount, user_id)
             )
             await db.commit()
-            return True
+        self.user_cache.invalidate(user_id)
+        return True
 
     async def get_user_stats(self, user_id: int) -> Dict[str, Any]:
         """Получить полную статистику пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             async with db.execute(
                 "SELECT total_generations, successful_payments, total_spent, "
                 "referral_balance, referral_total_earned, referrals_count "
@@ -597,18 +848,18 @@ class Database:
 
     async def set_payment_details(self, user_id: int, method: str, details: str, sbp_bank: str = None) -> bool:
         """Установить реквизиты для выплат"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute(
                 "UPDATE users SET payment_method = ?, payment_details = ?, sbp_bank = ? WHERE user_id = ?",
                 (method, details, sbp_bank, user_id)
             )
             await db.commit()
-            return True
+        self.user_cache.invalidate(user_id)
+        return True
 
     async def get_payment_details(self, user_id: int) -> Optional[Dict[str, Any]]:
         """Получить реквизиты пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             async with db.execute(
                 "SELECT payment_method, payment_details, sbp_bank FROM users WHERE user_id = ?",
                 (user_id,)
@@ -616,6 +867,364 @@ class Database:
                 row = await cursor.fetchone()
                 return dict(row) if row else None
 
+    # ===== ОЧЕРЕДЬ ГЕНЕРАЦИЙ =====
+
+    async def create_generation_job(self, user_id: int, chat_id: int, photo_id: Optional[str],
+                                    room: str, style: str, progress_message_id: Optional[int] = None,
+                                    charge: bool = True) -> int:
+        """
+        Поставить генерацию в очередь.
+        Списание токена и создание задачи выполняются в одной транзакции.
+        """
+        async with self._write() as db:
+            if charge:
+                await db.execute(DECREASE_BALANCE, (user_id,))
+            cursor = await db.execute(
+                CREATE_GENERATION_JOB,
+                (user_id, chat_id, photo_id, room, style, int(charge), progress_message_id)
+            )
+            await db.commit()
+        if charge:
+            self.user_cache.invalidate(user_id)
+        return cursor.lastrowid
+
+    async def claim_generation_job(self, worker_id: str, lease_seconds: int) -> Optional[Dict[str, Any]]:
+        """
+        Забрать следующую задачу из очереди (queued → running) в аренду.
+        Задачи с истёкшей арендой (процесс-владелец упал) забираются повторно.
+        """
+        async with self._write() as db:
+            async with db.execute(CLAIM_GENERATION_JOB, (worker_id, f"+{lease_seconds} seconds")) as cursor:
+                row = await cursor.fetchone()
+            await db.commit()
+            return dict(row) if row else None
+
+    async def renew_generation_job_lease(self, job_id: int, worker_id: str, lease_seconds: int) -> bool:
+        """Продлить аренду задачи, пока она выполняется"""
+        async with self._write() as db:
+            cursor = await db.execute(RENEW_GENERATION_JOB_LEASE, (f"+{lease_seconds} seconds", job_id, worker_id))
+            await db.commit()
+            return cursor.rowcount > 0
+
+    async def requeue_interrupted_jobs(self, worker_id: str) -> int:
+        """
+        Вернуть в очередь задачи, прерванные остановкой этого процесса.
+        Задачи других процессов не трогаем — они вернутся по истечении аренды.
+        """
+        async with self._write() as db:
+            cursor = await db.execute(REQUEUE_RUNNING_JOBS, (worker_id,))
+            await db.commit()
+            return cursor.rowcount
+
+    async def complete_generation_job(self, job_id: int, result_url: str,
+                                      result_file_id: Optional[str] = None) -> bool:
+        """Отметить задачу успешной (result_file_id — если результат взят из кэша и уже отправлялся)"""
+        async with self._write() as db:
+            await db.execute(COMPLETE_GENERATION_JOB, (result_url, result_file_id, job_id))
+            await db.commit()
+            return True
+
+    async def retry_generation_job(self, job_id: int, error: str) -> bool:
+        """Вернуть задачу в очередь для повторной попытки"""
+        async with self._write() as db:
+            await db.execute(RETRY_GENERATION_JOB, (error, job_id))
+            await db.commit()
+            return True
+
+    async def fail_generation_job(self, job_id: int, error: str) -> str:
+        """
+        Завершить задачу с ошибкой.
+        Если токен был списан — вернуть его (статус refunded), иначе статус failed.
+
+        Returns:
+            Итоговый статус задачи
+        """
+        async with self._write() as db:
+            async with db.execute(GET_GENERATION_JOB, (job_id,)) as cursor:
+                job = await cursor.fetchone()
+            if not job:
+                return 'failed'
+
+            status = 'failed'
+            if job['charged']:
+                await db.execute(UPDATE_BALANCE, (1, job['user_id']))
+                status = 'refunded'
+            await db.execute(FAIL_GENERATION_JOB, (status, error, job_id))
+            await db.commit()
+        if status == 'refunded':
+            self.user_cache.invalidate(job['user_id'])
+        return status
+
+    async def get_generation_job(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """Получить задачу генерации по ID"""
+        async with self._read() as db:
+            async with db.execute(GET_GENERATION_JOB, (job_id,)) as cursor:
+                row = await cursor.fetchone()
+                return dict(row) if row else None
+
+    async def set_generation_job_file_id(self, job_id: int, file_id: str) -> bool:
+        """Сохранить Telegram file_id отправленного результата генерации"""
+        async with self._write() as db:
+            await db.execute(SET_GENERATION_JOB_FILE_ID, (file_id, job_id))
+            await db.commit()
+            return True
+
+    async def get_last_generation(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Последняя успешная генерация пользователя"""
+        async with self._read() as db:
+            async with db.execute(GET_LAST_SUCCEEDED_GENERATION, (user_id,)) as cursor:
+                row = await cursor.fetchone()
+                return dict(row) if row else None
+
+    # ===== FSM STORAGE METHODS =====
+
+    async def get_fsm_state(self, key: str, ttl_seconds: int) -> Optional[str]:
+        """Состояние FSM по ключу хранилища (старше ttl_seconds — считается пустым)"""
+        async with self._read() as db:
+            async with db.execute(GET_FSM_STATE, (key, f"-{ttl_seconds} seconds")) as cursor:
+                row = await cursor.fetchone()
+                return row['state'] if row else None
+
+    async def get_fsm_data(self, key: str, ttl_seconds: int) -> Optional[str]:
+        """Данные FSM (JSON) по ключу хранилища (старше ttl_seconds — считаются пустыми)"""
+        async with self._read() as db:
+            async with db.execute(GET_FSM_DATA, (key, f"-{ttl_seconds} seconds")) as cursor:
+                row = await cursor.fetchone()
+                return row['data'] if row else None
+
+    async def write_fsm_batch(self, states: List[tuple], data: List[tuple]) -> bool:
+        """
+        Записать накопленные изменения FSM одной транзакцией.
+
+        Args:
+            states: [(key, state), ...]
+            data: [(key, json_data), ...]
+        """
+        async with self._write() as db:
+            if states:
+                await db.executemany(SET_FSM_STATE, states)
+            if data:
+                await db.executemany(SET_FSM_DATA, data)
+            keys = {(key,) for key, _ in states} | {(key,) for key, _ in data}
+            await db.executemany(DELETE_EMPTY_FSM_STATE, list(keys))
+            await db.commit()
+            return True
+
+    async def delete_expired_fsm_state(self, ttl_seconds: int) -> int:
+        """Удалить брошенные FSM-сессии"""
+        async with self._write() as db:
+            cursor = await db.execute(DELETE_EXPIRED_FSM_STATE, (f"-{ttl_seconds} seconds",))
+            await db.commit()
+            return cursor.rowcount
+
+    async def get_generation_queue_stats(self) -> Dict[str, int]:
+        """Количество задач генерации по статусам"""
+        async with self._read() as db:
+            async with db.execute(GET_GENERATION_QUEUE_STATS) as cursor:
+                rows = await cursor.fetchall()
+                return {row['status']: row['count'] for row in rows}
+
+    # ===== КЭШ РЕЗУЛЬТАТОВ ГЕНЕРАЦИИ =====
+
+    async def get_cached_generation(self, cache_key: str, ttl_seconds: int,
+                                    url_ttl_seconds: int) -> Optional[Dict[str, Any]]:
+        """
+        Найти результат в кэше. Запись без file_id считается живой, пока
+        не истекла ссылка Replicate (url_ttl_seconds).
+        """
+        async with self._read() as db:
+            async with db.execute(
+                GET_CACHED_GENERATION,
+                (cache_key, f'-{ttl_seconds} seconds', f'-{url_ttl_seconds} seconds')
+            ) as cursor:
+                row = await cursor.fetchone()
+        if not row:
+            return None
+
+        async with self._write() as db:
+            await db.execute(TOUCH_CACHED_GENERATION, (cache_key,))
+            await db.commit()
+        return dict(row)
+
+    async def put_cached_generation(self, cache_key: str, result_url: str,
+                                    ttl_seconds: int, max_entries: int) -> bool:
+        """Сохранить результат в кэш и вытеснить устаревшие/лишние записи"""
+        async with self._write() as db:
+            await db.execute(PUT_CACHED_GENERATION, (cache_key, result_url))
+            await db.execute(EVICT_EXPIRED_GENERATIONS, (f'-{ttl_seconds} seconds',))
+            await db.execute(EVICT_LRU_GENERATIONS, (max_entries,))
+            await db.commit()
+            return True
+
+    async def set_cached_generation_file_id(self, result_url: str, file_id: str) -> bool:
+        """Запомнить Telegram file_id отправленного результата"""
+        async with self._write() as db:
+            await db.execute(SET_CACHED_GENERATION_FILE_ID, (file_id, result_url))
+            await db.commit()
+            return True
+
+    async def get_generation_cache_size(self) -> int:
+        async with self._read() as db:
+            async with db.execute(GET_GENERATION_CACHE_SIZE) as cursor:
+                row = await cursor.fetchone()
+                return row[0] if row else 0
+
+    # ===== РАССЫЛКИ =====
+
+    async def create_broadcast(self, admin_id: int, text: str,
+                               progress_chat_id: int = None, progress_message_id: int = None) -> int:
+        """Создать рассылку (статус running) по всем незаблокированным пользователям"""
+        async with self._write() as db:
+            async with db.execute(COUNT_BROADCAST_RECIPIENTS) as cursor:
+                total = (await cursor.fetchone())[0]
+            cursor = await db.execute(CREATE_BROADCAST, (admin_id, text, total, progress_chat_id, progress_message_id))
+            await db.commit()
+            return cursor.lastrowid
+
+    async def get_broadcast(self, broadcast_id: int) -> Optional[Dict[str, Any]]:
+        async with self._read() as db:
+            async with db.execute(GET_BROADCAST, (broadcast_id,)) as cursor:
+                row = await cursor.fetchone()
+                return dict(row) if row else None
+
+    async def get_last_broadcast(self) -> Optional[Dict[str, Any]]:
+        async with self._read() as db:
+            async with db.execute(GET_LAST_BROADCAST) as cursor:
+                row = await cursor.fetchone()
+                return dict(row) if row else None
+
+    async def claim_broadcast(self, worker_id: str, lease_seconds: int) -> Optional[Dict[str, Any]]:
+        """Забрать незавершённую рассылку в работу (после создания или перезапуска)"""
+        async with self._write() as db:
+            async with db.execute(CLAIM_BROADCAST, (worker_id, f"+{lease_seconds} seconds", worker_id)) as cursor:
+                row = await cursor.fetchone()
+            await db.commit()
+            return dict(row) if row else None
+
+    async def checkpoint_broadcast(self, broadcast_id: int, worker_id: str, last_user_id: int,
+                                   sent: int, failed: int, blocked: List[int], lease_seconds: int) -> bool:
+        """
+        Сохранить прогресс после пачки получателей и пометить заблокировавших бота.
+        Возвращает False, если аренда рассылки потеряна.
+        """
+        async with self._write() as db:
+            if blocked:
+                await db.executemany(MARK_USER_BLOCKED, [(user_id,) for user_id in blocked])
+            cursor = await db.execute(
+                CHECKPOINT_BROADCAST,
+                (last_user_id, sent, failed, len(blocked), f"+{lease_seconds} seconds", broadcast_id, worker_id)
+            )
+            await db.commit()
+        if blocked:
+            self.user_cache.invalidate(*blocked)
+        return cursor.rowcount > 0
+
+    async def finish_broadcast(self, broadcast_id: int, status: str = 'completed') -> bool:
+        """Завершить рассылку; False — она уже не running (например, отменена)"""
+        async with self._write() as db:
+            cursor = await db.execute(FINISH_BROADCAST, (status, broadcast_id))
+            await db.commit()
+            return cursor.rowcount > 0
+
+    async def cancel_broadcast(self, broadcast_id: int) -> bool:
+        async with self._write() as db:
+            cursor = await db.execute(CANCEL_BROADCAST, (broadcast_id,))
+            await db.commit()
+            return cursor.rowcount > 0
+
+    async def get_broadcast_recipients(self, after_user_id: int, limit: int) -> List[int]:
+        """Следующая пачка получателей после after_user_id"""
+        async with self._read() as db:
+            async with db.execute(GET_BROADCAST_RECIPIENTS, (after_user_id, limit)) as cursor:
+                return [row[0] for row in await cursor.fetchall()]
+
+    async def mark_user_unblocked(self, user_id: int) -> bool:
+        """Пользователь снова написал боту — вернуть его в рассылки"""
+        async with self._write() as db:
+            cursor = await db.execute(MARK_USER_UNBLOCKED, (user_id,))
+            await db.commit()
+        if cursor.rowcount > 0:
+            self.user_cache.invalidate(user_id)
+        return cursor.rowcount > 0
+
+    # ===== ОТЛОЖЕННЫЕ ДЕЙСТВИЯ =====
+
+    async def create_scheduled_action(self, kind: str, payload: str, run_at: float) -> int:
+        """Сохранить отложенное действие (payload — JSON, run_at — unix time)"""
+        async with self._write() as db:
+            cursor = await db.execute(CREATE_SCHEDULED_ACTION, (kind, payload, run_at))
+            await db.commit()
+            return cursor.lastrowid
+
+    async def claim_due_actions(self, now: float, limit: int = 100) -> List[Dict[str, Any]]:
+        """Забрать (и удалить) действия, время которых наступило"""
+        async with self._write() as db:
+            async with db.execute(CLAIM_DUE_ACTIONS, (now, limit)) as cursor:
+                rows = await cursor.fetchall()
+            await db.commit()
+            return [dict(row) for row in rows]
+
+    async def get_next_action_time(self) -> Optional[float]:
+        async with self._read() as db:
+            async with db.execute(GET_NEXT_ACTION_TIME) as cursor:
+                row = await cursor.fetchone()
+                return row[0] if row else None
+
+    async def count_scheduled_actions(self) -> int:
+        async with self._read() as db:
+            async with db.execute(COUNT_SCHEDULED_ACTIONS) as cursor:
+                return (await cursor.fetchone())[0]
+
+    # ===== ЭКСПОРТ =====
+
+    async def get_export_columns(self, table: str) -> List[Tuple[str, str]]:
+        """Колонки таблицы для экспорта: [(имя, объявленный тип)]"""
+        if table not in EXPORT_TABLES:
+            raise ValueError(f"Unknown export table: {table}")
+        async with self._read() as db:
+            async with db.execute(f"PRAGMA table_info({table})") as cursor:
+                return [(row[1], (row[2] or '').upper()) for row in await cursor.fetchall()]
+
+    async def iter_export_rows(self, table: str, date_from: Optional[str] = None,
+                               date_to: Optional[str] = None,
+                               chunk_size: int = 5000) -> AsyncIterator[List[tuple]]:
+        """
+        Строки таблицы пачками по chunk_size (keyset по первичному ключу).
+
+        Соединение из пула берётся на одну пачку и сразу возвращается, поэтому
+        экспорт большой таблицы не занимает читателя надолго, а в памяти
+        держится только текущая пачка.
+
+        Args:
+            date_from: 'YYYY-MM-DD' включительно
+            date_to: 'YYYY-MM-DD' включительно
+        """
+        if table not in EXPORT_TABLES:
+            raise ValueError(f"Unknown export table: {table}")
+        key, date_column = EXPORT_TABLES[table]
+
+        conditions, params = [f"{key} > ?"], []
+        if date_from:
+            conditions.append(f"{date_column} >= ?")
+            params.append(date_from)
+        if date_to:
+            conditions.append(f"{date_column} < DATE(?, '+1 day')")
+            params.append(date_to)
+        query = f"SELECT * FROM {table} WHERE {' AND '.join(conditions)} ORDER BY {key} LIMIT ?"
+
+        last_key = -1 << 63
+        while True:
+            async with self._read() as db:
+                async with db.execute(query, (last_key, *params, chunk_size)) as cursor:
+                    rows = [tuple(row) for row in await cursor.fetchall()]
+                    key_index = [column[0] for column in cursor.description].index(key)
+            if not rows:
+                return
+            yield rows
+            if len(rows) < chunk_size:
+                return
+            last_key = rows[-1][key_index]
+
     # ===== Legacy methods for compatibility =====
     
     async def get_last_pending_payment(self, user_id: int):
@@ -632,4 +1241,4 @@ class Database:
 
 
 # Инициализация БД
-db = Database(config.DB_PATH)
+db = Database(config.DB_PATH, pool_size=config.DB_POOL_SIZE, pragmas=config.SQLITE_PRAGMAS)
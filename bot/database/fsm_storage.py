@@ -0,0 +1,222 @@
+# bot/database/fsm_storage.py
+
+import asyncio
+import json
+import logging
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from config import config
+from database.db import Database, db
+
+logger = logging.getLogger(__name__)
+
+_STATE = 'state'
+_DATA = 'data'
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM-хранилище в таблице fsm_state.
+
+    Состояние диалога переживает перезапуск бота и общее для всех
+    процессов (BOT_WORKERS > 1): обновления одного пользователя могут
+    попадать в разные процессы.
+
+    - Записи объединяются: изменения копятся в буфере flush_interval
+      секунд и пишутся одной транзакцией (несколько update_data подряд —
+      одна запись). Чтение сначала смотрит в буфер.
+    - Память ограничена: в процессе хранится только буфер несброшенных
+      ключей (не больше max_pending), всё остальное — в SQLite.
+    - Сессии без изменений дольше ttl_seconds считаются пустыми
+      и периодически удаляются (задача очистки запускается при первом
+      обращении к хранилищу, независимо от объединения записей).
+    """
+
+    def __init__(self, database: Database, key_builder: Optional[KeyBuilder] = None,
+                 ttl_seconds: int = 7 * 24 * 3600, flush_interval: float = 0.05,
+                 max_pending: int = 1000, sweep_interval: int = 3600):
+        self.db = database
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self.ttl_seconds = ttl_seconds
+        # ttl_seconds <= 0 — без срока жизни
+        self._read_ttl = ttl_seconds if ttl_seconds > 0 else 100 * 365 * 24 * 3600
+        self.flush_interval = flush_interval
+        self.max_pending = max(1, max_pending)
+        self.sweep_interval = sweep_interval
+
+        # key -> {'state': ..., 'data': ...}; отсутствующее поле — без изменений
+        self._pending: Dict[str, Dict[str, Optional[str]]] = {}
+        self._flushing: Dict[str, Dict[str, Optional[str]]] = {}
+        self._flush_lock = asyncio.Lock()
+        self._dirty: Optional[asyncio.Event] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._sweep_task: Optional[asyncio.Task] = None
+
+        self.stats = {'writes': 0, 'flushes': 0, 'rows_written': 0, 'expired': 0}
+
+    def _key(self, key: StorageKey) -> str:
+        return self.key_builder.build(key)
+
+    # ===== BaseStorage =====
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await self._put(self._key(key), _STATE, value)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        self._ensure_sweep_task()
+        storage_key = self._key(key)
+        found, value = self._buffered(storage_key, _STATE)
+        if found:
+            return value
+        return await self.db.get_fsm_state(storage_key, self._read_ttl)
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(
+                f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            )
+        payload = json.dumps(data, ensure_ascii=False) if data else None
+        await self._put(self._key(key), _DATA, payload)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        self._ensure_sweep_task()
+        storage_key = self._key(key)
+        found, payload = self._buffered(storage_key, _DATA)
+        if not found:
+            payload = await self.db.get_fsm_data(storage_key, self._read_ttl)
+        return json.loads(payload) if payload else {}
+
+    async def close(self) -> None:
+        """Остановить фоновые задачи и сбросить буфер (вызывается при остановке бота)"""
+        tasks = [task for task in (self._flush_task, self._sweep_task) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._flush_task = self._sweep_task = None
+        await self.flush()
+
+    # ===== БУФЕР ЗАПИСИ =====
+
+    def _buffered(self, storage_key: str, field: str):
+        for buffer in (self._pending, self._flushing):
+            entry = buffer.get(storage_key)
+            if entry is not None and field in entry:
+                return True, entry[field]
+        return False, None
+
+    async def _put(self, storage_key: str, field: str, value: Optional[str]):
+        self.stats['writes'] += 1
+        self._ensure_sweep_task()
+        self._pending.setdefault(storage_key, {})[field] = value
+
+        if self.flush_interval <= 0 or len(self._pending) >= self.max_pending:
+            await self.flush()
+            return
+
+        self._ensure_flush_task()
+        self._dirty.set()
+
+    async def flush(self):
+        """Записать накопленные изменения одной транзакцией"""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            self._flushing, self._pending = self._pending, {}
+
+            states = [(k, v[_STATE]) for k, v in self._flushing.items() if _STATE in v]
+            data = [(k, v[_DATA]) for k, v in self._flushing.items() if _DATA in v]
+            try:
+                await self.db.write_fsm_batch(states, data)
+                self.stats['flushes'] += 1
+                self.stats['rows_written'] += len(states) + len(data)
+            except Exception as e:
+                logger.error(f"❌ Ошибка записи FSM ({len(self._flushing)} ключей): {e}", exc_info=True)
+                # Вернуть в буфер, не перетирая более свежие изменения
+                for storage_key, entry in self._flushing.items():
+                    pending = self._pending.setdefault(storage_key, {})
+                    for field, value in entry.items():
+                        pending.setdefault(field, value)
+            finally:
+                self._flushing = {}
+
+    # ===== ФОНОВЫЕ ЗАДАЧИ =====
+
+    def _ensure_flush_task(self):
+        if self._flush_task is not None:
+            return
+        self._dirty = asyncio.Event()
+        self._flush_task = asyncio.create_task(self._flush_loop(), name="fsm-flush")
+
+    def _ensure_sweep_task(self):
+        if self._sweep_task is not None or self.ttl_seconds <= 0 or self.sweep_interval <= 0:
+            return
+        self._sweep_task = asyncio.create_task(self._sweep_loop(), name="fsm-sweep")
+
+    async def _flush_loop(self):
+        while True:
+            await self._dirty.wait()
+            await asyncio.sleep(self.flush_interval)
+            self._dirty.clear()
+            await self.flush()
+
+    async def _sweep_loop(self):
+        while True:
+            try:
+                removed = await self.db.delete_expired_fsm_state(self.ttl_seconds)
+                if removed:
+                    self.stats['expired'] += removed
+                    logger.info(f"🧹 FSM: удалено брошенных сессий: {removed}")
+            except Exception as e:
+                logger.warning(f"⚠️ Ошибка очистки FSM: {e}")
+            await asyncio.sleep(self.sweep_interval)
+
+
+def _create_redis_storage() -> Optional[BaseStorage]:
+    """RedisStorage aiogram (нужен пакет redis); TTL ставит сам Redis"""
+    try:
+        from aiogram.fsm.storage.redis import RedisStorage
+    except ImportError:
+        logger.error("FSM_STORAGE=redis requires the 'redis' package, falling back to sqlite")
+        return None
+
+    return RedisStorage.from_url(
+        config.REDIS_URL,
+        key_builder=DefaultKeyBuilder(with_bot_id=True, with_destiny=True),
+        state_ttl=config.FSM_TTL or None,
+        data_ttl=config.FSM_TTL or None,
+    )
+
+
+def create_fsm_storage() -> BaseStorage:
+    """
+    Хранилище FSM по настройке FSM_STORAGE (sqlite / redis / memory).
+    Несколько процессов бота возможны только с общим хранилищем.
+    """
+    kind = config.FSM_STORAGE
+    if kind == "memory" and config.BOT_PROCESSES > 1:
+        logger.warning("FSM_STORAGE=memory is not shared between processes, using sqlite")
+        kind = "sqlite"
+
+    if kind == "redis":
+        storage = _create_redis_storage()
+        if storage is not None:
+            return storage
+        kind = "sqlite"
+
+    if kind == "sqlite":
+        return SQLiteStorage(
+            db,
+            ttl_seconds=config.FSM_TTL,
+            flush_interval=config.FSM_FLUSH_INTERVAL_MS / 1000,
+            max_pending=config.FSM_MAX_PENDING,
+            sweep_interval=config.FSM_SWEEP_INTERVAL,
+        )
+    if kind != "memory":
+        logger.warning(f"Unknown FSM_STORAGE={kind!r}, using memory")
+    return MemoryStorage()
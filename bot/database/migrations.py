@@ -0,0 +1,217 @@
+# bot/database/migrations.py
+
+import logging
+from typing import Awaitable, Callable, List, Tuple
+
+import aiosqlite
+
+from database.models import (
+    USERS_STATS_COLUMNS,
+    CREATE_INDEXES,
+    CREATE_GENERATION_JOBS_TABLE,
+    CREATE_GENERATION_JOBS_INDEXES,
+    CREATE_GENERATION_CACHE_TABLE,
+    CREATE_GENERATION_CACHE_INDEXES,
+    GENERATION_JOBS_FILE_ID_COLUMNS,
+    GENERATION_JOBS_LEASE_COLUMNS,
+    CREATE_GENERATION_JOBS_LEASE_INDEX,
+    CREATE_FSM_STATE_TABLE,
+    CREATE_FSM_STATE_INDEX,
+    CREATE_BROADCASTS_TABLE,
+    USERS_BLOCKED_COLUMNS,
+    CREATE_SCHEDULED_ACTIONS_TABLE,
+    CREATE_SCHEDULED_ACTIONS_INDEX,
+    CREATE_SETTINGS_VERSION_TABLE,
+    INIT_SETTINGS_VERSION,
+    CREATE_SETTINGS_VERSION_TRIGGERS,
+    CREATE_DAILY_STATS_TABLE,
+    CREATE_DAILY_ROOM_STATS_TABLE,
+    CREATE_DAILY_STYLE_STATS_TABLE,
+    CREATE_ROLLUP_TRIGGERS,
+    CREATE_ROLLUP_USERS_INSERT_TRIGGER,
+    CREATE_ROLLUP_PAYMENT_REVERSAL_TRIGGERS,
+    REBUILD_ROLLUPS,
+    CREATE_USERS_BROWSER_INDEXES,
+    CREATE_USERS_PAGE_INDEX,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# ===== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ =====
+
+async def _get_columns(db: aiosqlite.Connection, table: str) -> set:
+    """Получить множество имён колонок таблицы"""
+    async with db.execute(f"PRAGMA table_info({table})") as cursor:
+        rows = await cursor.fetchall()
+        return {row[1] for row in rows}
+
+
+async def _add_missing_columns(db: aiosqlite.Connection, table: str, columns: List[Tuple[str, str]]):
+    """
+    Добавить колонки, которых ещё нет в таблице.
+    На старых базах часть колонок могла быть добавлена вручную.
+    """
+    existing = await _get_columns(db, table)
+    for name, definition in columns:
+        if name not in existing:
+            await db.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+            logger.info(f"🔧 Migration: {table}.{name} добавлена")
+
+
+async def _execute_all(db: aiosqlite.Connection, statements: List[str]):
+    for statement in statements:
+        await db.execute(statement)
+
+
+# ===== МИГРАЦИИ =====
+
+async def _m001_users_stats(db: aiosqlite.Connection):
+    await _add_missing_columns(db, "users", USERS_STATS_COLUMNS)
+
+
+async def _m002_indexes(db: aiosqlite.Connection):
+    await _execute_all(db, CREATE_INDEXES)
+
+
+async def _m003_generation_jobs(db: aiosqlite.Connection):
+    await _execute_all(db, [CREATE_GENERATION_JOBS_TABLE, *CREATE_GENERATION_JOBS_INDEXES])
+
+
+async def _m004_generation_cache(db: aiosqlite.Connection):
+    await _execute_all(db, [CREATE_GENERATION_CACHE_TABLE, *CREATE_GENERATION_CACHE_INDEXES])
+
+
+async def _m005_generation_jobs_file_id(db: aiosqlite.Connection):
+    await _add_missing_columns(db, "generation_jobs", GENERATION_JOBS_FILE_ID_COLUMNS)
+
+
+async def _m006_generation_jobs_lease(db: aiosqlite.Connection):
+    await _add_missing_columns(db, "generation_jobs", GENERATION_JOBS_LEASE_COLUMNS)
+    await db.execute(CREATE_GENERATION_JOBS_LEASE_INDEX)
+
+
+async def _m007_fsm_state(db: aiosqlite.Connection):
+    await db.execute(CREATE_FSM_STATE_TABLE)
+
+
+async def _m008_fsm_state_expiry(db: aiosqlite.Connection):
+    await db.execute(CREATE_FSM_STATE_INDEX)
+
+
+async def _m009_broadcasts(db: aiosqlite.Connection):
+    await _add_missing_columns(db, "users", USERS_BLOCKED_COLUMNS)
+    await db.execute(CREATE_BROADCASTS_TABLE)
+
+
+async def _m010_scheduled_actions(db: aiosqlite.Connection):
+    await _execute_all(db, [CREATE_SCHEDULED_ACTIONS_TABLE, CREATE_SCHEDULED_ACTIONS_INDEX])
+
+
+async def _m011_settings_version(db: aiosqlite.Connection):
+    await _execute_all(db, [CREATE_SETTINGS_VERSION_TABLE, INIT_SETTINGS_VERSION, *CREATE_SETTINGS_VERSION_TRIGGERS])
+
+
+async def _m012_daily_rollups(db: aiosqlite.Connection):
+    await _execute_all(db, [CREATE_DAILY_STATS_TABLE, CREATE_DAILY_ROOM_STATS_TABLE, CREATE_DAILY_STYLE_STATS_TABLE])
+    await _execute_all(db, CREATE_ROLLUP_TRIGGERS)
+    # Заполнить агрегаты из накопленной истории
+    await _execute_all(db, REBUILD_ROLLUPS)
+
+
+async def _m013_users_browser_indexes(db: aiosqlite.Connection):
+    await _execute_all(db, CREATE_USERS_BROWSER_INDEXES)
+    # Индекс (reg_date, user_id) покрывает прежний индекс по reg_date
+    await db.execute("DROP INDEX IF EXISTS idx_users_reg_date")
+
+
+async def _m014_rollup_users_null_reg_date(db: aiosqlite.Connection):
+    # Триггер считал пользователей без reg_date днём вставки, а пересборка
+    # их пропускала; теперь оба пропускают
+    await db.execute("DROP TRIGGER IF EXISTS rollup_users_insert")
+    await db.execute(CREATE_ROLLUP_USERS_INSERT_TRIGGER)
+    await _execute_all(db, REBUILD_ROLLUPS)
+
+
+async def _m015_users_page_index(db: aiosqlite.Connection):
+    await db.execute(CREATE_USERS_PAGE_INDEX)
+
+
+async def _m016_rollup_payment_reversals(db: aiosqlite.Connection):
+    await _execute_all(db, CREATE_ROLLUP_PAYMENT_REVERSAL_TRIGGERS)
+    # Пересчитать доход без уже возвращённых платежей
+    await _execute_all(db, REBUILD_ROLLUPS)
+
+
+# (версия, описание, функция). Версии только растут, применённые миграции не менять.
+MIGRATIONS: List[Tuple[int, str, Callable[[aiosqlite.Connection], Awaitable[None]]]] = [
+    (1, "users: колонки статистики и реферального баланса", _m001_users_stats),
+    (2, "индексы для analytics, payments, users и реферальных таблиц", _m002_indexes),
+    (3, "generation_jobs: очередь генераций", _m003_generation_jobs),
+    (4, "generation_cache: кэш результатов генерации", _m004_generation_cache),
+    (5, "generation_jobs: Telegram file_id результата", _m005_generation_jobs_file_id),
+    (6, "generation_jobs: владелец и аренда задачи", _m006_generation_jobs_lease),
+    (7, "fsm_state: общее хранилище FSM", _m007_fsm_state),
+    (8, "fsm_state: индекс для удаления брошенных сессий", _m008_fsm_state_expiry),
+    (9, "broadcasts: рассылки; users.is_blocked", _m009_broadcasts),
+    (10, "scheduled_actions: отложенные действия", _m010_scheduled_actions),
+    (11, "settings_version: счётчик изменений настроек", _m011_settings_version),
+    (12, "daily_stats, daily_room_stats, daily_style_stats: дневные агрегаты", _m012_daily_rollups),
+    (13, "users: индексы для списка и поиска пользователей в админ-панели", _m013_users_browser_indexes),
+    (14, "daily_stats: одно правило для пользователей без reg_date", _m014_rollup_users_null_reg_date),
+    (15, "users: индекс списка пользователей с учётом пустой reg_date", _m015_users_page_index),
+    (16, "daily_stats: вычитать платежи, вышедшие из succeeded", _m016_rollup_payment_reversals),
+]
+
+
+async def get_schema_version(db: aiosqlite.Connection) -> int:
+    """Текущая версия схемы (PRAGMA user_version)"""
+    async with db.execute("PRAGMA user_version") as cursor:
+        row = await cursor.fetchone()
+        return row[0] if row else 0
+
+
+async def run_migrations(db: aiosqlite.Connection) -> int:
+    """
+    Применить все невыполненные миграции.
+
+    Каждая миграция выполняется в своей транзакции вместе с обновлением
+    PRAGMA user_version, поэтому прерванная миграция не оставит схему
+    в промежуточном состоянии.
+
+    Транзакция открывается как BEGIN IMMEDIATE, и версия перечитывается
+    уже под блокировкой записи: несколько воркеров, стартующих одновременно,
+    выполняют миграции по очереди (ожидая busy_timeout), а не падают с
+    "database is locked" при повышении блокировки чтения до записи в WAL.
+    Миграцию, которую уже применил другой процесс, пропускаем.
+
+    Returns:
+        Версия схемы после применения миграций
+    """
+    while True:
+        pending = None
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            version = await get_schema_version(db)
+            pending = next(((target, description, migrate) for target, description, migrate in MIGRATIONS
+                            if target > version), None)
+            if pending is None:
+                await db.commit()
+                break
+
+            target, description, migrate = pending
+            logger.info(f"🔧 Migration {target}: {description}")
+            await migrate(db)
+            await db.execute(f"PRAGMA user_version = {target}")
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            logger.error(f"❌ Migration {pending[0] if pending else '?'} failed", exc_info=True)
+            raise
+
+    # Обновить статистику планировщика запросов для новых индексов
+    async with db.execute("PRAGMA optimize") as cursor:
+        await cursor.fetchall()
+
+    logger.info(f"✅ Database schema version: {version}")
+    return version
@@ -15,18 +15,18 @@ CREATE TABLE IF NOT EXISTS users (
 """
 
 # === НОВЫЕ ПОЛЯ ДЛЯ СТАТИСТИКИ И РЕФЕРАЛЮНОЙ ПРОГРАММЫ ===
-# Выполнять при миграции базы:
-ALTER_USERS_ADD_STATS = """
-ALTER TABLE users ADD COLUMN total_generations INTEGER DEFAULT 0;
-ALTER TABLE users ADD COLUMN successful_payments INTEGER DEFAULT 0;
-ALTER TABLE users ADD COLUMN total_spent INTEGER DEFAULT 0;
-ALTER TABLE users ADD COLUMN referral_balance INTEGER DEFAULT 0;
-ALTER TABLE users ADD COLUMN referral_total_earned INTEGER DEFAULT 0;
-ALTER TABLE users ADD COLUMN referral_total_paid INTEGER DEFAULT 0;
-ALTER TABLE users ADD COLUMN payment_method TEXT;
-ALTER TABLE users ADD COLUMN payment_details TEXT;
-ALTER TABLE users ADD COLUMN sbp_bank TEXT;
-"""
+# Добавляются миграцией №1 (database/migrations.py), если их ещё нет
+USERS_STATS_COLUMNS = [
+    ("total_generations", "INTEGER DEFAULT 0"),
+    ("successful_payments", "INTEGER DEFAULT 0"),
+    ("total_spent", "INTEGER DEFAULT 0"),
+    ("referral_balance", "INTEGER DEFAULT 0"),
+    ("referral_total_earned", "INTEGER DEFAULT 0"),
+    ("referral_total_paid", "INTEGER DEFAULT 0"),
+    ("payment_method", "TEXT"),
+    ("payment_details", "TEXT"),
+    ("sbp_bank", "TEXT"),
+]
 
 GET_USER = "SELECT * FROM users WHERE user_id = ?"
 CREATE_USER = "INSERT INTO users (user_id, username, balance) VALUES (?, ?, ?)"
@@ -34,6 +34,18 @@ UPDATE_BALANCE = "UPDATE users SET balance = balance + ? WHERE user_id = ?"
 DECREASE_BALANCE = "UPDATE users SET balance = balance - 1 WHERE user_id = ?"
 GET_BALANCE = "SELECT balance FROM users WHERE user_id = ?"
 
+# Всё для экрана профиля одним запросом (баланс и реферальные данные)
+GET_PROFILE_SNAPSHOT = """
+SELECT balance,
+       referral_code,
+       COALESCE(referrals_count, 0) AS referrals_count,
+       COALESCE(referral_balance, 0) AS referral_balance,
+       COALESCE(referral_total_earned, 0) AS referral_total_earned,
+       COALESCE(referral_total_paid, 0) AS referral_total_paid
+FROM users
+WHERE user_id = ?
+"""
+
 # === РЕФЕРАЛЬНЫЕ ЗАПРОСЫ ===
 GET_USER_BY_REFERRAL_CODE = "SELECT * FROM users WHERE referral_code = ?"
 UPDATE_REFERRAL_CODE = "UPDATE users SET referral_code = ? WHERE user_id = ?"
@@ -61,6 +73,12 @@ VALUES (?, ?, ?, ?, ?)
 """
 GET_PENDING_PAYMENT = "SELECT * FROM payments WHERE user_id = ? AND status = 'pending' ORDER BY created_at DESC LIMIT 1"
 UPDATE_PAYMENT_STATUS = "UPDATE payments SET status = ? WHERE yookassa_payment_id = ?"
+# Переводит только pending-платёж: повторный webhook или проверка вручную ничего не вернут
+MARK_PAYMENT_SUCCEEDED = """
+UPDATE payments SET status = 'succeeded'
+WHERE yookassa_payment_id = ? AND status = 'pending'
+RETURNING *
+"""
 
 # ===== ANALYTICS TABLE =====
 CREATE_ANALYTICS_TABLE = """
@@ -82,29 +100,124 @@ INSERT INTO analytics (user_id, action, room, style, status, cost)
 VALUES (?, ?, ?, ?, ?, ?)
 """
 
-GET_ANALYTICS_TODAY = "SELECT * FROM analytics WHERE DATE(created_at) = DATE('now') ORDER BY created_at DESC"
+# Пакетная вставка из буфера аналитики: created_at — время события, а не записи
+LOG_ANALYTICS_BATCH = """
+INSERT INTO analytics (user_id, action, room, style, status, cost, created_at)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Даты хранятся как 'YYYY-MM-DD HH:MM:SS' (CURRENT_TIMESTAMP), поэтому условия
+# вида created_at >= DATE('now') используют индексы, а DATE(created_at) = ... — нет.
+GET_ANALYTICS_TODAY = "SELECT * FROM analytics WHERE created_at >= DATE('now') ORDER BY created_at DESC"
 GET_ANALYTICS_WEEK = "SELECT * FROM analytics WHERE created_at >= datetime('now', '-7 days') ORDER BY created_at DESC"
 GET_ANALYTICS_MONTH = "SELECT * FROM analytics WHERE created_at >= datetime('now', '-30 days') ORDER BY created_at DESC"
 GET_ALL_ANALYTICS = "SELECT * FROM analytics ORDER BY created_at DESC LIMIT 1000"
 
-GET_TOTAL_USERS = "SELECT COUNT(*) FROM users"
-GET_NEW_USERS_TODAY = "SELECT COUNT(*) FROM users WHERE DATE(reg_date) = DATE('now')"
-GET_NEW_USERS_WEEK = "SELECT COUNT(*) FROM users WHERE reg_date >= datetime('now', '-7 days')"
-GET_NEW_USERS_MONTH = "SELECT COUNT(*) FROM users WHERE reg_date >= datetime('now', '-30 days')"
+# Счётчики для админ-статистики читаются из дневных агрегатов (daily_stats и др.).
+# Неделя и месяц — последние 7 и 30 календарных дней, включая сегодня
+GET_TOTAL_USERS = "SELECT COALESCE(SUM(new_users), 0) FROM daily_stats"
+GET_NEW_USERS_TODAY = "SELECT COALESCE(SUM(new_users), 0) FROM daily_stats WHERE day >= DATE('now')"
+GET_NEW_USERS_WEEK = "SELECT COALESCE(SUM(new_users), 0) FROM daily_stats WHERE day >= DATE('now', '-6 days')"
+GET_NEW_USERS_MONTH = "SELECT COALESCE(SUM(new_users), 0) FROM daily_stats WHERE day >= DATE('now', '-29 days')"
 
-GET_TOTAL_GENERATIONS = "SELECT COUNT(*) FROM analytics WHERE action = 'generation'"
-GET_GENERATIONS_TODAY = "SELECT COUNT(*) FROM analytics WHERE action = 'generation' AND DATE(created_at) = DATE('now')"
+GET_TOTAL_GENERATIONS = "SELECT COALESCE(SUM(generations), 0) FROM daily_stats"
+GET_GENERATIONS_TODAY = "SELECT COALESCE(SUM(generations), 0) FROM daily_stats WHERE day >= DATE('now')"
 
-GET_TOTAL_REVENUE = "SELECT COALESCE(SUM(amount), 0) FROM payments WHERE status = 'succeeded'"
-GET_REVENUE_TODAY = "SELECT COALESCE(SUM(amount), 0) FROM payments WHERE status = 'succeeded' AND DATE(created_at) = DATE('now')"
-GET_REVENUE_WEEK = "SELECT COALESCE(SUM(amount), 0) FROM payments WHERE status = 'succeeded' AND created_at >= datetime('now', '-7 days')"
-GET_REVENUE_MONTH = "SELECT COALESCE(SUM(amount), 0) FROM payments WHERE status = 'succeeded' AND created_at >= datetime('now', '-30 days')"
+GET_TOTAL_REVENUE = "SELECT COALESCE(SUM(revenue), 0) FROM daily_stats"
+GET_REVENUE_TODAY = "SELECT COALESCE(SUM(revenue), 0) FROM daily_stats WHERE day >= DATE('now')"
+GET_REVENUE_WEEK = "SELECT COALESCE(SUM(revenue), 0) FROM daily_stats WHERE day >= DATE('now', '-6 days')"
+GET_REVENUE_MONTH = "SELECT COALESCE(SUM(revenue), 0) FROM daily_stats WHERE day >= DATE('now', '-29 days')"
 
-GET_POPULAR_ROOMS = "SELECT room, COUNT(*) as count FROM analytics WHERE action = 'generation' GROUP BY room ORDER BY count DESC"
-GET_POPULAR_STYLES = "SELECT style, COUNT(*) as count FROM analytics WHERE action = 'generation' GROUP BY style ORDER BY count DESC"
+GET_POPULAR_ROOMS = "SELECT room, SUM(generations) AS count FROM daily_room_stats GROUP BY room ORDER BY count DESC"
+GET_POPULAR_STYLES = "SELECT style, SUM(generations) AS count FROM daily_style_stats GROUP BY style ORDER BY count DESC"
+
+# Все метрики админ-панели одним запросом (Database.get_dashboard_snapshot).
+# Топ комнат и стилей возвращается JSON-массивом [[название, генераций], ...]
+GET_DASHBOARD_SNAPSHOT = """
+WITH totals AS (
+    SELECT
+        COALESCE(SUM(new_users), 0) AS total_users,
+        COALESCE(SUM(CASE WHEN day >= DATE('now') THEN new_users END), 0) AS new_users_today,
+        COALESCE(SUM(CASE WHEN day >= DATE('now', '-6 days') THEN new_users END), 0) AS new_users_week,
+        COALESCE(SUM(CASE WHEN day >= DATE('now', '-29 days') THEN new_users END), 0) AS new_users_month,
+        COALESCE(SUM(generations), 0) AS total_generations,
+        COALESCE(SUM(CASE WHEN day >= DATE('now') THEN generations END), 0) AS generations_today,
+        COALESCE(SUM(payments), 0) AS total_payments,
+        COALESCE(SUM(revenue), 0) AS revenue_total,
+        COALESCE(SUM(CASE WHEN day >= DATE('now') THEN revenue END), 0) AS revenue_today,
+        COALESCE(SUM(CASE WHEN day >= DATE('now', '-6 days') THEN revenue END), 0) AS revenue_week,
+        COALESCE(SUM(CASE WHEN day >= DATE('now', '-29 days') THEN revenue END), 0) AS revenue_month
+    FROM daily_stats
+),
+rooms AS (
+    SELECT room AS name, SUM(generations) AS count
+    FROM daily_room_stats GROUP BY room ORDER BY count DESC LIMIT :top
+),
+styles AS (
+    SELECT style AS name, SUM(generations) AS count
+    FROM daily_style_stats GROUP BY style ORDER BY count DESC LIMIT :top
+)
+SELECT totals.*,
+       (SELECT json_group_array(json_array(name, count)) FROM rooms) AS popular_rooms,
+       (SELECT json_group_array(json_array(name, count)) FROM styles) AS popular_styles
+FROM totals
+"""
 
 GET_ALL_USERS = "SELECT user_id, username, balance, reg_date FROM users ORDER BY reg_date DESC"
 
+# ===== СПИСОК ПОЛЬЗОВАТЕЛЕЙ В АДМИН-ПАНЕЛИ (keyset-пагинация, миграция №13) =====
+# Порядок — новые сверху: (reg_date, user_id) по убыванию. Страница ищется
+# по индексу idx_users_reg_date_user от курсора, без OFFSET и без загрузки
+# всей таблицы
+# Ключ сортировки COALESCE(reg_date, ''): пользователи без даты регистрации
+# идут последними и тоже попадают в страницы (сравнение с NULL их бы теряло)
+GET_USERS_PAGE_FIRST = """
+SELECT user_id, username, balance, reg_date FROM users
+ORDER BY COALESCE(reg_date, '') DESC, user_id DESC
+LIMIT ?
+"""
+# Следующая страница (более старые): курсор — последняя строка текущей
+GET_USERS_PAGE_OLDER = """
+SELECT user_id, username, balance, reg_date FROM users
+WHERE (COALESCE(reg_date, ''), user_id) < (?, ?)
+ORDER BY COALESCE(reg_date, '') DESC, user_id DESC
+LIMIT ?
+"""
+# Предыдущая страница (более новые): курсор — первая строка текущей;
+# строки приходят в обратном порядке
+GET_USERS_PAGE_NEWER = """
+SELECT user_id, username, balance, reg_date FROM users
+WHERE (COALESCE(reg_date, ''), user_id) > (?, ?)
+ORDER BY COALESCE(reg_date, '') ASC, user_id ASC
+LIMIT ?
+"""
+
+# Поиск по ID, реферальному коду (точно) и началу username (без учёта регистра).
+# Каждая ветка идёт по своему индексу
+SEARCH_USERS = """
+SELECT user_id, username, balance, reg_date FROM users WHERE user_id = :user_id
+UNION
+SELECT user_id, username, balance, reg_date FROM users WHERE referral_code = :query
+UNION
+SELECT user_id, username, balance, reg_date FROM (
+    SELECT user_id, username, balance, reg_date FROM users
+    WHERE username >= :prefix COLLATE NOCASE AND username < :prefix_end COLLATE NOCASE
+    ORDER BY username COLLATE NOCASE
+    LIMIT :limit
+)
+ORDER BY reg_date DESC, user_id DESC
+LIMIT :limit
+"""
+
+CREATE_USERS_BROWSER_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_users_reg_date_user ON users (reg_date, user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_users_username_nocase ON users (username COLLATE NOCASE)",
+    # referral_code уже проиндексирован ограничением UNIQUE
+]
+
+# Индекс по выражению ключа сортировки списка пользователей (миграция №15)
+CREATE_USERS_PAGE_INDEX = "CREATE INDEX IF NOT EXISTS idx_users_page ON users (COALESCE(reg_date, ''), user_id)"
+
 # ===== SETTINGS TABLE =====
 CREATE_SETTINGS_TABLE = """
 CREATE TABLE IF NOT EXISTS settings (
@@ -126,6 +239,8 @@ DEFAULT_SETTINGS = [
 
 GET_SETTING = "SELECT value FROM settings WHERE key = ?"
 SET_SETTING = "INSERT OR REPLACE INTO settings (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)"
+# Значение по умолчанию при старте: не перетирает настройки, изменённые админом
+INIT_SETTING = "INSERT OR IGNORE INTO settings (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)"
 GET_ALL_SETTINGS = "SELECT * FROM settings"
 
 # ===== PAYMENT PACKAGES TABLE (НОВОЕ) =====
@@ -253,3 +368,449 @@ SELECT
     COALESCE(SUM(CASE WHEN status = 'pending' THEN amount ELSE 0 END), 0) as pending_amount
 FROM referral_payouts
 """
+
+# ===== GENERATION JOBS TABLE (очередь генераций, миграция №3) =====
+# Статусы: queued → running → succeeded | failed | refunded
+CREATE_GENERATION_JOBS_TABLE = """
+CREATE TABLE IF NOT EXISTS generation_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    chat_id INTEGER NOT NULL,
+    photo_id TEXT,
+    room TEXT,
+    style TEXT,
+    charged INTEGER DEFAULT 0,
+    status TEXT DEFAULT 'queued',
+    attempts INTEGER DEFAULT 0,
+    progress_message_id INTEGER,
+    result_url TEXT,
+    error TEXT,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    started_at DATETIME,
+    finished_at DATETIME,
+    FOREIGN KEY (user_id) REFERENCES users (user_id)
+)
+"""
+
+# Telegram file_id отправленного результата (миграция №5)
+GENERATION_JOBS_FILE_ID_COLUMNS = [
+    ("result_file_id", "TEXT"),
+]
+
+CREATE_GENERATION_JOBS_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_generation_jobs_status ON generation_jobs (status, id)",
+    "CREATE INDEX IF NOT EXISTS idx_generation_jobs_user ON generation_jobs (user_id, id)",
+]
+
+CREATE_GENERATION_JOB = """
+INSERT INTO generation_jobs (user_id, chat_id, photo_id, room, style, charged, progress_message_id)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Владелец задачи и срок аренды (миграция №6): несколько процессов бота
+# делят одну очередь, задачу упавшего процесса подбирают по истечении аренды
+GENERATION_JOBS_LEASE_COLUMNS = [
+    ("worker_id", "TEXT"),
+    ("lease_until", "DATETIME"),
+]
+CREATE_GENERATION_JOBS_LEASE_INDEX = (
+    "CREATE INDEX IF NOT EXISTS idx_generation_jobs_lease ON generation_jobs (status, lease_until)"
+)
+
+# Атомарно забрать самую старую задачу из очереди (или с истёкшей арендой)
+CLAIM_GENERATION_JOB = """
+UPDATE generation_jobs
+SET status = 'running', attempts = attempts + 1, started_at = CURRENT_TIMESTAMP,
+    worker_id = ?, lease_until = DATETIME('now', ?)
+WHERE id = (
+    SELECT id FROM generation_jobs
+    WHERE status = 'queued' OR (status = 'running' AND lease_until < CURRENT_TIMESTAMP)
+    ORDER BY id LIMIT 1
+)
+RETURNING *
+"""
+RENEW_GENERATION_JOB_LEASE = """
+UPDATE generation_jobs SET lease_until = DATETIME('now', ?)
+WHERE id = ? AND worker_id = ? AND status = 'running'
+"""
+
+# Задачи, прерванные перезапуском этого же процесса (и старые задачи без владельца)
+REQUEUE_RUNNING_JOBS = """
+UPDATE generation_jobs SET status = 'queued', worker_id = NULL, lease_until = NULL
+WHERE status = 'running' AND (worker_id = ? OR worker_id IS NULL)
+"""
+COMPLETE_GENERATION_JOB = """
+UPDATE generation_jobs
+SET status = 'succeeded', result_url = ?, result_file_id = ?, error = NULL, finished_at = CURRENT_TIMESTAMP
+WHERE id = ?
+"""
+RETRY_GENERATION_JOB = "UPDATE generation_jobs SET status = 'queued', error = ? WHERE id = ?"
+FAIL_GENERATION_JOB = """
+UPDATE generation_jobs
+SET status = ?, error = ?, finished_at = CURRENT_TIMESTAMP
+WHERE id = ?
+"""
+GET_GENERATION_JOB = "SELECT * FROM generation_jobs WHERE id = ?"
+SET_GENERATION_JOB_FILE_ID = "UPDATE generation_jobs SET result_file_id = ? WHERE id = ?"
+GET_LAST_SUCCEEDED_GENERATION = """
+SELECT * FROM generation_jobs
+WHERE user_id = ? AND status = 'succeeded'
+ORDER BY id DESC LIMIT 1
+"""
+GET_GENERATION_QUEUE_STATS = "SELECT status, COUNT(*) as count FROM generation_jobs GROUP BY status"
+
+# ===== GENERATION CACHE TABLE (кэш результатов, миграция №4) =====
+# Ключ — хэш (содержимое фото, комната, стиль, версия промпта, модель)
+CREATE_GENERATION_CACHE_TABLE = """
+CREATE TABLE IF NOT EXISTS generation_cache (
+    cache_key TEXT PRIMARY KEY,
+    result_url TEXT NOT NULL,
+    file_id TEXT,
+    hits INTEGER DEFAULT 0,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    last_used_at DATETIME DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+CREATE_GENERATION_CACHE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_generation_cache_last_used ON generation_cache (last_used_at)",
+    "CREATE INDEX IF NOT EXISTS idx_generation_cache_result_url ON generation_cache (result_url)",
+]
+
+# Параметры: ключ, TTL записи ('-N seconds'), TTL ссылки Replicate ('-N seconds')
+GET_CACHED_GENERATION = """
+SELECT * FROM generation_cache
+WHERE cache_key = ?
+  AND created_at >= datetime('now', ?)
+  AND (file_id IS NOT NULL OR created_at >= datetime('now', ?))
+"""
+TOUCH_CACHED_GENERATION = "UPDATE generation_cache SET hits = hits + 1, last_used_at = CURRENT_TIMESTAMP WHERE cache_key = ?"
+PUT_CACHED_GENERATION = """
+INSERT OR REPLACE INTO generation_cache (cache_key, result_url, file_id, hits, created_at, last_used_at)
+VALUES (?, ?, NULL, 0, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+"""
+SET_CACHED_GENERATION_FILE_ID = "UPDATE generation_cache SET file_id = ? WHERE result_url = ?"
+EVICT_EXPIRED_GENERATIONS = "DELETE FROM generation_cache WHERE created_at < datetime('now', ?)"
+# Оставить только N самых свежих по использованию записей (LRU)
+EVICT_LRU_GENERATIONS = """
+DELETE FROM generation_cache WHERE cache_key IN (
+    SELECT cache_key FROM generation_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+)
+"""
+GET_GENERATION_CACHE_SIZE = "SELECT COUNT(*) FROM generation_cache"
+
+# ===== FSM STATE TABLE (общее хранилище FSM, миграция №7) =====
+# Состояние и данные диалога пользователя; общие для всех процессов бота
+CREATE_FSM_STATE_TABLE = """
+CREATE TABLE IF NOT EXISTS fsm_state (
+    key TEXT PRIMARY KEY,
+    state TEXT,
+    data TEXT,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+# Второй параметр — TTL вида '-86400 seconds': брошенные сессии считаются пустыми
+GET_FSM_STATE = "SELECT state FROM fsm_state WHERE key = ? AND updated_at >= DATETIME('now', ?)"
+GET_FSM_DATA = "SELECT data FROM fsm_state WHERE key = ? AND updated_at >= DATETIME('now', ?)"
+SET_FSM_STATE = """
+INSERT INTO fsm_state (key, state, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)
+ON CONFLICT(key) DO UPDATE SET state = excluded.state, updated_at = CURRENT_TIMESTAMP
+"""
+SET_FSM_DATA = """
+INSERT INTO fsm_state (key, data, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)
+ON CONFLICT(key) DO UPDATE SET data = excluded.data, updated_at = CURRENT_TIMESTAMP
+"""
+DELETE_EMPTY_FSM_STATE = "DELETE FROM fsm_state WHERE key = ? AND state IS NULL AND data IS NULL"
+DELETE_EXPIRED_FSM_STATE = "DELETE FROM fsm_state WHERE updated_at < DATETIME('now', ?)"
+CREATE_FSM_STATE_INDEX = "CREATE INDEX IF NOT EXISTS idx_fsm_state_updated ON fsm_state (updated_at)"
+
+# ===== BROADCASTS TABLE (рассылки, миграция №9) =====
+# last_user_id — контрольная точка: получатели идут по возрастанию user_id
+CREATE_BROADCASTS_TABLE = """
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    admin_id INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    status TEXT DEFAULT 'running',
+    total INTEGER DEFAULT 0,
+    sent INTEGER DEFAULT 0,
+    failed INTEGER DEFAULT 0,
+    blocked INTEGER DEFAULT 0,
+    last_user_id INTEGER DEFAULT 0,
+    progress_chat_id INTEGER,
+    progress_message_id INTEGER,
+    worker_id TEXT,
+    lease_until DATETIME,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    finished_at DATETIME
+)
+"""
+
+USERS_BLOCKED_COLUMNS = [
+    ("is_blocked", "INTEGER DEFAULT 0"),
+]
+
+CREATE_BROADCAST = """
+INSERT INTO broadcasts (admin_id, text, total, progress_chat_id, progress_message_id)
+VALUES (?, ?, ?, ?, ?)
+"""
+GET_BROADCAST = "SELECT * FROM broadcasts WHERE id = ?"
+GET_LAST_BROADCAST = "SELECT * FROM broadcasts ORDER BY id DESC LIMIT 1"
+
+# Забрать рассылку в работу: свою, без владельца или с истёкшей арендой
+CLAIM_BROADCAST = """
+UPDATE broadcasts SET worker_id = ?, lease_until = DATETIME('now', ?)
+WHERE id = (
+    SELECT id FROM broadcasts
+    WHERE status = 'running'
+      AND (worker_id IS NULL OR worker_id = ? OR lease_until < CURRENT_TIMESTAMP)
+    ORDER BY id LIMIT 1
+)
+RETURNING *
+"""
+CHECKPOINT_BROADCAST = """
+UPDATE broadcasts
+SET last_user_id = ?, sent = sent + ?, failed = failed + ?, blocked = blocked + ?,
+    lease_until = DATETIME('now', ?)
+WHERE id = ? AND worker_id = ?
+"""
+# Только из running: отмена, пришедшая после последней проверки статуса, не перетирается
+FINISH_BROADCAST = """
+UPDATE broadcasts SET status = ?, finished_at = CURRENT_TIMESTAMP, worker_id = NULL, lease_until = NULL
+WHERE id = ? AND status = 'running'
+"""
+CANCEL_BROADCAST = """
+UPDATE broadcasts SET status = 'cancelled', finished_at = CURRENT_TIMESTAMP
+WHERE id = ? AND status = 'running'
+"""
+
+# Keyset-пагинация по первичному ключу: без OFFSET и без загрузки всей таблицы
+GET_BROADCAST_RECIPIENTS = """
+SELECT user_id FROM users
+WHERE user_id > ? AND is_blocked = 0
+ORDER BY user_id LIMIT ?
+"""
+COUNT_BROADCAST_RECIPIENTS = "SELECT COUNT(*) FROM users WHERE is_blocked = 0"
+MARK_USER_BLOCKED = "UPDATE users SET is_blocked = 1 WHERE user_id = ?"
+MARK_USER_UNBLOCKED = "UPDATE users SET is_blocked = 0 WHERE user_id = ? AND is_blocked = 1"
+
+# ===== SCHEDULED ACTIONS TABLE (отложенные действия, миграция №10) =====
+# run_at — unix time; строка удаляется в момент выполнения (DELETE ... RETURNING),
+# поэтому действие выполнит ровно один процесс
+CREATE_SCHEDULED_ACTIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS scheduled_actions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    run_at REAL NOT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+)
+"""
+CREATE_SCHEDULED_ACTIONS_INDEX = (
+    "CREATE INDEX IF NOT EXISTS idx_scheduled_actions_run_at ON scheduled_actions (run_at)"
+)
+
+CREATE_SCHEDULED_ACTION = "INSERT INTO scheduled_actions (kind, payload, run_at) VALUES (?, ?, ?)"
+CLAIM_DUE_ACTIONS = """
+DELETE FROM scheduled_actions
+WHERE id IN (SELECT id FROM scheduled_actions WHERE run_at <= ? ORDER BY run_at LIMIT ?)
+RETURNING *
+"""
+GET_NEXT_ACTION_TIME = "SELECT MIN(run_at) FROM scheduled_actions"
+COUNT_SCHEDULED_ACTIONS = "SELECT COUNT(*) FROM scheduled_actions"
+
+# ===== SETTINGS VERSION (счётчик изменений settings, миграция №11) =====
+# Триггеры увеличивают version при любом изменении settings (в том числе
+# вручную через sqlite3), процессы бота сравнивают его со своим снимком
+CREATE_SETTINGS_VERSION_TABLE = """
+CREATE TABLE IF NOT EXISTS settings_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL DEFAULT 0
+)
+"""
+INIT_SETTINGS_VERSION = "INSERT OR IGNORE INTO settings_version (id, version) VALUES (1, 0)"
+
+CREATE_SETTINGS_VERSION_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS settings_version_{event.lower()}
+    AFTER {event} ON settings
+    BEGIN
+        UPDATE settings_version SET version = version + 1 WHERE id = 1;
+    END
+    """
+    for event in ("INSERT", "UPDATE", "DELETE")
+]
+
+GET_SETTINGS_VERSION = "SELECT version FROM settings_version WHERE id = 1"
+
+# ===== DAILY ROLLUPS (дневные агрегаты для админ-статистики, миграция №12) =====
+# Обновляются триггерами в той же транзакции, что и исходная запись
+# (регистрация, событие аналитики, успешный платёж), поэтому экраны
+# статистики читают O(дней) строк вместо сканирования users/analytics/payments.
+# Дни — DATE() от UTC-времени записи, как и в прежних запросах.
+CREATE_DAILY_STATS_TABLE = """
+CREATE TABLE IF NOT EXISTS daily_stats (
+    day TEXT PRIMARY KEY,
+    new_users INTEGER NOT NULL DEFAULT 0,
+    generations INTEGER NOT NULL DEFAULT 0,
+    payments INTEGER NOT NULL DEFAULT 0,
+    revenue INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+CREATE_DAILY_ROOM_STATS_TABLE = """
+CREATE TABLE IF NOT EXISTS daily_room_stats (
+    day TEXT NOT NULL,
+    room TEXT NOT NULL,
+    generations INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, room)
+)
+"""
+
+CREATE_DAILY_STYLE_STATS_TABLE = """
+CREATE TABLE IF NOT EXISTS daily_style_stats (
+    day TEXT NOT NULL,
+    style TEXT NOT NULL,
+    generations INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, style)
+)
+"""
+
+# Триггеры миграции №12 (не менять: миграция применена; поправки — новыми миграциями)
+CREATE_ROLLUP_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS rollup_users_insert AFTER INSERT ON users
+    BEGIN
+        INSERT INTO daily_stats (day, new_users) VALUES (DATE(COALESCE(NEW.reg_date, CURRENT_TIMESTAMP)), 1)
+        ON CONFLICT (day) DO UPDATE SET new_users = new_users + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS rollup_users_delete AFTER DELETE ON users
+    BEGIN
+        UPDATE daily_stats SET new_users = new_users - 1 WHERE day = DATE(OLD.reg_date);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS rollup_analytics_generation AFTER INSERT ON analytics
+    WHEN NEW.action = 'generation'
+    BEGIN
+        INSERT INTO daily_stats (day, generations) VALUES (DATE(NEW.created_at), 1)
+        ON CONFLICT (day) DO UPDATE SET generations = generations + 1;
+        INSERT INTO daily_room_stats (day, room, generations)
+        SELECT DATE(NEW.created_at), NEW.room, 1 WHERE NEW.room IS NOT NULL
+        ON CONFLICT (day, room) DO UPDATE SET generations = generations + 1;
+        INSERT INTO daily_style_stats (day, style, generations)
+        SELECT DATE(NEW.created_at), NEW.style, 1 WHERE NEW.style IS NOT NULL
+        ON CONFLICT (day, style) DO UPDATE SET generations = generations + 1;
+    END
+    """,
+    # Доход относится к дню создания платежа, как в прежних отчётах
+    """
+    CREATE TRIGGER IF NOT EXISTS rollup_payments_succeeded AFTER UPDATE OF status ON payments
+    WHEN NEW.status = 'succeeded' AND OLD.status IS NOT 'succeeded'
+    BEGIN
+        INSERT INTO daily_stats (day, payments, revenue) VALUES (DATE(NEW.created_at), 1, NEW.amount)
+        ON CONFLICT (day) DO UPDATE SET payments = payments + 1, revenue = revenue + NEW.amount;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS rollup_payments_insert_succeeded AFTER INSERT ON payments
+    WHEN NEW.status = 'succeeded'
+    BEGIN
+        INSERT INTO daily_stats (day, payments, revenue) VALUES (DATE(NEW.created_at), 1, NEW.amount)
+        ON CONFLICT (day) DO UPDATE SET payments = payments + 1, revenue = revenue + NEW.amount;
+    END
+    """,
+]
+
+# Миграция №14: пользователь без reg_date не относится ни к одному дню —
+# не считается ни триггером, ни пересборкой REBUILD_ROLLUPS (правила должны совпадать)
+CREATE_ROLLUP_USERS_INSERT_TRIGGER = """
+CREATE TRIGGER IF NOT EXISTS rollup_users_insert AFTER INSERT ON users
+WHEN NEW.reg_date IS NOT NULL
+BEGIN
+    INSERT INTO daily_stats (day, new_users) VALUES (DATE(NEW.reg_date), 1)
+    ON CONFLICT (day) DO UPDATE SET new_users = new_users + 1;
+END
+"""
+
+# Миграция №16: платёж перестал быть succeeded (возврат, отмена) или удалён —
+# вычесть его из дня создания, как его и прибавляли
+CREATE_ROLLUP_PAYMENT_REVERSAL_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS rollup_payments_reversed AFTER UPDATE OF status ON payments
+    WHEN OLD.status = 'succeeded' AND NEW.status IS NOT 'succeeded'
+    BEGIN
+        UPDATE daily_stats SET payments = payments - 1, revenue = revenue - OLD.amount
+        WHERE day = DATE(OLD.created_at);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS rollup_payments_delete_succeeded AFTER DELETE ON payments
+    WHEN OLD.status = 'succeeded'
+    BEGIN
+        UPDATE daily_stats SET payments = payments - 1, revenue = revenue - OLD.amount
+        WHERE day = DATE(OLD.created_at);
+    END
+    """,
+]
+
+# Пересборка агрегатов из истории (миграция и команда /rebuild_stats).
+# Выполняется одной транзакцией на соединении-писателе, поэтому новые
+# события не теряются между очисткой и пересчётом
+REBUILD_ROLLUPS = [
+    "DELETE FROM daily_stats",
+    "DELETE FROM daily_room_stats",
+    "DELETE FROM daily_style_stats",
+    """
+    INSERT INTO daily_stats (day, new_users)
+    SELECT DATE(reg_date), COUNT(*) FROM users WHERE reg_date IS NOT NULL GROUP BY DATE(reg_date)
+    """,
+    """
+    INSERT INTO daily_stats (day, generations)
+    SELECT DATE(created_at), COUNT(*) FROM analytics WHERE action = 'generation' GROUP BY DATE(created_at)
+    ON CONFLICT (day) DO UPDATE SET generations = excluded.generations
+    """,
+    """
+    INSERT INTO daily_stats (day, payments, revenue)
+    SELECT DATE(created_at), COUNT(*), SUM(amount) FROM payments WHERE status = 'succeeded' GROUP BY DATE(created_at)
+    ON CONFLICT (day) DO UPDATE SET payments = excluded.payments, revenue = excluded.revenue
+    """,
+    """
+    INSERT INTO daily_room_stats (day, room, generations)
+    SELECT DATE(created_at), room, COUNT(*) FROM analytics
+    WHERE action = 'generation' AND room IS NOT NULL GROUP BY DATE(created_at), room
+    """,
+    """
+    INSERT INTO daily_style_stats (day, style, generations)
+    SELECT DATE(created_at), style, COUNT(*) FROM analytics
+    WHERE action = 'generation' AND style IS NOT NULL GROUP BY DATE(created_at), style
+    """,
+]
+
+# ===== ЭКСПОРТ ДАННЫХ (админ-команда /export) =====
+# Таблица -> (ключ для keyset-чтения пачками, колонка даты для фильтра)
+EXPORT_TABLES = {
+    'users': ('user_id', 'reg_date'),
+    'payments': ('id', 'created_at'),
+    'analytics': ('id', 'created_at'),
+    'referral_earnings': ('id', 'created_at'),
+    'referral_exchanges': ('id', 'created_at'),
+    'referral_payouts': ('id', 'requested_at'),
+}
+
+# ===== ИНДЕКСЫ (миграция №2) =====
+CREATE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_users_reg_date ON users (reg_date)",
+    "CREATE INDEX IF NOT EXISTS idx_analytics_action_created ON analytics (action, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_analytics_action_room ON analytics (action, room)",
+    "CREATE INDEX IF NOT EXISTS idx_analytics_action_style ON analytics (action, style)",
+    "CREATE INDEX IF NOT EXISTS idx_payments_user_status_created ON payments (user_id, status, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_payments_status_created ON payments (status, created_at, amount)",
+    "CREATE INDEX IF NOT EXISTS idx_referral_earnings_referrer_created ON referral_earnings (referrer_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_referral_exchanges_user_created ON referral_exchanges (user_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_referral_payouts_user_requested ON referral_payouts (user_id, requested_at)",
+    "CREATE INDEX IF NOT EXISTS idx_referral_payouts_status_requested ON referral_payouts (status, requested_at)",
+]
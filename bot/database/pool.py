@@ -0,0 +1,206 @@
+# bot/database/pool.py
+
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Any, List, Optional
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionPool:
+    """
+    Пул долгоживущих соединений с SQLite.
+
+    SQLite допускает только одного писателя одновременно, поэтому пул держит:
+    - одно соединение для записи (под asyncio.Lock)
+    - N соединений для чтения (раздаются через asyncio.Queue)
+
+    Соединения открываются один раз в open() и живут до close(),
+    вместо aiosqlite.connect() на каждый запрос.
+    """
+
+    # PRAGMA, действующие на уровне файла базы (ставятся один раз писателем)
+    DATABASE_PRAGMAS = ('journal_mode',)
+
+    # Человекочитаемые значения -> то, что возвращает SQLite при чтении PRAGMA
+    _PRAGMA_ALIASES = {
+        'synchronous': {'OFF': 0, 'NORMAL': 1, 'FULL': 2, 'EXTRA': 3},
+        'temp_store': {'DEFAULT': 0, 'FILE': 1, 'MEMORY': 2},
+    }
+
+    def __init__(self, db_path: str, readers: int = 4, pragmas: Optional[Dict[str, Any]] = None):
+        self.db_path = db_path
+        self.readers_count = max(1, readers)
+        self.pragmas = dict(pragmas or {})
+
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._writer_lock = asyncio.Lock()
+        self._readers: List[aiosqlite.Connection] = []
+        self._idle_readers: Optional[asyncio.Queue] = None
+        self._opened = False
+
+        # Статистика для подбора размера пула
+        self._stats = {
+            'read_checkouts': 0,
+            'write_checkouts': 0,
+            'read_wait_total': 0.0,
+            'write_wait_total': 0.0,
+            'read_wait_max': 0.0,
+            'write_wait_max': 0.0,
+        }
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened
+
+    async def _connect(self) -> aiosqlite.Connection:
+        """Открыть одно соединение с базой и применить PRAGMA соединения"""
+        conn = await aiosqlite.connect(self.db_path)
+        conn.row_factory = aiosqlite.Row
+        for name, value in self.pragmas.items():
+            if name not in self.DATABASE_PRAGMAS:
+                await self._set_pragma(conn, name, value)
+        return conn
+
+    @staticmethod
+    async def _set_pragma(conn: aiosqlite.Connection, name: str, value: Any):
+        """
+        Установить PRAGMA. Курсор дочитывается и закрывается: незавершённый
+        оператор (journal_mode, mmap_size возвращают строку) держит блокировку файла.
+        """
+        async with conn.execute(f"PRAGMA {name} = {value}") as cursor:
+            await cursor.fetchall()
+
+    async def open(self):
+        """Открыть соединение-писатель и читателей"""
+        if self._opened:
+            return
+
+        self._writer = await self._connect()
+        # journal_mode меняем до открытия читателей: переход в WAL требует эксклюзивного доступа
+        for name in self.DATABASE_PRAGMAS:
+            if name in self.pragmas:
+                await self._set_pragma(self._writer, name, self.pragmas[name])
+        self._idle_readers = asyncio.Queue()
+        for _ in range(self.readers_count):
+            conn = await self._connect()
+            self._readers.append(conn)
+            self._idle_readers.put_nowait(conn)
+
+        self._opened = True
+        logger.info(f"✅ DB pool opened: 1 writer + {self.readers_count} readers ({self.db_path})")
+
+    async def close(self):
+        """Закрыть все соединения пула"""
+        if not self._opened:
+            return
+
+        self._opened = False
+        for conn in self._readers:
+            try:
+                await conn.close()
+            except Exception as e:
+                logger.warning(f"⚠️ Ошибка закрытия соединения-читателя: {e}")
+        self._readers.clear()
+        self._idle_readers = None
+
+        if self._writer is not None:
+            try:
+                await self._writer.close()
+            except Exception as e:
+                logger.warning(f"⚠️ Ошибка закрытия соединения-писателя: {e}")
+            self._writer = None
+
+        logger.info(f"✅ DB pool closed. Stats: {self.get_stats()}")
+
+    def _record_wait(self, kind: str, waited: float):
+        self._stats[f'{kind}_checkouts'] += 1
+        self._stats[f'{kind}_wait_total'] += waited
+        if waited > self._stats[f'{kind}_wait_max']:
+            self._stats[f'{kind}_wait_max'] = waited
+
+    @asynccontextmanager
+    async def reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Взять соединение для чтения"""
+        started = time.perf_counter()
+        conn = await self._idle_readers.get()
+        self._record_wait('read', time.perf_counter() - started)
+        try:
+            yield conn
+        finally:
+            if self._idle_readers is not None:
+                self._idle_readers.put_nowait(conn)
+
+    @asynccontextmanager
+    async def writer(self) -> AsyncIterator[aiosqlite.Connection]:
+        """
+        Взять соединение для записи (эксклюзивно).
+        При исключении незакоммиченная транзакция откатывается.
+        """
+        started = time.perf_counter()
+        async with self._writer_lock:
+            self._record_wait('write', time.perf_counter() - started)
+            try:
+                yield self._writer
+            except BaseException:
+                try:
+                    await self._writer.rollback()
+                except Exception:
+                    pass
+                raise
+
+    async def verify_pragmas(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Прочитать фактические значения PRAGMA (на писателе и одном читателе).
+
+        Returns:
+            {pragma: {'expected': ..., 'writer': ..., 'reader': ..., 'ok': bool}}
+        """
+        report: Dict[str, Dict[str, Any]] = {}
+        async with self.writer() as w_conn, self.reader() as r_conn:
+            for name, expected in self.pragmas.items():
+                values = {}
+                for role, conn in (('writer', w_conn), ('reader', r_conn)):
+                    async with conn.execute(f"PRAGMA {name}") as cursor:
+                        row = await cursor.fetchone()
+                        values[role] = row[0] if row else None
+                normalized = self._normalize_pragma(name, expected)
+                report[name] = {
+                    'expected': expected,
+                    **values,
+                    'ok': all(self._normalize_pragma(name, v) == normalized for v in values.values()),
+                }
+        return report
+
+    @classmethod
+    def _normalize_pragma(cls, name: str, value: Any) -> Any:
+        """Привести значение PRAGMA к виду, в котором его возвращает SQLite"""
+        if isinstance(value, str):
+            upper = value.strip().upper()
+            aliases = cls._PRAGMA_ALIASES.get(name, {})
+            if upper in aliases:
+                return aliases[upper]
+            if upper.lstrip('-').isdigit():
+                return int(upper)
+            return upper
+        return value
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика пула: количество выдач и время ожидания соединения"""
+        stats = self._stats
+        read_n = stats['read_checkouts']
+        write_n = stats['write_checkouts']
+        return {
+            'readers': self.readers_count,
+            'readers_idle': self._idle_readers.qsize() if self._idle_readers else 0,
+            'read_checkouts': read_n,
+            'write_checkouts': write_n,
+            'read_wait_avg_ms': round(stats['read_wait_total'] / read_n * 1000, 3) if read_n else 0.0,
+            'write_wait_avg_ms': round(stats['write_wait_total'] / write_n * 1000, 3) if write_n else 0.0,
+            'read_wait_max_ms': round(stats['read_wait_max'] * 1000, 3),
+            'write_wait_max_ms': round(stats['write_wait_max'] * 1000, 3),
+        }
@@ -0,0 +1,59 @@
+# bot/database/settings.py
+
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, Mapping
+
+from database.models import DEFAULT_SETTINGS
+
+logger = logging.getLogger(__name__)
+
+_DEFAULTS = dict(DEFAULT_SETTINGS)
+
+
+def _int(values: Mapping[str, str], key: str, minimum: int = 0) -> int:
+    """Целое значение настройки; некорректное или меньше minimum — значение по умолчанию"""
+    try:
+        value = int(values.get(key, _DEFAULTS[key]))
+    except (TypeError, ValueError):
+        logger.warning(f"⚠️ Некорректная настройка {key}={values.get(key)!r}, используется {_DEFAULTS[key]}")
+        return int(_DEFAULTS[key])
+    return value if value >= minimum else int(_DEFAULTS[key])
+
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    Снимок таблицы settings с типизированными значениями.
+
+    Хэндлеры читают db.settings без обращения к БД; снимок заменяется
+    целиком при set_setting и при изменении settings_version.
+    """
+
+    welcome_bonus: int = int(_DEFAULTS["welcome_bonus"])
+    referral_bonus_inviter: int = int(_DEFAULTS["referral_bonus_inviter"])
+    referral_bonus_invited: int = int(_DEFAULTS["referral_bonus_invited"])
+    referral_enabled: bool = _DEFAULTS["referral_enabled"] == "1"
+    referral_commission_percent: int = int(_DEFAULTS["referral_commission_percent"])
+    referral_min_payout: int = int(_DEFAULTS["referral_min_payout"])
+    referral_exchange_rate: int = int(_DEFAULTS["referral_exchange_rate"])
+
+    # settings_version, из которого собран снимок (-1 — ещё не загружен)
+    version: int = -1
+    # Все значения как есть (в том числе ключи без типизированного поля)
+    raw: Dict[str, str] = field(default_factory=lambda: dict(_DEFAULTS))
+
+    @classmethod
+    def from_values(cls, values: Mapping[str, str], version: int) -> "Settings":
+        return cls(
+            welcome_bonus=_int(values, "welcome_bonus"),
+            referral_bonus_inviter=_int(values, "referral_bonus_inviter"),
+            referral_bonus_invited=_int(values, "referral_bonus_invited"),
+            referral_enabled=str(values.get("referral_enabled", _DEFAULTS["referral_enabled"])) == "1",
+            referral_commission_percent=_int(values, "referral_commission_percent"),
+            referral_min_payout=_int(values, "referral_min_payout"),
+            # Курс обмена — делитель, 0 недопустим
+            referral_exchange_rate=_int(values, "referral_exchange_rate", minimum=1),
+            version=version,
+            raw={**_DEFAULTS, **values},
+        )
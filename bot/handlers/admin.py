@@ -1,15 +1,29 @@
 # bot/handlers/admin.py
 
+import html
 import logging
+import os
+from datetime import datetime
+
 from aiogram import Router, F
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
-from aiogram.types import CallbackQuery, Message
+from aiogram.types import CallbackQuery, FSInputFile, Message
 from aiogram.utils.keyboard import InlineKeyboardBuilder, InlineKeyboardButton
 
 from config import ADMIN_IDS, config
 from database.db import db
+from database.models import EXPORT_TABLES
+from services.generation_cache import generation_cache
+from middlewares.antiflood import antiflood
+from middlewares.outbound_limiter import outbound_limiter
+from services.analytics import analytics
+from services.broadcast import broadcast_service
+from services.deletion_batcher import deletion_batcher
+from services.export import EXPORT_FORMATS, MAX_DOCUMENT_SIZE, data_exporter
+from services.image_preprocess import get_preprocess_stats
+from keyboards.inline import get_broadcast_progress_keyboard
 from utils.navigation import edit_menu
 
 logger = logging.getLogger(__name__)
@@ -22,8 +36,11 @@ class AdminStates(StatesGroup):
     admin_menu = State()
     viewing_stats = State()
     viewing_users = State()
+    searching_users = State()
     managing_admins = State()
     editing_api_tokens = State()
+    broadcast_text = State()
+    broadcast_confirm = State()
 
 
 # ===== ADMIN PANEL KEYBOARDS =====
@@ -33,6 +50,7 @@ def get_admin_menu_keyboard():
 
     builder.row(InlineKeyboardButton(text="📊 Статистика", callback_data="admin_stats"))
     builder.row(InlineKeyboardButton(text="👥 Пользователи", callback_data="admin_users"))
+    builder.row(InlineKeyboardButton(text="📢 Рассылка", callback_data="admin_broadcast"))
     builder.row(InlineKeyboardButton(text="🔑 Администраторы", callback_data="admin_manage_admins"))
     builder.row(InlineKeyboardButton(text="🔐 API Токены", callback_data="admin_api_tokens"))
     builder.row(InlineKeyboardButton(text="⬅️ Главное меню", callback_data="main_menu"))
@@ -48,11 +66,21 @@ def get_stats_keyboard():
     builder.row(InlineKeyboardButton(text="💰 Финансовая статистика", callback_data="admin_stats_finance"))
     builder.row(InlineKeyboardButton(text="🎨 Популярность стилей", callback_data="admin_stats_styles"))
     builder.row(InlineKeyboardButton(text="🏠 Популярность комнат", callback_data="admin_stats_rooms"))
+    builder.row(InlineKeyboardButton(text="⚡ Кэш генераций", callback_data="admin_stats_cache"))
+    builder.row(InlineKeyboardButton(text="📤 Исходящие запросы", callback_data="admin_stats_outbound"))
     builder.row(InlineKeyboardButton(text="⬅️ Назад в админ меню", callback_data="admin_menu"))
 
     return builder.as_markup()
 
 
+def get_broadcast_confirm_keyboard():
+    """Broadcast confirmation keyboard"""
+    builder = InlineKeyboardBuilder()
+    builder.row(InlineKeyboardButton(text="✅ Отправить всем", callback_data="admin_broadcast_confirm"))
+    builder.row(InlineKeyboardButton(text="⬅️ Отмена", callback_data="admin_menu"))
+    return builder.as_markup()
+
+
 def get_admin_back_keyboard():
     """Back to admin menu keyboard"""
     builder = InlineKeyboardBuilder()
@@ -93,6 +121,8 @@ async def open_admin_panel_callback(callback: CallbackQuery, state: FSMContext):
 Здесь вы можете:
 • 📊 Просмотреть статистику
 • 👥 Управлять пользователями
+• 📢 Отправить рассылку
+• 📦 Выгрузить данные: /export
 • 🔑 Управлять администраторами
 • 🔐 Редактировать API токены
 
@@ -142,6 +172,8 @@ async def admin_start(message: Message, state: FSMContext):
 Здесь вы можете:
 • 📊 Просмотреть статистику
 • 👥 Управлять пользователями
+• 📢 Отправить рассылку
+• 📦 Выгрузить данные: /export
 • 🔑 Управлять администраторами
 • 🔐 Редактировать API токены
 
@@ -174,6 +206,8 @@ async def admin_menu_handler(callback: CallbackQuery, state: FSMContext):
 Здесь вы можете:
 • 📊 Просмотреть статистику
 • 👥 Управлять пользователями
+• 📢 Отправить рассылку
+• 📦 Выгрузить данные: /export
 • 🔑 Управлять администраторами
 • 🔐 Редактировать API токены
 
@@ -220,12 +254,13 @@ async def admin_stats_general(callback: CallbackQuery, state: FSMContext):
     logger.info(f"[STATS_GENERAL] 🎯 Загрузка общей статистики")
 
     try:
-        total_users = await db.get_total_users()
-        new_users_today = await db.get_new_users_today()
-        new_users_week = await db.get_new_users_week()
-        new_users_month = await db.get_new_users_month()
-        total_gens = await db.get_total_generations()
-        gens_today = await db.get_generations_today()
+        snapshot = await db.get_dashboard_snapshot()
+        total_users = snapshot.total_users
+        new_users_today = snapshot.new_users_today
+        new_users_week = snapshot.new_users_week
+        new_users_month = snapshot.new_users_month
+        total_gens = snapshot.total_generations
+        gens_today = snapshot.generations_today
 
         stats_text = f"""
 📈 <b>ОБЩАЯ СТАТИСТИКА</b>
@@ -261,10 +296,11 @@ async def admin_stats_finance(callback: CallbackQuery, state: FSMContext):
     logger.info(f"[STATS_FINANCE] 🎯 Загрузка финансовой статистики")
 
     try:
-        revenue_total = await db.get_total_revenue()
-        revenue_today = await db.get_revenue_today()
-        revenue_week = await db.get_revenue_week()
-        revenue_month = await db.get_revenue_month()
+        snapshot = await db.get_dashboard_snapshot()
+        revenue_total = snapshot.revenue_total
+        revenue_today = snapshot.revenue_today
+        revenue_week = snapshot.revenue_week
+        revenue_month = snapshot.revenue_month
 
         stats_text = f"""
 💰 <b>ФИНАНСОВАЯ СТАТИСТИКА</b>
@@ -296,19 +332,109 @@ async def admin_stats_finance(callback: CallbackQuery, state: FSMContext):
         await callback.answer("❌ Ошибка при загрузке финансовой статистики", show_alert=True)
 
 
+@router.message(Command("rebuild_stats"))
+async def admin_rebuild_stats(message: Message, state: FSMContext):
+    """Rebuild daily statistics rollups from history (/rebuild_stats)"""
+    user_id = message.from_user.id
+    if user_id not in ADMIN_IDS:
+        logger.warning(f"[REBUILD_STATS] ❌ Доступ запрещён для user {user_id}")
+        return
+
+    logger.info(f"[REBUILD_STATS] 🎯 Пересчёт агрегатов статистики от user {user_id}")
+    try:
+        days = await db.rebuild_rollups()
+        await message.answer(f"✅ Статистика пересчитана: <b>{days}</b> дн. с данными", parse_mode="HTML")
+        logger.info(f"[REBUILD_STATS] ✅ Агрегаты пересчитаны ({days} дней)")
+    except Exception as e:
+        logger.error(f"[REBUILD_STATS] ❌ Ошибка пересчёта: {e}", exc_info=True)
+        await message.answer("❌ Ошибка при пересчёте статистики")
+
+
+EXPORT_USAGE = (
+    "📦 <b>ЭКСПОРТ ДАННЫХ</b>\n\n"
+    "<code>/export таблица [с YYYY-MM-DD] [по YYYY-MM-DD] [csv|parquet]</code>\n\n"
+    "Таблицы: " + ", ".join(f"<code>{table}</code>" for table in EXPORT_TABLES) + "\n\n"
+    "Пример: <code>/export payments 2025-01-01 2025-01-31</code>"
+)
+
+
+@router.message(Command("export"))
+async def admin_export(message: Message, command: CommandObject, state: FSMContext):
+    """Stream a table to a gzip CSV / Parquet file and send it as a document (/export)"""
+    user_id = message.from_user.id
+    if user_id not in ADMIN_IDS:
+        logger.warning(f"[EXPORT] ❌ Доступ запрещён для user {user_id}")
+        return
+
+    args = (command.args or "").split()
+    if not args or args[0] not in EXPORT_TABLES:
+        await message.answer(EXPORT_USAGE, parse_mode="HTML")
+        return
+
+    table, dates, fmt = args[0], [], "csv"
+    for arg in args[1:]:
+        if arg.lower() in EXPORT_FORMATS:
+            fmt = arg.lower()
+            continue
+        try:
+            dates.append(datetime.strptime(arg, "%Y-%m-%d").strftime("%Y-%m-%d"))
+        except ValueError:
+            await message.answer(f"❌ Не понял аргумент «{html.escape(arg)}»\n\n{EXPORT_USAGE}", parse_mode="HTML")
+            return
+    if len(dates) > 2:
+        await message.answer(EXPORT_USAGE, parse_mode="HTML")
+        return
+    date_from = dates[0] if dates else None
+    date_to = dates[1] if len(dates) > 1 else None
+
+    if fmt == "parquet" and not data_exporter.parquet_available():
+        await message.answer("❌ Parquet недоступен: не установлен пакет pyarrow. Используйте csv.")
+        return
+    if data_exporter.busy:
+        await message.answer("⏳ Уже выполняется другой экспорт, попробуйте позже.")
+        return
+
+    logger.info(f"[EXPORT] 🎯 {table} {date_from}..{date_to} ({fmt}) от user {user_id}")
+    status = await message.answer(f"⏳ Выгружаю <b>{table}</b>...", parse_mode="HTML")
+
+    result = None
+    try:
+        result = await data_exporter.export(table, date_from, date_to, fmt)
+        if result.size > MAX_DOCUMENT_SIZE:
+            await status.edit_text(
+                f"❌ Файл слишком большой для Telegram ({result.size // (1024 * 1024)} МБ). "
+                f"Сузьте период выгрузки."
+            )
+            return
+
+        await message.answer_document(
+            FSInputFile(result.path, filename=result.filename),
+            caption=f"📦 {table}: {result.rows} строк"
+        )
+        await status.delete()
+        logger.info(f"[EXPORT] ✅ {result.filename} отправлен ({result.rows} строк)")
+
+    except Exception as e:
+        logger.error(f"[EXPORT] ❌ Ошибка экспорта {table}: {e}", exc_info=True)
+        await status.edit_text("❌ Ошибка при экспорте данных")
+    finally:
+        if result is not None:
+            os.remove(result.path)
+
+
 @router.callback_query(F.data == "admin_stats_styles")
 async def admin_stats_styles(callback: CallbackQuery, state: FSMContext):
     """Show popular styles statistics"""
     logger.info(f"[STATS_STYLES] 🎯 Загрузка статистики стилей")
 
     try:
-        styles = await db.get_popular_styles()
+        styles = (await db.get_dashboard_snapshot()).popular_styles
 
         styles_text = "🎨 <b>ПОПУЛЯРНЫЕ СТИЛИ</b>\n\n"
 
         if styles:
-            for i, style in enumerate(styles[:10], 1):
-                styles_text += f"{i}. <b>{style['style'].title()}</b> — {style['count']} генераций\n"
+            for i, (style, count) in enumerate(styles[:10], 1):
+                styles_text += f"{i}. <b>{style.title()}</b> — {count} генераций\n"
         else:
             styles_text += "Нет данных"
 
@@ -332,13 +458,13 @@ async def admin_stats_rooms(callback: CallbackQuery, state: FSMContext):
     logger.info(f"[STATS_ROOMS] 🎯 Загрузка статистики комнат")
 
     try:
-        rooms = await db.get_popular_rooms()
+        rooms = (await db.get_dashboard_snapshot()).popular_rooms
 
         rooms_text = "🏠 <b>ПОПУЛЯРНЫЕ КОМНАТЫ</b>\n\n"
 
         if rooms:
-            for i, room in enumerate(rooms[:10], 1):
-                rooms_text += f"{i}. <b>{room['room'].upper()}</b> — {room['count']} генераций\n"
+            for i, (room, count) in enumerate(rooms[:10], 1):
+                rooms_text += f"{i}. <b>{room.upper()}</b> — {count} генераций\n"
         else:
             rooms_text += "Нет данных"
 
@@ -356,45 +482,395 @@ async def admin_stats_rooms(callback: CallbackQuery, state: FSMContext):
         await callback.answer("❌ Ошибка при загрузке статистики комнат", show_alert=True)
 
 
-# ===== USERS MANAGEMENT =====
-@router.callback_query(F.data == "admin_users")
-async def admin_users(callback: CallbackQuery, state: FSMContext):
-    """Show users list"""
-    logger.info(f"[ADMIN_USERS] 🎯 Загрузка списка пользователей")
+@router.callback_query(F.data == "admin_stats_cache")
+async def admin_stats_cache(callback: CallbackQuery, state: FSMContext):
+    """Show generation cache statistics"""
+    logger.info(f"[STATS_CACHE] 🎯 Загрузка статистики кэша генераций")
 
     try:
-        await state.set_state(AdminStates.viewing_users)
+        stats = await generation_cache.get_stats()
+        users = db.user_cache.get_stats()
+        photos = get_preprocess_stats()
+
+        cache_text = f"""
+⚡ <b>КЭШ ГЕНЕРАЦИЙ</b>
+
+📦 <b>Состояние:</b> {'✅ Включён' if stats['enabled'] else '❌ Отключён'}
+├─ Записей: <b>{stats['entries']}</b> из {stats['max_entries']}
+└─ TTL: <b>{stats['ttl_seconds'] // 3600} ч</b>
+
+🎯 <b>С момента запуска:</b>
+├─ Попаданий: <b>{stats['hits']}</b>
+├─ Промахов: <b>{stats['misses']}</b>
+└─ Hit rate: <b>{stats['hit_rate']}%</b>
+
+👤 <b>Кэш пользователей</b> (этот процесс):
+├─ Записей: <b>{users['size']}</b>
+└─ Hit rate: <b>{users['hit_rate']}%</b> ({users['hits']} / {users['hits'] + users['misses']})
+
+🖼 <b>Предобработка фото</b> (этот процесс):
+├─ Обработано: <b>{photos['processed']}</b> (без обработки: {photos['skipped']}, ошибок: {photos['errors']})
+├─ Размер: <b>{photos['bytes_before'] / 1024 / 1024:.1f} МБ</b> → <b>{photos['bytes_after'] / 1024 / 1024:.1f} МБ</b> (−{photos['saved_percent']}%)
+└─ Среднее время: <b>{photos['avg_time_ms']} мс</b>
+"""
+
+        await edit_menu(
+            callback=callback,
+            message_id=callback.message.message_id,
+            text=cache_text,
+            keyboard=get_stats_keyboard()
+        )
+
+        logger.info(f"[STATS_CACHE] ✅ Статистика кэша загружена")
+
+    except Exception as e:
+        logger.error(f"[STATS_CACHE] ❌ Ошибка статистики кэша: {e}", exc_info=True)
+        await callback.answer("❌ Ошибка при загрузке статистики кэша", show_alert=True)
+
+
+@router.callback_query(F.data == "admin_stats_outbound")
+async def admin_stats_outbound(callback: CallbackQuery, state: FSMContext):
+    """Show outbound rate limiter statistics"""
+    logger.info(f"[STATS_OUTBOUND] 🎯 Загрузка статистики исходящих запросов")
+
+    try:
+        stats = outbound_limiter.get_stats()
+        flood = antiflood.get_stats()
+        deletions = deletion_batcher.stats
+        events = analytics.get_stats()
+
+        outbound_text = f"""
+📤 <b>ИСХОДЯЩИЕ ЗАПРОСЫ</b> (этот процесс)
+
+📨 <b>С момента запуска:</b>
+├─ Запросов: <b>{stats['requests']}</b>
+├─ Ждали лимита: <b>{stats['throttled']}</b>
+└─ Ответов 429: <b>{stats['retry_after']}</b>
+
+⏱ <b>Ожидание:</b>
+├─ Среднее: <b>{stats['wait_avg_ms']} мс</b>
+└─ Максимум: <b>{stats['wait_max_ms']} мс</b>
+
+📥 <b>Очередь сейчас:</b>
+├─ Всего: <b>{stats['queue_depth']}</b>
+├─ Рассылки: <b>{stats['queue_bulk']}</b>
+└─ Чатов под лимитом: <b>{stats['tracked_chats']}</b>
+
+🛡 <b>Антифлуд (входящие):</b>
+├─ Пропущено апдейтов: <b>{flood['passed']}</b>
+├─ Отброшено: <b>{flood['dropped']}</b> (сообщений: {flood['dropped_messages']})
+└─ Удалено сообщений: <b>{deletions['queued']}</b> за <b>{deletions['calls']}</b> запросов
+
+🗂 <b>Буфер аналитики:</b>
+├─ Событий: <b>{events['logged']}</b>, записано: <b>{events['written']}</b>
+├─ В очереди: <b>{events['queued']}</b>
+└─ Отброшено: <b>{events['dropped']}</b> (ошибок записи: {events['errors']})
+"""
+
+        await edit_menu(
+            callback=callback,
+            message_id=callback.message.message_id,
+            text=outbound_text,
+            keyboard=get_stats_keyboard()
+        )
+
+        logger.info(f"[STATS_OUTBOUND] ✅ Статистика исходящих запросов загружена")
+
+    except Exception as e:
+        logger.error(f"[STATS_OUTBOUND] ❌ Ошибка статистики исходящих запросов: {e}", exc_info=True)
+        await callback.answer("❌ Ошибка при загрузке статистики", show_alert=True)
+
+
+# ===== BROADCAST =====
+@router.callback_query(F.data == "admin_broadcast")
+async def admin_broadcast(callback: CallbackQuery, state: FSMContext):
+    """Start broadcast: ask for text (or show the running broadcast)"""
+    if callback.from_user.id not in ADMIN_IDS:
+        await callback.answer("❌ Доступ запрещён", show_alert=True)
+        return
+
+    logger.info(f"[BROADCAST] 🎯 Открыт экран рассылки")
+
+    last = await db.get_last_broadcast()
+    if last and last['status'] == 'running':
+        await edit_menu(
+            callback=callback,
+            message_id=callback.message.message_id,
+            text=broadcast_service.format_progress(last),
+            keyboard=get_broadcast_progress_keyboard(last['id'])
+        )
+        return
+
+    await state.set_state(AdminStates.broadcast_text)
+    await state.update_data(menu_message_id=callback.message.message_id)
+
+    await edit_menu(
+        callback=callback,
+        message_id=callback.message.message_id,
+        text="📢 <b>РАССЫЛКА</b>\n\nОтправьте текст сообщения для всех пользователей.\nФорматирование сохраняется.",
+        keyboard=get_admin_back_keyboard()
+    )
+
+
+@router.message(AdminStates.broadcast_text, F.text)
+async def admin_broadcast_text(message: Message, state: FSMContext):
+    """Receive broadcast text and show preview"""
+    if message.from_user.id not in ADMIN_IDS:
+        return
+
+    text = message.html_text
+    data = await state.get_data()
+    menu_message_id = data.get('menu_message_id')
+
+    try:
+        await message.delete()
+    except Exception:
+        pass
+
+    await state.update_data(broadcast_text=text)
+    await state.set_state(AdminStates.broadcast_confirm)
+
+    preview = f"📢 <b>ПРЕДПРОСМОТР РАССЫЛКИ</b>\n\n{text}\n\n<i>Отправить всем пользователям?</i>"
+    try:
+        await message.bot.edit_message_text(
+            chat_id=message.chat.id,
+            message_id=menu_message_id,
+            text=preview,
+            reply_markup=get_broadcast_confirm_keyboard(),
+            parse_mode="HTML"
+        )
+    except Exception as e:
+        logger.warning(f"[BROADCAST] ⚠️ Не удалось показать предпросмотр: {e}")
+        menu = await message.answer(preview, reply_markup=get_broadcast_confirm_keyboard(), parse_mode="HTML")
+        await state.update_data(menu_message_id=menu.message_id)
+
+
+@router.callback_query(AdminStates.broadcast_confirm, F.data == "admin_broadcast_confirm")
+async def admin_broadcast_confirm(callback: CallbackQuery, state: FSMContext):
+    """Create broadcast and show live progress"""
+    if callback.from_user.id not in ADMIN_IDS:
+        await callback.answer("❌ Доступ запрещён", show_alert=True)
+        return
+
+    data = await state.get_data()
+    text = data.get('broadcast_text')
+    if not text:
+        await callback.answer("Текст рассылки не найден", show_alert=True)
+        return
+
+    broadcast_id = await broadcast_service.create(
+        admin_id=callback.from_user.id,
+        text=text,
+        progress_chat_id=callback.message.chat.id,
+        progress_message_id=callback.message.message_id,
+    )
+    await state.set_state(AdminStates.admin_menu)
+    await state.update_data(broadcast_text=None)
+
+    broadcast = await db.get_broadcast(broadcast_id)
+    await edit_menu(
+        callback=callback,
+        message_id=callback.message.message_id,
+        text=broadcast_service.format_progress(broadcast),
+        keyboard=get_broadcast_progress_keyboard(broadcast_id)
+    )
+    logger.info(f"[BROADCAST] ✅ Рассылка {broadcast_id} запущена")
+
+
+@router.callback_query(F.data.startswith("admin_broadcast_progress_"))
+async def admin_broadcast_progress(callback: CallbackQuery, state: FSMContext):
+    """Refresh broadcast progress"""
+    if callback.from_user.id not in ADMIN_IDS:
+        await callback.answer("❌ Доступ запрещён", show_alert=True)
+        return
+
+    broadcast = await db.get_broadcast(int(callback.data.rsplit("_", 1)[1]))
+    if not broadcast:
+        await callback.answer("Рассылка не найдена", show_alert=True)
+        return
+
+    await edit_menu(
+        callback=callback,
+        message_id=callback.message.message_id,
+        text=broadcast_service.format_progress(broadcast),
+        keyboard=get_broadcast_progress_keyboard(broadcast['id'], broadcast['status'] == 'running')
+    )
+
+
+@router.callback_query(F.data.startswith("admin_broadcast_cancel_"))
+async def admin_broadcast_cancel(callback: CallbackQuery, state: FSMContext):
+    """Stop a running broadcast"""
+    if callback.from_user.id not in ADMIN_IDS:
+        await callback.answer("❌ Доступ запрещён", show_alert=True)
+        return
+
+    broadcast_id = int(callback.data.rsplit("_", 1)[1])
+    await broadcast_service.cancel(broadcast_id)
+    broadcast = await db.get_broadcast(broadcast_id)
+    if not broadcast:
+        await callback.answer("Рассылка не найдена", show_alert=True)
+        return
+
+    await edit_menu(
+        callback=callback,
+        message_id=callback.message.message_id,
+        text=broadcast_service.format_progress(broadcast),
+        keyboard=get_broadcast_progress_keyboard(broadcast_id, broadcast['status'] == 'running')
+    )
+
+
+# ===== USERS MANAGEMENT =====
+USERS_PAGE_SIZE = 20
 
-        users = await db.get_all_users()
 
-        users_text = "👥 <b>СПИСОК ПОЛЬЗОВАТЕЛЕЙ</b>\n\n"
+def _encode_user_cursor(user: dict) -> str:
+    """Курсор (reg_date, user_id) для callback_data: '20250131235959:123456789' (без даты — ':123')"""
+    return f"{''.join(ch for ch in (user['reg_date'] or '') if ch.isdigit())}:{user['user_id']}"
 
-        if users:
-            users_text += "<b>ID | Telegram | Баланс | Дата регистрации</b>\n"
-            users_text += "─" * 60 + "\n"
 
-            for user in users[:20]:  # Show only first 20
-                users_text += f"<code>{user['user_id']}</code> | @{user['username'] or 'N/A'} | {user['balance']} токен | {user['reg_date'][:10]}\n"
+def _decode_user_cursor(raw: str) -> tuple:
+    stamp, user_id = raw.split(":")
+    if not stamp:
+        # Пользователь без reg_date: ключ сортировки COALESCE(reg_date, '')
+        return '', int(user_id)
+    reg_date = f"{stamp[0:4]}-{stamp[4:6]}-{stamp[6:8]} {stamp[8:10]}:{stamp[10:12]}:{stamp[12:14]}"
+    return reg_date, int(user_id)
 
-            if len(users) > 20:
-                users_text += f"\n... и ещё {len(users) - 20} пользователей"
+
+def get_users_page_keyboard(users: list, has_newer: bool, has_older: bool):
+    """Users browser keyboard: prev/next pages by keyset cursor (callback_data ≤ 64 bytes)"""
+    builder = InlineKeyboardBuilder()
+
+    nav = []
+    if has_newer and users:
+        nav.append(InlineKeyboardButton(text="⬅️ Новее", callback_data=f"au:p:{_encode_user_cursor(users[0])}"))
+    if has_older and users:
+        nav.append(InlineKeyboardButton(text="Старше ➡️", callback_data=f"au:n:{_encode_user_cursor(users[-1])}"))
+    if nav:
+        builder.row(*nav)
+
+    builder.row(InlineKeyboardButton(text="🔎 Поиск", callback_data="admin_users_search"))
+    builder.row(InlineKeyboardButton(text="⬅️ Назад в админ меню", callback_data="admin_menu"))
+    return builder.as_markup()
+
+
+def format_users_list(title: str, users: list, subtitle: str = "") -> str:
+    users_text = f"👥 <b>{title}</b>{subtitle}\n\n"
+
+    if users:
+        users_text += "<b>ID | Telegram | Баланс | Дата регистрации</b>\n"
+        users_text += "─" * 60 + "\n"
+
+        for user in users:
+            users_text += f"<code>{user['user_id']}</code> | @{user['username'] or 'N/A'} | {user['balance']} токен | {(user['reg_date'] or '')[:10]}\n"
+    else:
+        users_text += "Нет пользователей"
+
+    return users_text
+
+
+@router.callback_query(F.data == "admin_users")
+@router.callback_query(F.data.startswith("au:"))
+async def admin_users(callback: CallbackQuery, state: FSMContext):
+    """Show users list page (keyset pagination, newest first)"""
+    if callback.from_user.id not in ADMIN_IDS:
+        await callback.answer("❌ Доступ запрещён", show_alert=True)
+        return
+
+    logger.info(f"[ADMIN_USERS] 🎯 Загрузка списка пользователей ({callback.data})")
+
+    try:
+        await state.set_state(AdminStates.viewing_users)
+
+        older_than = newer_than = None
+        if callback.data.startswith("au:"):
+            _, direction, raw_cursor = callback.data.split(":", 2)
+            cursor = _decode_user_cursor(raw_cursor)
+            if direction == "n":
+                older_than = cursor
+            else:
+                newer_than = cursor
+
+        # Одна лишняя строка показывает, есть ли страница дальше
+        users = await db.get_users_page(USERS_PAGE_SIZE + 1, older_than=older_than, newer_than=newer_than)
+        if newer_than:
+            has_newer = len(users) > USERS_PAGE_SIZE
+            users = users[-USERS_PAGE_SIZE:]
+            has_older = True
         else:
-            users_text += "Нет пользователей"
+            has_older = len(users) > USERS_PAGE_SIZE
+            users = users[:USERS_PAGE_SIZE]
+            has_newer = older_than is not None
+
+        total_users = (await db.get_dashboard_snapshot()).total_users
+        users_text = format_users_list("СПИСОК ПОЛЬЗОВАТЕЛЕЙ", users, f" (всего {total_users})")
 
         await edit_menu(
             callback=callback,
             message_id=callback.message.message_id,
             text=users_text,
-            keyboard=get_admin_back_keyboard()
+            keyboard=get_users_page_keyboard(users, has_newer, has_older)
         )
 
-        logger.info(f"[ADMIN_USERS] ✅ Список пользователей загружен ({len(users) if users else 0} юзеров)")
+        logger.info(f"[ADMIN_USERS] ✅ Страница пользователей загружена ({len(users)} юзеров)")
 
     except Exception as e:
         logger.error(f"[ADMIN_USERS] ❌ Ошибка при загрузке пользователей: {e}", exc_info=True)
         await callback.answer("❌ Ошибка при загрузке пользователей", show_alert=True)
 
 
+@router.callback_query(F.data == "admin_users_search")
+async def admin_users_search(callback: CallbackQuery, state: FSMContext):
+    """Ask for a user search query"""
+    if callback.from_user.id not in ADMIN_IDS:
+        await callback.answer("❌ Доступ запрещён", show_alert=True)
+        return
+
+    await state.set_state(AdminStates.searching_users)
+    await state.update_data(menu_message_id=callback.message.message_id)
+
+    await edit_menu(
+        callback=callback,
+        message_id=callback.message.message_id,
+        text="🔎 <b>ПОИСК ПОЛЬЗОВАТЕЛЯ</b>\n\nОтправьте ID, @username (или его начало) либо реферальный код.",
+        keyboard=get_users_page_keyboard([], False, False)
+    )
+
+
+@router.message(AdminStates.searching_users, F.text)
+async def admin_users_search_query(message: Message, state: FSMContext):
+    """Show search results in the menu message"""
+    if message.from_user.id not in ADMIN_IDS:
+        return
+
+    query = message.text.strip()
+    data = await state.get_data()
+    menu_message_id = data.get('menu_message_id')
+
+    try:
+        await message.delete()
+    except Exception:
+        pass
+
+    logger.info(f"[ADMIN_USERS] 🔎 Поиск пользователей: {query!r}")
+    users = await db.search_users(query, limit=USERS_PAGE_SIZE)
+    results_text = format_users_list("РЕЗУЛЬТАТЫ ПОИСКА", users, f" «{html.escape(query)}»")
+    results_text += "\n\n<i>Отправьте новый запрос или вернитесь в меню.</i>"
+
+    try:
+        await message.bot.edit_message_text(
+            chat_id=message.chat.id,
+            message_id=menu_message_id,
+            text=results_text,
+            reply_markup=get_users_page_keyboard([], False, False),
+            parse_mode="HTML"
+        )
+    except Exception as e:
+        logger.warning(f"[ADMIN_USERS] ⚠️ Не удалось показать результаты поиска: {e}")
+        menu = await message.answer(results_text, reply_markup=get_users_page_keyboard([], False, False), parse_mode="HTML")
+        await state.update_data(menu_message_id=menu.message_id)
+
+
 # ===== ADMINS MANAGEMENT =====
 @router.callback_query(F.data == "admin_manage_admins")
 async def admin_manage_admins(callback: CallbackQuery, state: FSMContext):
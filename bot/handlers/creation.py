@@ -1,6 +1,5 @@
 # creation
 
-import asyncio
 import logging
 
 from aiogram import Router, F
@@ -21,7 +20,9 @@ from keyboards.inline import (
     get_room_keyboard,
 )
 
-from services.replicate_api import generate_image
+from services.deletion_batcher import deletion_batcher
+from services.generation_queue import generation_queue, get_result_caption
+from services.scheduler import scheduler
 from states.fsm import CreationStates
 from utils.texts import (
     CHOOSE_STYLE_TEXT,
@@ -86,18 +87,11 @@ async def photo_uploaded(message: Message, state: FSMContext, admins: list[int])
     if message.media_group_id:
         data = await state.get_data()
         cached_group_id = data.get('media_group_id')
-        try:
-            await message.delete()
-        except:
-            pass
+        deletion_batcher.add(message.chat.id, message.message_id)
         if cached_group_id != message.media_group_id:
             await state.update_data(media_group_id=message.media_group_id)
             msg = await message.answer(TOO_MANY_PHOTOS_TEXT)
-            await asyncio.sleep(3)
-            try:
-                await msg.delete()
-            except:
-                pass
+            await scheduler.delete_message_later(msg.chat.id, msg.message_id)
         return
     await state.update_data(media_group_id=None)
     photo_file_id = message.photo[-1].file_id
@@ -150,7 +144,7 @@ async def back_to_room_selection(callback: CallbackQuery, state: FSMContext):
 
 
 @router.callback_query(CreationStates.choose_style, F.data.startswith("style_"))
-async def style_chosen(callback: CallbackQuery, state: FSMContext, admins: list[int], bot_token: str):
+async def style_chosen(callback: CallbackQuery, state: FSMContext, admins: list[int]):
     style = callback.data.split("_")[-1]
     user_id = callback.from_user.id
     if user_id not in admins:
@@ -162,34 +156,20 @@ async def style_chosen(callback: CallbackQuery, state: FSMContext, admins: list[
     data = await state.get_data()
     photo_id = data.get('photo_id')
     room = data.get('room')
-    if user_id not in admins:
-        await db.decrease_balance(user_id)
     # Сохраняем ID сообщения о прогрессе
     progress_msg_id = await show_single_menu(callback.message, state, "⏳ Генерирую новый дизайн...", None)
     await callback.answer()
-    result_image_url = await generate_image(photo_id, room, style, bot_token)
-    # Удаляем сообщение о прогрессе после генерации
-    if progress_msg_id:
-        try:
-            await callback.message.bot.delete_message(chat_id=callback.message.chat.id, message_id=progress_msg_id)
-        except Exception as e:
-            logger.debug(f"Не удалось удалить сообщение о прогрессе: {e}")
-
-    if result_image_url:
-        await callback.message.answer_photo(
-            photo=result_image_url,
-            caption=f"✨ Ваш новый дизайн в стиле *{style.replace('_', ' ').title()}*!",
-            parse_mode="Markdown"
-        )
-        # сообщение после генерации дизайна
-        menu = await callback.message.answer(
-            "Что дальше?",
-            reply_markup=get_post_generation_keyboard()
-        )
-        await state.update_data(menu_message_id=menu.message_id)
-    else:
-        await show_single_menu(callback.message, state, "Ошибка генерации. Попробуйте еще раз.",
-                               get_main_menu_keyboard())
+    # Генерация выполняется воркером очереди: он удалит сообщение о прогрессе,
+    # отправит результат или вернёт токен при окончательной ошибке
+    await generation_queue.enqueue(
+        user_id=user_id,
+        chat_id=callback.message.chat.id,
+        photo_id=photo_id,
+        room=room,
+        style=style,
+        progress_message_id=progress_msg_id,
+        charge=user_id not in admins,
+    )
 
 
 @router.callback_query(F.data == "change_style")
@@ -206,6 +186,34 @@ async def change_style_after_gen(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
+@router.callback_query(F.data == "show_last_design")
+async def show_last_design(callback: CallbackQuery, state: FSMContext):
+    """Повторно отправить последний результат по Telegram file_id (без запроса к Replicate)"""
+    job = await db.get_last_generation(callback.from_user.id)
+    if not job:
+        await callback.answer("Генераций пока нет", show_alert=True)
+        return
+
+    photo = job.get('result_file_id') or job.get('result_url')
+    try:
+        await callback.message.answer_photo(
+            photo=photo,
+            caption=get_result_caption(job['style']),
+            parse_mode="Markdown"
+        )
+    except TelegramBadRequest as e:
+        logger.warning(f"Не удалось повторно отправить генерацию {job['id']}: {e}")
+        await callback.answer("Изображение больше недоступно", show_alert=True)
+        return
+
+    menu = await callback.message.answer(
+        "Что дальше?",
+        reply_markup=get_post_generation_keyboard()
+    )
+    await state.update_data(menu_message_id=menu.message_id)
+    await callback.answer()
+
+
 @router.callback_query(F.data == "show_profile")
 async def show_profile_handler(callback: CallbackQuery, state: FSMContext):
     user_id = callback.from_user.id
@@ -223,53 +231,30 @@ async def show_profile_handler(callback: CallbackQuery, state: FSMContext):
 
 @router.message(CreationStates.waiting_for_photo)
 async def invalid_photo(message: Message):
-    try:
-        await message.delete()
-    except:
-        pass
+    deletion_batcher.add(message.chat.id, message.message_id)
 
 
 @router.message(CreationStates.choose_room)
 async def block_messages_in_choose_room(message: Message, state: FSMContext):
-    try:
-        await message.delete()
-    except:
-        pass
+    deletion_batcher.add(message.chat.id, message.message_id)
     await state.clear()
     await state.set_state(CreationStates.waiting_for_photo)
     msg = await message.answer("🚫 Используйте кнопки! Начните заново, отправив фото.", parse_mode=ParseMode.MARKDOWN)
-    await asyncio.sleep(3)
-    try:
-        await msg.delete()
-    except:
-        pass
+    await scheduler.delete_message_later(msg.chat.id, msg.message_id)
 
 
 @router.message(F.video | F.video_note | F.document | F.sticker | F.audio | F.voice | F.animation)
 async def block_media_types(message: Message):
-    try:
-        await message.delete()
-    except:
-        pass
+    deletion_batcher.add(message.chat.id, message.message_id)
 
 
 @router.message(F.photo)
 async def block_unexpected_photos(message: Message, state: FSMContext):
-    try:
-        await message.delete()
-    except:
-        pass
+    deletion_batcher.add(message.chat.id, message.message_id)
     msg = await message.answer("🚫 Используйте кнопки меню!")
-    await asyncio.sleep(3)
-    try:
-        await msg.delete()
-    except:
-        pass
+    await scheduler.delete_message_later(msg.chat.id, msg.message_id)
 
 
 @router.message(F.text)
 async def block_all_text_messages(message: Message):
-    try:
-        await message.delete()
-    except:
-        pass
+    deletion_batcher.add(message.chat.id, message.message_id)
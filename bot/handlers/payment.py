@@ -1,6 +1,8 @@
 # payment
 
 import logging
+from typing import Any, Dict, Optional
+
 from aiogram import Router, F
 from aiogram.types import CallbackQuery, Message
 from aiogram.utils.keyboard import InlineKeyboardBuilder
@@ -18,13 +20,7 @@ async def _convert_earnings_to_tokens(earnings_rub: int) -> int:
     Конвертирует реферальное вознаграждение в рублях в генерации.
     Курс из settings: referral_exchange_rate (руб за 1 генерацию). Дефолт 29.
     """
-    try:
-        rate_raw = await db.get_setting("referral_exchange_rate")
-        rate = int(rate_raw) if rate_raw else 29
-        if rate <= 0:
-            rate = 29
-    except Exception:
-        rate = 29
+    rate = db.settings.referral_exchange_rate
 
     tokens = earnings_rub // rate
     if tokens < 1 and earnings_rub > 0:
@@ -42,8 +38,7 @@ async def _process_referral_commission(user_id: int, payment_id: str, amount: in
     """
     try:
         # 1. Проверяем включена ли программа
-        enabled = await db.get_setting("referral_enabled")
-        if str(enabled or "1") != "1":
+        if not db.settings.referral_enabled:
             logger.info(f"[REFERRAL] Программа отключена, пропускаем")
             return
 
@@ -59,8 +54,7 @@ async def _process_referral_commission(user_id: int, payment_id: str, amount: in
             return
 
         # 3. Получаем % комиссии
-        percent_raw = await db.get_setting("referral_commission_percent")
-        commission_percent = int(percent_raw) if percent_raw is not None else 10
+        commission_percent = db.settings.referral_commission_percent
         if commission_percent <= 0:
             logger.info(f"[REFERRAL] Комиссия 0%, пропускаем")
             return
@@ -101,6 +95,28 @@ async def _process_referral_commission(user_id: int, payment_id: str, amount: in
         logger.error(f"[REFERRAL] ❌ Ошибка при начислении комиссии: {e}", exc_info=True)
 
 
+async def apply_successful_payment(payment_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Зачислить оплаченный платёж: токены покупателю и комиссия рефереру.
+
+    Общая точка для ручной проверки и webhook YooKassa. Идемпотентна:
+    если платёж уже зачислен, возвращает None и ничего не начисляет.
+    """
+    payment = await db.mark_payment_succeeded(payment_id)
+    if not payment:
+        logger.info(f"Платёж {payment_id} уже обработан или не найден")
+        return None
+
+    logger.info(f"Платёж {payment_id}: +{payment['tokens']} токенов пользователю {payment['user_id']}")
+    await _process_referral_commission(
+        user_id=payment['user_id'],
+        payment_id=payment_id,
+        amount=payment['amount'],
+        purchased_tokens=payment['tokens']
+    )
+    return payment
+
+
 @router.callback_query(F.data == "buy_generations")
 async def show_packages(callback: CallbackQuery):
     """Показать пакеты генераций с возвратом к главному меню"""
@@ -158,18 +174,9 @@ async def check_payment(callback: CallbackQuery):
     is_paid = find_payment(last_payment['yookassa_payment_id'])
     
     if is_paid:
-        # ✅ НАЧИСЛЯЕМ ТОКЕНЫ ПОКУПАТЕЛЮ
-        await db.set_payment_success(last_payment['yookassa_payment_id'])
-        await db.add_tokens(user_id, last_payment['tokens'])
-        
-        # ✅ НОВОЕ: НАЧИСЛЯЕМ КОМИССИЮ РЕФЕРЕРУ
-        await _process_referral_commission(
-            user_id=user_id,
-            payment_id=last_payment['yookassa_payment_id'],
-            amount=last_payment['amount'],
-            purchased_tokens=last_payment['tokens']
-        )
-        
+        # ✅ ТОКЕНЫ ПОКУПАТЕЛЮ + КОМИССИЯ РЕФЕРЕРУ (если webhook ещё не зачислил)
+        await apply_successful_payment(last_payment['yookassa_payment_id'])
+
         await callback.message.edit_text(
             PAYMENT_SUCCESS_TEXT.format(balance=await db.get_balance(user_id)),
             reply_markup=get_main_menu_keyboard()
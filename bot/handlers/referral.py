@@ -69,7 +69,7 @@ async def exchange_to_tokens(callback: CallbackQuery, state: FSMContext):
     user_id = callback.from_user.id
     
     balance = await db.get_referral_balance(user_id)
-    exchange_rate = int(await db.get_setting("referral_exchange_rate") or "29")
+    exchange_rate = db.settings.referral_exchange_rate
     
     max_tokens = balance // exchange_rate
     
@@ -100,7 +100,7 @@ async def process_exchange_amount(message: Message, state: FSMContext):
     user_id = message.from_user.id
     
     balance = await db.get_referral_balance(user_id)
-    exchange_rate = int(await db.get_setting("referral_exchange_rate") or "29")
+    exchange_rate = db.settings.referral_exchange_rate
     max_tokens = balance // exchange_rate
     
     # Парсим количество
@@ -160,7 +160,7 @@ async def confirm_exchange(callback: CallbackQuery):
     tokens = int(callback.data.split("_")[-1])
     
     balance = await db.get_referral_balance(user_id)
-    exchange_rate = int(await db.get_setting("referral_exchange_rate") or "29")
+    exchange_rate = db.settings.referral_exchange_rate
     cost = tokens * exchange_rate
     
     # Финальная проверка
@@ -199,7 +199,7 @@ async def request_payout(callback: CallbackQuery, state: FSMContext):
     user_id = callback.from_user.id
     
     balance = await db.get_referral_balance(user_id)
-    min_payout = int(await db.get_setting("referral_min_payout") or "500")
+    min_payout = db.settings.referral_min_payout
     
     if balance < min_payout:
         await callback.answer(
@@ -236,7 +236,7 @@ async def process_payout_amount(message: Message, state: FSMContext):
     user_id = message.from_user.id
     
     balance = await db.get_referral_balance(user_id)
-    min_payout = int(await db.get_setting("referral_min_payout") or "500")
+    min_payout = db.settings.referral_min_payout
     
     # Парсим сумму
     if message.text == "/all":
@@ -84,6 +84,9 @@ async def start_command(message: Message, state: FSMContext):
     await db.create_user(user_id, message.from_user.username or "Unknown", referrer_code)
     logger.info(f"[START] ✅ Пользователь создан/проверен")
 
+    # Пользователь снова пишет боту — возвращаем его в рассылки
+    await db.mark_user_unblocked(user_id)
+
     await state.clear()
     logger.info(f"[START] ✅ State очищена")
 
@@ -336,22 +339,17 @@ async def profile_callback(callback: CallbackQuery, state: FSMContext):
     user_id = callback.from_user.id
     username = callback.from_user.username or "Не указано"
 
-    # Получаем баланс пользователя
-    balance = await db.get_balance(user_id)
+    # Баланс и реферальные данные — одним запросом, % комиссии — из снимка настроек
+    profile = await db.get_profile_snapshot(user_id) or {}
+    balance = profile.get('balance', 0)
     logger.info(f"[PROFILE] ✅ Баланс: {balance}")
 
-    # ✅ ПОЛУЧАЕМ РЕФЕРАЛЬНУЮ ИНФОРМАЦИЮ
-    user_data = await db.get_user(user_id)
-    referral_code = user_data.get('referral_code', '')
-    referrals_count = user_data.get('referrals_count', 0)
-    
-    # Получаем реферальный баланс (используем COALESCE в запросе)
-    referral_balance = await db.get_referral_balance(user_id)
-    total_earned = user_data.get('referral_total_earned', 0) or 0
-    total_paid = user_data.get('referral_total_paid', 0) or 0
-    
-    # Получаем % комиссии из настроек
-    commission_percent = await db.get_setting("referral_commission_percent") or "10"
+    referral_code = profile.get('referral_code') or ''
+    referrals_count = profile.get('referrals_count', 0)
+    referral_balance = profile.get('referral_balance', 0)
+    total_earned = profile.get('referral_total_earned', 0)
+    total_paid = profile.get('referral_total_paid', 0)
+    commission_percent = db.settings.referral_commission_percent
     
     # Формируем реферальную ссылку
     bot_username = config.BOT_USERNAME.replace('@', '')  # Убираем @ если есть
@@ -1,32 +1,81 @@
-# webhook
+# bot/handlers/webhook.py
 
-from aiogram import Router, Request
-from aiogram.types import Update
+import asyncio
+import hmac
+import logging
+
+from aiohttp import web
+from aiogram import Bot
+
+from config import config
+from handlers.payment import apply_successful_payment
+from keyboards.inline import get_main_menu_keyboard
 from services.payment_api import find_payment
 from database.db import db
+from utils.texts import PAYMENT_SUCCESS_TEXT
+
+logger = logging.getLogger(__name__)
+
+
+def _check_secret(request: web.Request) -> bool:
+    """Проверка секрета из URL уведомления (?token=...), если он задан"""
+    secret = config.YOOKASSA_WEBHOOK_SECRET
+    if not secret:
+        return True
+    return hmac.compare_digest(request.query.get('token', ''), secret)
 
-router = Router()
 
+async def yookassa_webhook(request: web.Request) -> web.Response:
+    """
+    Обработчик уведомлений YooKassa.
 
-@router.post("/webhook/yookassa")
-async def yookassa_webhook(request: Request):
-    """Обработчик webhook от YooKassa"""
-    data = await request.json()
+    Тело уведомления не считается доверенным: статус платежа перепроверяется
+    через API, а зачисление идемпотентно (повторные уведомления игнорируются).
+    На любой корректный запрос отвечаем 200, иначе YooKassa будет повторять.
+    """
+    if not _check_secret(request):
+        logger.warning(f"YooKassa webhook: неверный токен от {request.remote}")
+        return web.Response(status=403)
 
-    # Парсим платеж
-    payment_data = data.get('object', {})
+    try:
+        data = await request.json()
+    except ValueError:
+        return web.Response(status=400)
+
+    payment_data = data.get('object') or {}
     payment_id = payment_data.get('id')
-    status = payment_data.get('status')
-    metadata = payment_data.get('metadata', {})
+    event = data.get('event')
+    logger.info(f"YooKassa webhook: {event} {payment_id}")
+
+    if event != 'payment.succeeded' or not payment_id:
+        return web.json_response({"status": "ok"})
+
+    # find_payment синхронный (SDK YooKassa) — не блокируем event loop
+    loop = asyncio.get_running_loop()
+    payment = await loop.run_in_executor(None, find_payment, payment_id)
+    if not payment or payment.get('status') != 'succeeded':
+        logger.warning(f"YooKassa webhook: платёж {payment_id} не подтверждён API")
+        return web.json_response({"status": "ok"})
+
+    applied = await apply_successful_payment(payment_id)
+    if applied:
+        await _notify_user(request.app['bot'], applied['user_id'])
+
+    return web.json_response({"status": "ok"})
 
-    if status == 'succeeded':
-        user_id = int(metadata.get('user_id'))
-        tokens = int(metadata.get('tokens'))
 
-        # Обновляем статус платежа
-        await db.update_payment_status(payment_id, 'succeeded')
+async def _notify_user(bot: Bot, user_id: int):
+    try:
+        await bot.send_message(
+            chat_id=user_id,
+            text=PAYMENT_SUCCESS_TEXT.format(balance=await db.get_balance(user_id)),
+            reply_markup=get_main_menu_keyboard()
+        )
+    except Exception as e:
+        logger.warning(f"Не удалось уведомить {user_id} об оплате: {e}")
 
-        # Добавляем токены юзеру
-        await db.add_tokens(user_id, tokens)
 
-    return {"status": "ok"}
+def setup_webhook_routes(app: web.Application, bot: Bot):
+    """Зарегистрировать платёжные webhook-маршруты в aiohttp-приложении"""
+    app['bot'] = bot
+    app.router.add_post(config.YOOKASSA_WEBHOOK_PATH, yookassa_webhook)
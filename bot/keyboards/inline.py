@@ -196,6 +196,9 @@ def get_post_generation_keyboard() -> InlineKeyboardMarkup:
     builder.row(
         InlineKeyboardButton(text="🎨 Другой стиль", callback_data="change_style")
     )
+    builder.row(
+        InlineKeyboardButton(text="🔁 Показать снова", callback_data="show_last_design")
+    )
     builder.row(
         InlineKeyboardButton(text="🏠 Главное меню", callback_data="main_menu")
     )
@@ -304,4 +307,11 @@ def get_room_keyboard() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
-
+def get_broadcast_progress_keyboard(broadcast_id: int, running: bool = True):
+    """Кнопки экрана прогресса рассылки"""
+    builder = InlineKeyboardBuilder()
+    if running:
+        builder.row(InlineKeyboardButton(text="🔄 Обновить", callback_data=f"admin_broadcast_progress_{broadcast_id}"))
+        builder.row(InlineKeyboardButton(text="⛔ Остановить", callback_data=f"admin_broadcast_cancel_{broadcast_id}"))
+    builder.row(InlineKeyboardButton(text="⬅️ Назад в админ меню", callback_data="admin_menu"))
+    return builder.as_markup()
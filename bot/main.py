@@ -5,24 +5,40 @@ import os
 import sys
 import asyncio
 import logging
+import multiprocessing
 from dotenv import load_dotenv
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 load_dotenv()
 
+from aiohttp import web
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 from aiogram.types import Update
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 
 from config import config, ADMIN_IDS
 from database.db import db
+from database.fsm_storage import create_fsm_storage
+from services.analytics import analytics
+from services.broadcast import broadcast_service
+from services.deletion_batcher import deletion_batcher
+from services.scheduler import scheduler
+from services.settings_watcher import settings_watcher
+from services.generation_queue import generation_queue
+from services.http_client import http_client
+from services.image_preprocess import shutdown_preprocess_pool
 
 from handlers import user_start, payment, admin
 from handlers import creation
 from handlers import design_step1_furniture
 from handlers import design_step2_colors
 from handlers import referral  # ✅ НОВЫЙ ИМПОРТ
+from handlers.webhook import setup_webhook_routes
+from middlewares.antiflood import antiflood
+from middlewares.fsm_cache import FSMCacheMiddleware
+from middlewares.outbound_limiter import outbound_limiter
 
 # ===== ЛОГИРОВАНИЕ БЕЗ ЭМОДЖИ =====
 logging.basicConfig(
@@ -46,13 +62,68 @@ async def handle_errors(update: Update, exception: Exception):
     logger.critical(f"ERROR: {type(exception).__name__}: {str(exception)}", exc_info=True)
 
 
-async def main():
-    """Главная функция"""
+async def run_polling(dp: Dispatcher):
+    """Long polling (локальная разработка)"""
+    # getUpdates не работает, пока установлен webhook
+    await bot.delete_webhook(drop_pending_updates=False)
+    await dp.start_polling(bot)
+
+
+async def run_webhook(dp: Dispatcher, worker_index: int = 0):
+    """
+    Webhook: одно aiohttp-приложение принимает обновления Telegram
+    (с проверкой X-Telegram-Bot-Api-Secret-Token) и уведомления YooKassa.
+
+    При BOT_WORKERS > 1 все процессы слушают один порт (SO_REUSEPORT),
+    ядро распределяет соединения между ними; webhook ставит только процесс 0.
+    """
+    if not config.WEBHOOK_BASE_URL:
+        raise RuntimeError("WEBHOOK_BASE_URL is required in webhook mode")
+    if not config.WEBHOOK_SECRET:
+        logger.warning("WEBHOOK_SECRET is not set - Telegram updates are not verified")
+
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=config.WEBHOOK_SECRET,
+    ).register(app, path=config.WEBHOOK_PATH)
+    setup_webhook_routes(app, bot)
+    setup_application(app, dp, bot=bot)
+
+    if worker_index == 0:
+        webhook_url = f"{config.WEBHOOK_BASE_URL}{config.WEBHOOK_PATH}"
+        await bot.set_webhook(
+            url=webhook_url,
+            secret_token=config.WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+        logger.info(f"Webhook set: {webhook_url}")
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        site = web.TCPSite(
+            runner,
+            host=config.WEBAPP_HOST,
+            port=config.WEBAPP_PORT,
+            reuse_port=config.BOT_PROCESSES > 1,
+        )
+        await site.start()
+        logger.info(f"Webhook server listening on {config.WEBAPP_HOST}:{config.WEBAPP_PORT} (worker {worker_index})")
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+async def main(worker_index: int = 0):
+    """Главная функция (worker_index — номер процесса при BOT_WORKERS > 1)"""
 
     logger.info("=" * 60)
-    logger.info("BOT START")
+    logger.info(f"BOT START (worker {worker_index})")
     logger.info("=" * 60)
 
+    dp = None
     try:
         logger.info("Initializing database...")
         await db.init_db()
@@ -60,15 +131,24 @@ async def main():
         logger.info("Database initialized")
 
         logger.info("Creating dispatcher...")
-        dp = Dispatcher()
+        # FSMContextMiddleware регистрируется вручную после антифлуда:
+        # отброшенный апдейт не читает хранилище состояний
+        dp = Dispatcher(storage=create_fsm_storage(), disable_fsm=True)
+        logger.info(f"FSM storage: {type(dp.storage).__name__}")
+        dp.update.outer_middleware(antiflood)
+        dp.update.outer_middleware(dp.fsm)
+        # Одно чтение и одна запись FSM на апдейт (после FSMContextMiddleware)
+        dp.update.outer_middleware(FSMCacheMiddleware())
         logger.info("Dispatcher created")
 
         logger.info("Registering routers...")
+        # admin до creation: иначе общий обработчик текста в creation
+        # перехватывает ввод текста рассылки
         routers = [
             ("user_start", user_start.router),
+            ("admin", admin.router),
             ("creation", creation.router),
             ("payment", payment.router),
-            ("admin", admin.router),
             ("design_step1_furniture", design_step1_furniture.router),
             ("design_step2_colors", design_step2_colors.router),
             ("referral", referral.router),  # ✅ НОВЫЙ ROUTER
@@ -83,6 +163,37 @@ async def main():
 
         logger.info("All routers registered")
 
+        # Все исходящие запросы к Bot API идут через общий планировщик лимитов
+        bot.session.middleware(outbound_limiter)
+
+        logger.info("Starting HTTP client...")
+        await http_client.start()
+        logger.info("HTTP client started")
+
+        logger.info("Starting analytics writer...")
+        await analytics.start()
+        logger.info("Analytics writer started")
+
+        logger.info("Starting generation queue...")
+        await generation_queue.start(bot, dp.storage, worker_id=f"{config.WORKER_ID}:{worker_index}")
+        logger.info("Generation queue started")
+
+        logger.info("Starting settings watcher...")
+        await settings_watcher.start()
+        logger.info("Settings watcher started")
+
+        logger.info("Starting deletion batcher...")
+        await deletion_batcher.start(bot)
+        logger.info("Deletion batcher started")
+
+        logger.info("Starting scheduler...")
+        await scheduler.start(bot)
+        logger.info("Scheduler started")
+
+        logger.info("Starting broadcast service...")
+        await broadcast_service.start(bot, worker_id=f"{config.WORKER_ID}:{worker_index}")
+        logger.info("Broadcast service started")
+
         logger.info("Setting context...")
         dp["admins"] = ADMIN_IDS
         dp["bot_token"] = config.BOT_TOKEN
@@ -100,22 +211,103 @@ async def main():
         logger.info("BOT READY TO WORK")
         logger.info("=" * 60)
 
-        await dp.start_polling(bot)
+        if config.DELIVERY_MODE == "webhook":
+            logger.info("Delivery mode: webhook")
+            await run_webhook(dp, worker_index)
+        else:
+            logger.info("Delivery mode: polling")
+            await run_polling(dp)
 
     except Exception as e:
         logger.critical(f"CRITICAL ERROR: {type(e).__name__}: {str(e)}", exc_info=True)
         raise
 
     finally:
+        logger.info("Stopping generation queue...")
+        await generation_queue.stop()
+        logger.info("Generation queue stopped")
+
+        logger.info("Stopping scheduler...")
+        await scheduler.stop()
+        logger.info("Scheduler stopped")
+
+        logger.info("Stopping broadcast service...")
+        await broadcast_service.stop()
+        logger.info("Broadcast service stopped")
+
+        # После планировщика: дослать удаления, которые он успел поставить
+        logger.info("Stopping deletion batcher...")
+        await deletion_batcher.stop()
+        logger.info("Deletion batcher stopped")
+
+        # После очереди генераций: дописать события, которые она успела записать
+        logger.info("Stopping analytics writer...")
+        await analytics.stop()
+        logger.info("Analytics writer stopped")
+
+        logger.info("Stopping settings watcher...")
+        await settings_watcher.stop()
+        logger.info("Settings watcher stopped")
+
+        shutdown_preprocess_pool()
+
+        logger.info("Closing HTTP client...")
+        await http_client.close()
+        logger.info("HTTP client closed")
+
+        if dp is not None:
+            logger.info("Closing FSM storage...")
+            await dp.storage.close()
+            logger.info("FSM storage closed")
+
         logger.info("Closing bot connection...")
         await bot.session.close()
         logger.info("Connection closed")
 
+        logger.info("Closing database pool...")
+        await db.close()
+        logger.info("Database pool closed")
 
-if __name__ == "__main__":
+
+def run_worker(worker_index: int = 0):
+    """Точка входа процесса бота"""
     try:
-        asyncio.run(main())
+        asyncio.run(main(worker_index))
     except KeyboardInterrupt:
-        logger.info("BOT STOPPED BY USER")
+        logger.info(f"BOT STOPPED BY USER (worker {worker_index})")
     except Exception as e:
         logger.critical(f"UNEXPECTED ERROR: {e}", exc_info=True)
+
+
+def run_workers(count: int):
+    """
+    Запустить count процессов бота. Общее состояние (FSM, очередь генераций,
+    платежи) живёт в SQLite, поэтому процессы можно перезапускать по одному.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    processes = [
+        ctx.Process(target=run_worker, args=(index,), name=f"bot-worker-{index}")
+        for index in range(count)
+    ]
+    for process in processes:
+        process.start()
+    logger.info(f"Started {count} bot workers")
+
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        logger.info("BOT STOPPED BY USER")
+        for process in processes:
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
+
+
+if __name__ == "__main__":
+    if config.BOT_PROCESSES > 1:
+        run_workers(config.BOT_PROCESSES)
+    else:
+        if config.BOT_WORKERS > 1:
+            logger.warning("BOT_WORKERS > 1 requires DELIVERY_MODE=webhook, starting a single process")
+        run_worker()
@@ -0,0 +1,111 @@
+# bot/middlewares/antiflood.py
+
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message, TelegramObject, Update
+
+from config import ADMIN_IDS, config
+from services.deletion_batcher import deletion_batcher
+from utils.token_bucket import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class AntiFloodMiddleware(BaseMiddleware):
+    """
+    Ограничение входящих апдейтов на пользователя (outer-middleware на dp.update).
+
+    Стоит до FSM: лишний апдейт отбрасывается, не доходя ни до хранилища
+    состояний, ни до роутеров. Лишние сообщения удаляются пачками через
+    DeletionBatcher, лишние нажатия кнопок просто игнорируются (без ответа:
+    ответ — это ещё один запрос к API).
+
+    Лимиты задаются по типу апдейта: {'message': (rate, burst), ...};
+    'default' — для остальных типов, rate 0 — без ограничения.
+
+    Корзины хранятся в памяти процесса (не в общем хранилище): при
+    BOT_PROCESSES > 1 лимит действует на процесс.
+    """
+
+    def __init__(self, limits: Dict[str, Tuple[float, int]], exempt: Iterable[int] = (),
+                 max_users: int = 10000):
+        self.limits = limits
+        self.exempt = set(exempt)
+        self.max_users = max_users
+
+        # Порядок — от давно не использованных к недавним (вытеснение LRU)
+        self._buckets: "OrderedDict[Tuple[int, str], TokenBucket]" = OrderedDict()
+        # Пользователи, о которых уже написали в лог в текущем всплеске
+        self._reported: Dict[int, float] = {}
+
+        self.stats = {'passed': 0, 'dropped': 0, 'dropped_messages': 0}
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        event_context = data.get("event_context")
+        user_id = event_context.user_id if event_context else None
+        if user_id is None or user_id in self.exempt or not isinstance(event, Update):
+            return await handler(event, data)
+
+        event_type = event.event_type
+        bucket = self._bucket(user_id, event_type)
+        now = time.monotonic()
+        if bucket is None or bucket.try_acquire(now):
+            self.stats['passed'] += 1
+            return await handler(event, data)
+
+        self._drop(user_id, event_type, event.event, now)
+        return None
+
+    def _bucket(self, user_id: int, event_type: str) -> Optional[TokenBucket]:
+        key = (user_id, event_type)
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            self._buckets.move_to_end(key)
+        else:
+            rate, burst = self.limits.get(event_type, self.limits.get('default', (0, 0)))
+            if rate <= 0:
+                return None
+            if len(self._buckets) >= self.max_users:
+                self._evict_idle()
+            bucket = TokenBucket(rate, burst)
+            self._buckets[key] = bucket
+        return bucket
+
+    def _evict_idle(self):
+        """
+        Убрать полностью восстановившиеся корзины; если их не хватило
+        (устойчивый поток от многих пользователей) — давно не использованные,
+        чтобы число корзин не превышало max_users.
+        """
+        now = time.monotonic()
+        idle = [key for key, bucket in self._buckets.items() if bucket.tat <= now]
+        for key in idle:
+            del self._buckets[key]
+        while len(self._buckets) >= self.max_users:
+            self._buckets.popitem(last=False)
+        self._reported = {user_id: at for user_id, at in self._reported.items() if now - at < 60}
+
+    def _drop(self, user_id: int, event_type: str, event: TelegramObject, now: float):
+        self.stats['dropped'] += 1
+        if isinstance(event, Message) and event.chat.type == "private":
+            deletion_batcher.add(event.chat.id, event.message_id)
+            self.stats['dropped_messages'] += 1
+
+        if now - self._reported.get(user_id, 0.0) >= 60:
+            self._reported[user_id] = now
+            logger.warning(f"⚠️ Антифлуд: пользователь {user_id} превысил лимит ({event_type}), апдейты отбрасываются")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, 'tracked_users': len(self._buckets)}
+
+
+antiflood = AntiFloodMiddleware(config.ANTIFLOOD_LIMITS, exempt=ADMIN_IDS)
@@ -0,0 +1,171 @@
+# bot/middlewares/fsm_cache.py
+
+import asyncio
+import logging
+import weakref
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.types import TelegramObject
+
+logger = logging.getLogger(__name__)
+
+_NOT_LOADED = object()
+
+# Блокировки записи FSM по ключу (в пределах процесса): их берут flush()
+# апдейта и фоновые задачи, меняющие данные пользователя вне хэндлера
+_locks: "weakref.WeakValueDictionary[StorageKey, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def fsm_lock(key: StorageKey) -> asyncio.Lock:
+    lock = _locks.get(key)
+    if lock is None:
+        lock = asyncio.Lock()
+        _locks[key] = lock
+    return lock
+
+
+async def update_fsm_data(storage: BaseStorage, key: StorageKey, **kwargs: Any) -> Dict[str, Any]:
+    """
+    Обновить данные FSM вне хэндлера (очередь генераций и т.п.).
+
+    Пишет под той же блокировкой, что и CachedFSMContext.flush(), поэтому
+    апдейт пользователя, обрабатываемый в этот момент, не перетрёт изменение
+    своей копией данных: flush() сливает только ключи, изменённые в хэндлере.
+    """
+    async with fsm_lock(key):
+        data = await storage.get_data(key=key)
+        data.update(kwargs)
+        await storage.set_data(key=key, data=data)
+        return data
+
+
+class CachedFSMContext(FSMContext):
+    """
+    FSMContext, который читает хранилище не больше одного раза за апдейт.
+
+    Состояние и данные загружаются при первом обращении, все изменения
+    (set_state, update_data, clear) делаются в памяти, а в хранилище
+    пишутся одним flush() в конце обработки апдейта.
+
+    Данные при flush() сливаются с текущими в хранилище: пишутся только
+    ключи, изменённые или удалённые хэндлером относительно прочитанной
+    копии, — изменения, сделанные за это время другими (update_fsm_data),
+    сохраняются. set_data() без предварительного чтения заменяет данные целиком.
+    """
+
+    def __init__(self, storage: BaseStorage, key: StorageKey, state: Any = _NOT_LOADED):
+        super().__init__(storage=storage, key=key)
+        self._state = state
+        self._data: Any = _NOT_LOADED
+        # Данные в том виде, в каком прочитаны из хранилища (база для слияния)
+        self._loaded: Any = _NOT_LOADED
+        self._state_dirty = False
+        self._data_dirty = False
+
+    async def set_state(self, state: StateType = None) -> None:
+        self._state = state.state if isinstance(state, State) else state
+        self._state_dirty = True
+
+    async def get_state(self) -> Optional[str]:
+        if self._state is _NOT_LOADED:
+            self._state = await self.storage.get_state(key=self.key)
+        return self._state
+
+    async def set_data(self, data: Dict[str, Any]) -> None:
+        self._data = dict(data)
+        self._data_dirty = True
+
+    async def get_data(self) -> Dict[str, Any]:
+        return dict(await self._load_data())
+
+    async def get_value(self, key: str, default: Optional[Any] = None) -> Optional[Any]:
+        return (await self._load_data()).get(key, default)
+
+    async def update_data(self, data: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Dict[str, Any]:
+        current = await self._load_data()
+        if data:
+            current.update(data)
+        current.update(kwargs)
+        self._data_dirty = True
+        return dict(current)
+
+    async def clear(self) -> None:
+        await self.set_state(state=None)
+        await self.set_data({})
+
+    async def _load_data(self) -> Dict[str, Any]:
+        if self._data is _NOT_LOADED:
+            self._data = await self.storage.get_data(key=self.key)
+            self._loaded = dict(self._data)
+        return self._data
+
+    async def flush(self) -> int:
+        """Записать изменения в хранилище. Возвращает число операций записи"""
+        writes = 0
+        if self._state_dirty:
+            await self.storage.set_state(key=self.key, state=self._state)
+            self._state_dirty = False
+            writes += 1
+        if self._data_dirty:
+            async with fsm_lock(self.key):
+                data = await self._merged_data()
+                if data is not None:
+                    await self.storage.set_data(key=self.key, data=data)
+                    writes += 1
+            self._data_dirty = False
+        return writes
+
+    async def _merged_data(self) -> Optional[Dict[str, Any]]:
+        """Данные для записи; None — в хранилище уже то же самое"""
+        if self._loaded is _NOT_LOADED:
+            return self._data
+
+        current = await self.storage.get_data(key=self.key)
+        merged = dict(current)
+        for name, value in self._data.items():
+            if name not in self._loaded or self._loaded[name] != value:
+                merged[name] = value
+        for name in self._loaded:
+            if name not in self._data:
+                merged.pop(name, None)
+        return merged if merged != current else None
+
+
+class FSMCacheMiddleware(BaseMiddleware):
+    """
+    Подменяет FSMContext апдейта на CachedFSMContext.
+
+    Регистрируется как outer-middleware на dp.update после встроенного
+    FSMContextMiddleware: тот уже прочитал raw_state для фильтров,
+    это значение переиспользуется без повторного чтения.
+    """
+
+    def __init__(self):
+        self.stats = {'updates': 0, 'writes': 0}
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        state: Optional[FSMContext] = data.get("state")
+        if state is None:
+            return await handler(event, data)
+
+        cached = CachedFSMContext(state.storage, state.key, data.get("raw_state", _NOT_LOADED))
+        data["state"] = cached
+        try:
+            return await handler(event, data)
+        finally:
+            # Пишем и при ошибке хэндлера: изменения до ошибки не должны теряться,
+            # как и без кэша
+            try:
+                self.stats['writes'] += await cached.flush()
+            except Exception as e:
+                logger.error(f"❌ Не удалось сохранить FSM для {state.key.user_id}: {e}", exc_info=True)
+            self.stats['updates'] += 1
@@ -0,0 +1,187 @@
+# bot/middlewares/outbound_limiter.py
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from config import config
+from utils.token_bucket import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты исходящих запросов: меньше — раньше
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+outbound_priority: ContextVar[int] = ContextVar("outbound_priority", default=PRIORITY_INTERACTIVE)
+
+# Методы, на которые действуют лимиты Telegram на отправку сообщений
+_LIMITED_PREFIXES = ("send", "edit", "copy", "forward", "delete")
+
+
+@contextmanager
+def bulk_priority():
+    """
+    Запросы внутри блока (и в созданных в нём задачах) уступают
+    интерактивным ответам пользователям. Для рассылок.
+    """
+    token = outbound_priority.set(PRIORITY_BULK)
+    try:
+        yield
+    finally:
+        outbound_priority.reset(token)
+
+
+class OutboundLimiter(BaseRequestMiddleware):
+    """
+    Планировщик исходящих запросов к Bot API (middleware сессии Bot).
+
+    - Общий лимит (~30 сообщений/с на бота) делится между процессами (BOT_PROCESSES).
+    - Лимит на чат: личные чаты ~1 сообщение/с, группы ~20 в минуту.
+      Корзины чатов живут в памяти процесса, а не в общем хранилище:
+      при нескольких процессах чат может получить до BOT_PROCESSES × лимит,
+      превышение ловит обработка 429 ниже.
+    - Общий лимит раздаётся по приоритету: интерактивные ответы раньше
+      рассылок (bulk_priority()).
+    - При 429 запрос ждёт retry_after и повторяется, чат ставится на паузу.
+    """
+
+    def __init__(self, global_rate: float = 30.0, private_rate: float = 1.0, group_rate: float = 20 / 60,
+                 chat_burst: int = 3, max_retries: int = 3, max_chats: int = 10000):
+        self.global_bucket = TokenBucket(global_rate, burst=max(1, int(global_rate)))
+        self.private_rate = private_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+
+        self._chats: Dict[Any, TokenBucket] = {}
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+        self.stats = {
+            'requests': 0,
+            'throttled': 0,
+            'retry_after': 0,
+            'wait_total': 0.0,
+            'wait_max': 0.0,
+        }
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        if not method.__api_method__.startswith(_LIMITED_PREFIXES):
+            return await make_request(bot, method)
+
+        chat_id = getattr(method, "chat_id", None)
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(chat_id)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.stats['retry_after'] += 1
+                if attempt >= self.max_retries:
+                    raise
+                logger.warning(f"⚠️ 429 {method.__api_method__} chat={chat_id}: retry after {e.retry_after}s")
+                now = time.monotonic()
+                if chat_id is not None:
+                    self._chat_bucket(chat_id).pause(now, e.retry_after)
+                else:
+                    self.global_bucket.pause(now, e.retry_after)
+
+    # ===== ОЖИДАНИЕ СЛОТА =====
+
+    async def _acquire(self, chat_id: Any):
+        started = time.monotonic()
+
+        if chat_id is not None:
+            delay = self._chat_bucket(chat_id).reserve(started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        await self._acquire_global(outbound_priority.get())
+
+        waited = time.monotonic() - started
+        self.stats['requests'] += 1
+        if waited > 0.001:
+            self.stats['throttled'] += 1
+            self.stats['wait_total'] += waited
+            self.stats['wait_max'] = max(self.stats['wait_max'], waited)
+
+    async def _acquire_global(self, priority: int):
+        now = time.monotonic()
+        if not self._waiters and self.global_bucket.delay(now) == 0:
+            self.global_bucket.reserve(now)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch(), name="outbound-limiter")
+        await future
+
+    async def _dispatch(self):
+        """Выпускать ожидающие запросы по одному, по мере появления слотов"""
+        while self._waiters:
+            delay = self.global_bucket.delay(time.monotonic())
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():  # запрос отменён, пока ждал
+                continue
+            self.global_bucket.reserve(time.monotonic())
+            future.set_result(None)
+
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.max_chats:
+                self._evict_idle_chats()
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            bucket = TokenBucket(self.group_rate if is_group else self.private_rate, self.chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _evict_idle_chats(self):
+        now = time.monotonic()
+        idle = [chat_id for chat_id, bucket in self._chats.items() if bucket.tat <= now]
+        for chat_id in idle:
+            del self._chats[chat_id]
+
+    # ===== МЕТРИКИ =====
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Глубина очереди, ожидание и число 429 (для админ-панели и логов)"""
+        throttled = self.stats['throttled']
+        return {
+            **self.stats,
+            'queue_depth': len(self._waiters),
+            'queue_bulk': sum(1 for priority, _, _ in self._waiters if priority >= PRIORITY_BULK),
+            'tracked_chats': len(self._chats),
+            'wait_avg_ms': round(self.stats['wait_total'] / throttled * 1000, 1) if throttled else 0.0,
+            'wait_max_ms': round(self.stats['wait_max'] * 1000, 1),
+        }
+
+
+outbound_limiter = OutboundLimiter(
+    global_rate=config.OUTBOUND_GLOBAL_RATE / config.BOT_PROCESSES,
+    private_rate=config.OUTBOUND_PRIVATE_CHAT_RATE,
+    group_rate=config.OUTBOUND_GROUP_CHAT_RATE,
+    max_retries=config.OUTBOUND_MAX_RETRIES,
+)
@@ -0,0 +1,101 @@
+# bot/services/analytics.py
+
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from config import config
+from database.db import db
+
+logger = logging.getLogger(__name__)
+
+
+class AnalyticsWriter:
+    """
+    Буфер событий аналитики.
+
+    log() кладёт событие в память и сразу возвращается — хэндлер не ждёт
+    запись на диск. Фоновая задача пишет события пачками (executemany,
+    одна транзакция) при накоплении batch_size событий или раз в
+    flush_interval секунд. stop() дописывает всё, что осталось в буфере.
+
+    Буфер ограничен max_queue: если БД недоступна дольше, чем нужно для
+    его заполнения, новые события отбрасываются и считаются в stats['dropped'].
+    """
+
+    def __init__(self, batch_size: int = 200, flush_interval: float = 2.0, max_queue: int = 20000):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_queue = max(self.batch_size, max_queue)
+
+        self._buffer: List[tuple] = []
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_lock = asyncio.Lock()
+
+        self.stats = {'logged': 0, 'written': 0, 'dropped': 0, 'flushes': 0, 'errors': 0}
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._loop(), name="analytics-writer")
+        logger.info("✅ Analytics writer started")
+
+    async def stop(self):
+        """Остановить и дописать буфер"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+        logger.info(
+            f"✅ Analytics writer stopped (записано {self.stats['written']}, "
+            f"отброшено {self.stats['dropped']}, в буфере {len(self._buffer)})"
+        )
+
+    def log(self, user_id: int, action: str, room: str = None,
+            style: str = None, status: str = "success", cost: float = 1):
+        """Поставить событие в буфер (не ждёт записи)"""
+        if len(self._buffer) >= self.max_queue:
+            self.stats['dropped'] += 1
+            return
+        # Формат CURRENT_TIMESTAMP (UTC), чтобы работали существующие отчёты
+        created_at = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        self._buffer.append((user_id, action, room, style, status, cost, created_at))
+        self.stats['logged'] += 1
+        if len(self._buffer) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def flush(self):
+        """Записать всё из буфера пачками по batch_size"""
+        async with self._flush_lock:
+            while self._buffer:
+                batch = self._buffer[:self.batch_size]
+                try:
+                    await db.log_analytics_batch(batch)
+                except Exception as e:
+                    self.stats['errors'] += 1
+                    logger.error(f"❌ Не удалось записать аналитику ({len(batch)} событий): {e}")
+                    return
+                del self._buffer[:len(batch)]
+                self.stats['written'] += len(batch)
+                self.stats['flushes'] += 1
+
+    async def _loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, 'queued': len(self._buffer)}
+
+
+analytics = AnalyticsWriter(
+    batch_size=config.ANALYTICS_BATCH_SIZE,
+    flush_interval=config.ANALYTICS_FLUSH_INTERVAL,
+    max_queue=config.ANALYTICS_MAX_QUEUE,
+)
@@ -0,0 +1,242 @@
+# bot/services/broadcast.py
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+from config import config
+from database.db import db
+from keyboards.inline import get_broadcast_progress_keyboard
+from middlewares.outbound_limiter import PRIORITY_INTERACTIVE, bulk_priority, outbound_priority
+
+logger = logging.getLogger(__name__)
+
+
+class BroadcastService:
+    """
+    Рассылка сообщения всем пользователям.
+
+    - Получатели читаются пачками по user_id (keyset-пагинация), таблица
+      users целиком в память не загружается.
+    - Пачка отправляется параллельно (BROADCAST_CONCURRENCY), темп задаёт
+      OutboundLimiter; рассылка идёт с низким приоритетом и не тормозит
+      ответы пользователям.
+    - После каждой пачки прогресс сохраняется в broadcasts.last_user_id:
+      после перезапуска рассылка продолжится с этого места (пачка, прерванная
+      посередине, может быть отправлена повторно).
+    - Пользователи, заблокировавшие бота, помечаются users.is_blocked.
+    """
+
+    def __init__(self, chunk_size: int = 100, concurrency: int = 20, lease_seconds: int = 120,
+                 poll_interval: float = 60.0, progress_interval: float = 5.0):
+        self.chunk_size = max(1, chunk_size)
+        self.concurrency = max(1, concurrency)
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.progress_interval = progress_interval
+        self.worker_id = config.WORKER_ID
+
+        self._bot: Optional[Bot] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        # broadcast_id -> {'started': monotonic, 'sent_at_start': int}
+        self._runtime: Dict[int, Dict[str, float]] = {}
+
+    async def start(self, bot: Bot, worker_id: Optional[str] = None):
+        """Запустить обработчик рассылок (продолжит прерванные перезапуском)"""
+        self._bot = bot
+        if worker_id:
+            self.worker_id = worker_id
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._loop(), name="broadcast")
+        logger.info(f"✅ Broadcast service started ({self.worker_id})")
+
+    async def stop(self):
+        """Остановить. Незавершённая рассылка продолжится после перезапуска"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        logger.info("✅ Broadcast service stopped")
+
+    async def create(self, admin_id: int, text: str, progress_chat_id: int, progress_message_id: int) -> int:
+        """Создать рассылку и сразу начать отправку"""
+        broadcast_id = await db.create_broadcast(admin_id, text, progress_chat_id, progress_message_id)
+        logger.info(f"📢 Broadcast {broadcast_id} created by {admin_id}")
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return broadcast_id
+
+    async def cancel(self, broadcast_id: int) -> bool:
+        """Остановить рассылку (текущая пачка будет дослана)"""
+        cancelled = await db.cancel_broadcast(broadcast_id)
+        if cancelled:
+            logger.info(f"⛔ Broadcast {broadcast_id} cancelled")
+        return cancelled
+
+    # ===== ОБРАБОТКА =====
+
+    async def _loop(self):
+        while True:
+            try:
+                self._wakeup.clear()
+                broadcast = await db.claim_broadcast(self.worker_id, self.lease_seconds)
+                if broadcast:
+                    await self._run(broadcast)
+                    continue
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Broadcast loop error: {e}", exc_info=True)
+                await asyncio.sleep(5)
+
+    async def _run(self, broadcast: Dict[str, Any]):
+        broadcast_id = broadcast['id']
+        self._runtime[broadcast_id] = {'started': time.monotonic(), 'sent_at_start': broadcast['sent']}
+        try:
+            await self._send_all(broadcast)
+        finally:
+            self._runtime.pop(broadcast_id, None)
+
+    async def _send_all(self, broadcast: Dict[str, Any]):
+        broadcast_id = broadcast['id']
+        last_user_id = broadcast['last_user_id'] or 0
+        last_progress = 0.0
+        logger.info(f"📢 Broadcast {broadcast_id}: sending from user_id > {last_user_id}")
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def send(user_id: int) -> str:
+            async with semaphore:
+                return await self._send_one(user_id, broadcast['text'])
+
+        with bulk_priority():
+            while True:
+                recipients = await db.get_broadcast_recipients(last_user_id, self.chunk_size)
+                if not recipients:
+                    break
+
+                results = await asyncio.gather(*[send(user_id) for user_id in recipients])
+                blocked = [user_id for user_id, result in zip(recipients, results) if result == 'blocked']
+                last_user_id = recipients[-1]
+
+                owned = await db.checkpoint_broadcast(
+                    broadcast_id, self.worker_id, last_user_id,
+                    sent=results.count('sent'), failed=results.count('failed'),
+                    blocked=blocked, lease_seconds=self.lease_seconds,
+                )
+                if not owned:
+                    logger.warning(f"⚠️ Broadcast {broadcast_id}: аренда потеряна, останавливаемся")
+                    return
+
+                current = await db.get_broadcast(broadcast_id)
+                if current['status'] != 'running':
+                    # Статус уже итоговый (отмена выставляет его сама)
+                    await self._update_progress_message(current)
+                    return
+
+                if time.monotonic() - last_progress >= self.progress_interval:
+                    last_progress = time.monotonic()
+                    await self._update_progress_message(current)
+
+        if await db.finish_broadcast(broadcast_id, 'completed'):
+            logger.info(f"✅ Broadcast {broadcast_id} completed")
+        else:
+            logger.info(f"📢 Broadcast {broadcast_id}: отменена до завершения")
+        await self._update_progress_message(await db.get_broadcast(broadcast_id))
+
+    async def _send_one(self, user_id: int, text: str) -> str:
+        try:
+            await self._bot.send_message(chat_id=user_id, text=text)
+            return 'sent'
+        except TelegramForbiddenError:
+            return 'blocked'
+        except TelegramBadRequest as e:
+            # chat not found / user is deactivated — писать некуда
+            if 'chat not found' in str(e).lower() or 'deactivated' in str(e).lower():
+                return 'blocked'
+            logger.warning(f"⚠️ Broadcast to {user_id} failed: {e}")
+            return 'failed'
+        except Exception as e:
+            logger.warning(f"⚠️ Broadcast to {user_id} failed: {e}")
+            return 'failed'
+
+    # ===== ПРОГРЕСС =====
+
+    def get_progress(self, broadcast: Dict[str, Any]) -> Dict[str, Any]:
+        """Прогресс рассылки: обработано, скорость (сообщений/с) и оценка оставшегося времени"""
+        processed = broadcast['sent'] + broadcast['failed'] + broadcast['blocked']
+        total = max(broadcast['total'], processed)
+        runtime = self._runtime.get(broadcast['id'])
+
+        rate = 0.0
+        if runtime:
+            elapsed = time.monotonic() - runtime['started']
+            sent_now = broadcast['sent'] - runtime['sent_at_start']
+            rate = sent_now / elapsed if elapsed > 0 else 0.0
+
+        remaining = total - processed
+        return {
+            'processed': processed,
+            'total': total,
+            'percent': round(processed / total * 100, 1) if total else 100.0,
+            'rate': round(rate, 1),
+            'eta_seconds': int(remaining / rate) if rate > 0 and broadcast['status'] == 'running' else None,
+        }
+
+    def format_progress(self, broadcast: Dict[str, Any]) -> str:
+        """Текст экрана прогресса для админ-панели"""
+        progress = self.get_progress(broadcast)
+        status_names = {
+            'running': '⏳ Идёт отправка',
+            'completed': '✅ Завершена',
+            'cancelled': '⛔ Остановлена',
+        }
+        eta = progress['eta_seconds']
+        eta_text = f"{eta // 60} мин {eta % 60} с" if eta is not None else "—"
+
+        return f"""
+📢 <b>РАССЫЛКА #{broadcast['id']}</b>
+
+{status_names.get(broadcast['status'], broadcast['status'])}
+
+📨 <b>Прогресс:</b> {progress['processed']} / {progress['total']} ({progress['percent']}%)
+├─ Доставлено: <b>{broadcast['sent']}</b>
+├─ Заблокировали бота: <b>{broadcast['blocked']}</b>
+└─ Ошибок: <b>{broadcast['failed']}</b>
+
+⚡ Скорость: <b>{progress['rate']} сообщ./с</b>
+⏱ Осталось: <b>{eta_text}</b>
+"""
+
+    async def _update_progress_message(self, broadcast: Dict[str, Any]):
+        if not broadcast or not broadcast['progress_message_id']:
+            return
+        # Экран админа обновляется вне очереди рассылки
+        token = outbound_priority.set(PRIORITY_INTERACTIVE)
+        try:
+            await self._bot.edit_message_text(
+                chat_id=broadcast['progress_chat_id'],
+                message_id=broadcast['progress_message_id'],
+                text=self.format_progress(broadcast),
+                reply_markup=get_broadcast_progress_keyboard(broadcast['id'], broadcast['status'] == 'running'),
+                parse_mode="HTML"
+            )
+        except TelegramBadRequest as e:
+            logger.debug(f"Не удалось обновить прогресс рассылки: {e}")
+        finally:
+            outbound_priority.reset(token)
+
+
+broadcast_service = BroadcastService(
+    chunk_size=config.BROADCAST_CHUNK_SIZE,
+    concurrency=config.BROADCAST_CONCURRENCY,
+)
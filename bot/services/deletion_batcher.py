@@ -0,0 +1,91 @@
+# bot/services/deletion_batcher.py
+
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from aiogram import Bot
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Лимит Bot API на один вызов deleteMessages
+MAX_BATCH = 100
+
+
+class DeletionBatcher:
+    """
+    Пакетное удаление сообщений.
+
+    Мусорные сообщения (текст вне сценария, стикеры, лишние фото) копятся
+    по чатам и удаляются одним вызовом delete_messages раз в flush_interval
+    секунд вместо отдельного delete_message на каждое.
+    """
+
+    def __init__(self, flush_interval: float = 1.0):
+        self.flush_interval = flush_interval
+
+        self._bot: Optional[Bot] = None
+        self._pending: Dict[int, List[int]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._dirty: Optional[asyncio.Event] = None
+
+        self.stats = {'queued': 0, 'calls': 0, 'errors': 0}
+
+    async def start(self, bot: Bot):
+        self._bot = bot
+        self._dirty = asyncio.Event()
+        self._task = asyncio.create_task(self._loop(), name="deletion-batcher")
+        logger.info("✅ Deletion batcher started")
+
+    async def stop(self):
+        """Остановить и удалить всё накопленное"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+        logger.info("✅ Deletion batcher stopped")
+
+    def add(self, chat_id: int, message_id: int):
+        """Поставить сообщение в очередь на удаление (не ждёт)"""
+        self._pending.setdefault(chat_id, []).append(message_id)
+        self.stats['queued'] += 1
+        if self._dirty is not None:
+            self._dirty.set()
+
+    async def flush(self):
+        if not self._pending or self._bot is None:
+            return
+        pending, self._pending = self._pending, {}
+        calls = []
+        for chat_id, message_ids in pending.items():
+            for i in range(0, len(message_ids), MAX_BATCH):
+                calls.append(self._delete(chat_id, message_ids[i:i + MAX_BATCH]))
+        await asyncio.gather(*calls)
+
+    async def _delete(self, chat_id: int, message_ids: List[int]):
+        self.stats['calls'] += 1
+        try:
+            if len(message_ids) == 1:
+                await self._bot.delete_message(chat_id=chat_id, message_id=message_ids[0])
+            else:
+                await self._bot.delete_messages(chat_id=chat_id, message_ids=message_ids)
+        except Exception as e:
+            # Уже удалены пользователем или старше 48 часов
+            self.stats['errors'] += 1
+            logger.debug(f"Не удалось удалить сообщения в чате {chat_id}: {e}")
+
+    async def _loop(self):
+        while True:
+            await self._dirty.wait()
+            await asyncio.sleep(self.flush_interval)
+            self._dirty.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"❌ Deletion batcher error: {e}", exc_info=True)
+
+
+deletion_batcher = DeletionBatcher(flush_interval=config.DELETION_BATCH_INTERVAL)
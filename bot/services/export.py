@@ -0,0 +1,140 @@
+# bot/services/export.py
+
+import asyncio
+import csv
+import gzip
+import logging
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from config import config
+from database.db import db
+from database.models import EXPORT_TABLES
+
+logger = logging.getLogger(__name__)
+
+# Лимит Bot API на отправку документа ботом
+MAX_DOCUMENT_SIZE = 50 * 1024 * 1024
+
+EXPORT_FORMATS = ("csv", "parquet")
+
+
+@dataclass
+class ExportResult:
+    path: str
+    filename: str
+    rows: int
+    size: int
+
+
+class DataExporter:
+    """
+    Потоковая выгрузка таблиц в файл для отправки админу документом.
+
+    Строки читаются пачками (Database.iter_export_rows) и сразу пишутся
+    в gzip-CSV или Parquet (по row group на пачку), поэтому память не зависит
+    от размера таблицы. Запись файла идёт в потоке, чтобы не блокировать
+    цикл событий. Parquet требует pyarrow (необязательная зависимость).
+
+    Одновременно выполняется один экспорт: несколько больших выгрузок
+    сразу только нагрузят диск и пул соединений.
+    """
+
+    def __init__(self, chunk_size: int = 5000):
+        self.chunk_size = max(1, chunk_size)
+        self._lock = asyncio.Lock()
+
+    @property
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    @staticmethod
+    def parquet_available() -> bool:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    async def export(self, table: str, date_from: Optional[str] = None,
+                     date_to: Optional[str] = None, fmt: str = "csv") -> ExportResult:
+        """Выгрузить таблицу во временный файл (удаляет вызывающий)"""
+        if table not in EXPORT_TABLES:
+            raise ValueError(f"Unknown export table: {table}")
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format: {fmt}")
+
+        async with self._lock:
+            columns = await db.get_export_columns(table)
+            suffix = ".csv.gz" if fmt == "csv" else ".parquet"
+            period = f"_{date_from or 'start'}_{date_to or 'now'}" if date_from or date_to else ""
+            filename = f"{table}{period}{suffix}"
+
+            fd, path = tempfile.mkstemp(prefix="export_", suffix=suffix)
+            os.close(fd)
+            try:
+                writer = _CsvWriter(path, columns) if fmt == "csv" else _ParquetWriter(path, columns)
+                rows = 0
+                try:
+                    async for chunk in db.iter_export_rows(table, date_from, date_to, self.chunk_size):
+                        await asyncio.to_thread(writer.write, chunk)
+                        rows += len(chunk)
+                finally:
+                    await asyncio.to_thread(writer.close)
+            except BaseException:
+                os.remove(path)
+                raise
+
+            size = os.path.getsize(path)
+            logger.info(f"📦 Export {filename}: {rows} rows, {size} bytes")
+            return ExportResult(path=path, filename=filename, rows=rows, size=size)
+
+
+class _CsvWriter:
+    def __init__(self, path: str, columns: List[Tuple[str, str]]):
+        self._file = gzip.open(path, "wt", encoding="utf-8", newline="", compresslevel=6)
+        self._writer = csv.writer(self._file)
+        self._writer.writerow([name for name, _ in columns])
+
+    def write(self, rows: List[tuple]):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+
+class _ParquetWriter:
+    def __init__(self, path: str, columns: List[Tuple[str, str]]):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        # Схема по объявленным типам SQLite: пачка из одних NULL не ломает типы
+        self._schema = pa.schema([(name, _arrow_type(pa, declared)) for name, declared in columns])
+        self._writer = pq.ParquetWriter(path, self._schema, compression="zstd")
+
+    def write(self, rows: List[tuple]):
+        arrays = []
+        for i, field in enumerate(self._schema):
+            values = [row[i] for row in rows]
+            if field.type == self._pa.string():
+                # SQLite не проверяет типы: в TEXT-колонке может лежать число
+                values = [value if value is None or isinstance(value, str) else str(value) for value in values]
+            arrays.append(self._pa.array(values, type=field.type))
+        self._writer.write_table(self._pa.Table.from_arrays(arrays, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+def _arrow_type(pa, declared: str):
+    if "INT" in declared:
+        return pa.int64()
+    if any(kind in declared for kind in ("REAL", "FLOA", "DOUB")):
+        return pa.float64()
+    return pa.string()
+
+
+data_exporter = DataExporter(chunk_size=config.EXPORT_CHUNK_SIZE)
@@ -0,0 +1,110 @@
+# bot/services/generation_cache.py
+
+import hashlib
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from config import config
+from database.db import db
+
+logger = logging.getLogger(__name__)
+
+# Ссылки на результаты Replicate живут около часа; после этого
+# запись полезна только если известен Telegram file_id
+REPLICATE_URL_TTL = 3600
+
+
+@dataclass(frozen=True)
+class GenerationResult:
+    """Результат генерации: ссылка Replicate и Telegram file_id (если уже отправлялся)"""
+
+    url: str
+    file_id: Optional[str] = None
+
+    @property
+    def photo(self) -> str:
+        """Что передать в send_photo: file_id надёжнее ссылки с ограниченным сроком жизни"""
+        return self.file_id or self.url
+
+
+class GenerationCache:
+    """
+    Кэш результатов генерации с адресацией по содержимому.
+
+    Ключ — хэш (содержимое фото, комната, стиль, версия промпта, модель),
+    поэтому повторная генерация того же фото в том же стиле (сценарий
+    «Другой стиль» → тот же стиль) не оплачивается в Replicate.
+    Записи хранятся в таблице generation_cache с TTL и вытеснением по LRU.
+    """
+
+    def __init__(self, ttl_seconds: int = 86400, max_entries: int = 10000, enabled: bool = True):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.enabled = enabled and ttl_seconds > 0 and max_entries > 0
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(photo_data: bytes, room: str, style: str, prompt_version: str, model: str) -> str:
+        """Ключ кэша для фото и параметров генерации"""
+        photo_hash = hashlib.sha256(photo_data).hexdigest()
+        raw = f"{photo_hash}|{room}|{style}|{prompt_version}|{model}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    async def get(self, cache_key: str) -> Optional[GenerationResult]:
+        """Найти результат в кэше (None — нет или ссылка истекла без file_id)"""
+        if not self.enabled:
+            return None
+
+        try:
+            entry = await db.get_cached_generation(cache_key, self.ttl_seconds, REPLICATE_URL_TTL)
+        except Exception as e:
+            logger.warning(f"⚠️ Ошибка чтения кэша генераций: {e}")
+            entry = None
+
+        if not entry:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        logger.info(f"⚡ Кэш генераций: попадание ({cache_key[:12]})")
+        return GenerationResult(url=entry['result_url'], file_id=entry['file_id'])
+
+    async def put(self, cache_key: str, result_url: str):
+        """Сохранить результат генерации"""
+        if not self.enabled:
+            return
+        try:
+            await db.put_cached_generation(cache_key, result_url, self.ttl_seconds, self.max_entries)
+        except Exception as e:
+            logger.warning(f"⚠️ Ошибка записи в кэш генераций: {e}")
+
+    async def remember_file_id(self, result_url: str, file_id: str):
+        """Привязать Telegram file_id к результату после первой отправки"""
+        if not self.enabled or not file_id:
+            return
+        try:
+            await db.set_cached_generation_file_id(result_url, file_id)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось сохранить file_id в кэше: {e}")
+
+    async def get_stats(self) -> Dict[str, Any]:
+        """Счётчики попаданий/промахов и размер кэша (для админ-панели)"""
+        total = self.hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total * 100, 1) if total else 0.0,
+            'entries': await db.get_generation_cache_size() if self.enabled else 0,
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+        }
+
+
+generation_cache = GenerationCache(
+    ttl_seconds=config.GENERATION_CACHE_TTL,
+    max_entries=config.GENERATION_CACHE_MAX_ENTRIES,
+)
@@ -0,0 +1,245 @@
+# bot/services/generation_queue.py
+
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+
+from config import config
+from database.db import db
+from services.analytics import analytics
+from keyboards.inline import get_main_menu_keyboard, get_post_generation_keyboard
+from middlewares.fsm_cache import update_fsm_data
+from services.generation_cache import GenerationResult, generation_cache
+from services.replicate_api import generate_image
+
+logger = logging.getLogger(__name__)
+
+
+def get_result_caption(style: str) -> str:
+    """Подпись к фото с результатом генерации"""
+    return f"✨ Ваш новый дизайн в стиле *{style.replace('_', ' ').title()}*!"
+
+
+class GenerationQueue:
+    """
+    Персистентная очередь генераций с пулом воркеров.
+
+    Задачи хранятся в таблице generation_jobs, поэтому перезапуск бота
+    не теряет ни задачу, ни списанный токен:
+    - задача берётся в аренду (worker_id, lease_until), аренда продлевается
+      во время генерации; задачу упавшего процесса заберёт любой другой
+    - при старте свои прерванные задачи (running) возвращаются в очередь
+    - после GENERATION_MAX_ATTEMPTS неудач токен возвращается пользователю
+
+    Пропускная способность ограничена числом воркеров, а не числом
+    одновременно работающих хэндлеров.
+    """
+
+    def __init__(self, workers: int = 4, max_attempts: int = 2, poll_interval: float = 5.0,
+                 lease_seconds: int = 300):
+        self.workers_count = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.poll_interval = poll_interval
+        self.lease_seconds = max(30, lease_seconds)
+        self.worker_id = config.WORKER_ID
+
+        self._bot: Optional[Bot] = None
+        self._storage: Optional[BaseStorage] = None
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+
+    async def start(self, bot: Bot, storage: BaseStorage, worker_id: Optional[str] = None):
+        """
+        Запустить воркеры (вызывается из main после init_db).
+
+        worker_id должен быть стабильным между перезапусками процесса,
+        чтобы при старте вернуть в очередь именно его прерванные задачи.
+        """
+        self._bot = bot
+        self._storage = storage
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        if worker_id:
+            self.worker_id = worker_id
+
+        requeued = await db.requeue_interrupted_jobs(self.worker_id)
+        if requeued:
+            logger.info(f"🔁 Возвращено в очередь прерванных генераций: {requeued}")
+
+        for n in range(self.workers_count):
+            self._tasks.append(asyncio.create_task(self._worker(n), name=f"generation-worker-{n}"))
+        self._wakeup.set()
+        logger.info(f"✅ Generation queue started: {self.workers_count} workers ({self.worker_id})")
+
+    async def stop(self):
+        """
+        Остановить воркеры. Задачи в работе остаются в статусе running
+        и будут возвращены в очередь при следующем старте или по истечении аренды.
+        """
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        logger.info("✅ Generation queue stopped")
+
+    def notify(self):
+        """Разбудить воркеры после постановки новой задачи"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def enqueue(self, user_id: int, chat_id: int, photo_id: Optional[str], room: str, style: str,
+                      progress_message_id: Optional[int] = None, charge: bool = True) -> int:
+        """Поставить генерацию в очередь (со списанием токена, если charge=True)"""
+        job_id = await db.create_generation_job(
+            user_id, chat_id, photo_id, room, style,
+            progress_message_id=progress_message_id, charge=charge
+        )
+        logger.info(f"📥 Generation job {job_id} queued: user={user_id} {room} → {style}")
+        self.notify()
+        return job_id
+
+    async def get_stats(self) -> Dict[str, Any]:
+        """Статистика очереди: задачи по статусам и число воркеров"""
+        return {
+            'workers': self.workers_count,
+            'jobs': await db.get_generation_queue_stats(),
+        }
+
+    # ===== ВОРКЕР =====
+
+    async def _worker(self, n: int):
+        while not self._stopping:
+            try:
+                self._wakeup.clear()
+                job = await db.claim_generation_job(self.worker_id, self.lease_seconds)
+                if job is None:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                # Есть работа — возможно, в очереди есть ещё: будим остальных
+                self._wakeup.set()
+                await self._process(job)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Generation worker {n} error: {e}", exc_info=True)
+                await asyncio.sleep(1)
+
+    async def _renew_lease(self, job_id: int):
+        """Продлевать аренду задачи, пока идёт генерация"""
+        interval = self.lease_seconds / 3
+        while True:
+            await asyncio.sleep(interval)
+            if not await db.renew_generation_job_lease(job_id, self.worker_id, self.lease_seconds):
+                logger.warning(f"⚠️ Generation job {job_id}: аренда потеряна")
+                return
+
+    async def _process(self, job: Dict[str, Any]):
+        job_id = job['id']
+        logger.info(f"🎨 Generation job {job_id} started (attempt {job['attempts']})")
+
+        # Задача, забранная после падения процесса, могла исчерпать попытки
+        if job['attempts'] > self.max_attempts:
+            status = await db.fail_generation_job(job_id, "attempts exhausted")
+            logger.error(f"❌ Generation job {job_id} failed permanently ({status})")
+            await self._deliver_failure(job, refunded=(status == 'refunded'))
+            return
+
+        renew_task = asyncio.create_task(self._renew_lease(job_id))
+        try:
+            result = await generate_image(job['photo_id'], job['room'], job['style'], self._bot.token)
+        except Exception as e:
+            logger.error(f"❌ Generation job {job_id} crashed: {e}", exc_info=True)
+            result = None
+        finally:
+            renew_task.cancel()
+
+        if result:
+            await db.complete_generation_job(job_id, result.url, result.file_id)
+            analytics.log(job['user_id'], 'generation', job['room'], job['style'])
+            await db.increment_user_generations(job['user_id'])
+            await self._deliver_result(job, result)
+            logger.info(f"✅ Generation job {job_id} succeeded")
+            return
+
+        if job['attempts'] < self.max_attempts:
+            await db.retry_generation_job(job_id, "empty result")
+            logger.warning(f"⚠️ Generation job {job_id} failed, retrying")
+            self.notify()
+            return
+
+        status = await db.fail_generation_job(job_id, "empty result")
+        logger.error(f"❌ Generation job {job_id} failed permanently ({status})")
+        await self._deliver_failure(job, refunded=(status == 'refunded'))
+
+    # ===== ДОСТАВКА РЕЗУЛЬТАТА =====
+
+    async def _remember_menu(self, job: Dict[str, Any], message_id: int):
+        """Запомнить новое меню в FSM пользователя (под блокировкой FSM, см. update_fsm_data)"""
+        key = StorageKey(bot_id=self._bot.id, chat_id=job['chat_id'], user_id=job['user_id'])
+        await update_fsm_data(self._storage, key, menu_message_id=message_id)
+
+    async def _delete_progress_message(self, job: Dict[str, Any]):
+        if not job['progress_message_id']:
+            return
+        try:
+            await self._bot.delete_message(chat_id=job['chat_id'], message_id=job['progress_message_id'])
+        except Exception as e:
+            logger.debug(f"Не удалось удалить сообщение о прогрессе: {e}")
+
+    async def _deliver_result(self, job: Dict[str, Any], result: GenerationResult):
+        await self._delete_progress_message(job)
+        try:
+            sent = await self._bot.send_photo(
+                chat_id=job['chat_id'],
+                photo=result.photo,
+                caption=get_result_caption(job['style']),
+                parse_mode="Markdown"
+            )
+            # Запоминаем file_id: повторные отправки (история, «Показать снова», кэш)
+            # идут с серверов Telegram и не зависят от срока жизни ссылки Replicate
+            # (результат из кэша с file_id уже сохранён в complete_generation_job)
+            if sent.photo and not result.file_id:
+                file_id = sent.photo[-1].file_id
+                await db.set_generation_job_file_id(job['id'], file_id)
+                await generation_cache.remember_file_id(result.url, file_id)
+            # сообщение после генерации дизайна
+            menu = await self._bot.send_message(
+                chat_id=job['chat_id'],
+                text="Что дальше?",
+                reply_markup=get_post_generation_keyboard()
+            )
+            await self._remember_menu(job, menu.message_id)
+        except Exception as e:
+            logger.error(f"❌ Не удалось отправить результат генерации {job['id']}: {e}", exc_info=True)
+
+    async def _deliver_failure(self, job: Dict[str, Any], refunded: bool):
+        await self._delete_progress_message(job)
+        text = "Ошибка генерации. Попробуйте еще раз."
+        if refunded:
+            text += "\nТокен возвращён на баланс."
+        try:
+            menu = await self._bot.send_message(
+                chat_id=job['chat_id'],
+                text=text,
+                reply_markup=get_main_menu_keyboard()
+            )
+            await self._remember_menu(job, menu.message_id)
+        except Exception as e:
+            logger.error(f"❌ Не удалось сообщить об ошибке генерации {job['id']}: {e}", exc_info=True)
+
+
+generation_queue = GenerationQueue(
+    workers=config.GENERATION_WORKERS,
+    max_attempts=config.GENERATION_MAX_ATTEMPTS,
+    lease_seconds=config.GENERATION_JOB_LEASE,
+)
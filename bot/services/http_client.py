@@ -0,0 +1,72 @@
+# bot/services/http_client.py
+
+import asyncio
+import logging
+from typing import Optional
+
+import aiohttp
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+
+class HttpClient:
+    """
+    Общий для всего процесса HTTP-клиент.
+
+    Одна aiohttp.ClientSession с пулом keep-alive соединений и кэшем DNS:
+    скачивание фото из Telegram и загрузка результатов переиспользуют
+    «тёплые» TCP+TLS соединения вместо новой сессии на каждый запрос.
+    """
+
+    def __init__(self, limit: int = 100, limit_per_host: int = 20, dns_cache_ttl: int = 300,
+                 keepalive_timeout: float = 30.0, total_timeout: float = 60.0, connect_timeout: float = 10.0):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.total_timeout = total_timeout
+        self.connect_timeout = connect_timeout
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._lock = asyncio.Lock()
+
+    async def start(self) -> aiohttp.ClientSession:
+        """Создать сессию (вызывается из main при старте)"""
+        async with self._lock:
+            if self._session is None or self._session.closed:
+                connector = aiohttp.TCPConnector(
+                    limit=self.limit,
+                    limit_per_host=self.limit_per_host,
+                    ttl_dns_cache=self.dns_cache_ttl,
+                    keepalive_timeout=self.keepalive_timeout,
+                )
+                timeout = aiohttp.ClientTimeout(total=self.total_timeout, connect=self.connect_timeout)
+                self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+                logger.info(
+                    f"✅ HTTP client started: limit={self.limit}, per_host={self.limit_per_host}, "
+                    f"dns_ttl={self.dns_cache_ttl}s"
+                )
+        return self._session
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Вернуть общую сессию (создаёт её, если start() ещё не вызывался)"""
+        if self._session is None or self._session.closed:
+            return await self.start()
+        return self._session
+
+    async def close(self):
+        """Закрыть сессию и все соединения пула"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logger.info("✅ HTTP client closed")
+        self._session = None
+
+
+http_client = HttpClient(
+    limit=config.HTTP_POOL_LIMIT,
+    limit_per_host=config.HTTP_POOL_LIMIT_PER_HOST,
+    dns_cache_ttl=config.HTTP_DNS_CACHE_TTL,
+    total_timeout=config.HTTP_TIMEOUT,
+)
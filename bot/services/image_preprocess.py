@@ -0,0 +1,113 @@
+# bot/services/image_preprocess.py
+
+import asyncio
+import io
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional
+
+from config import config
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow не установлен — фото уходят в модель без обработки
+    Image = None
+    ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+# Метрики предобработки
+_stats = {
+    'processed': 0,
+    'skipped': 0,
+    'errors': 0,
+    'bytes_before': 0,
+    'bytes_after': 0,
+    'time_total': 0.0,
+}
+
+
+def _preprocess_sync(data: bytes, max_edge: int, quality: int) -> bytes:
+    """
+    Уменьшает фото по длинной стороне и перекодирует в JPEG.
+
+    Выполняется в отдельном процессе. EXIF не переносится в результат,
+    но ориентация из EXIF предварительно применяется к пикселям.
+    """
+    with Image.open(io.BytesIO(data)) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        out = io.BytesIO()
+        img.save(out, format='JPEG', quality=quality, optimize=True)
+        return out.getvalue()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn, а не fork: к моменту создания пула уже работают event loop
+        # и потоки aiosqlite, и форк мог бы унаследовать захваченную ими блокировку
+        _executor = ProcessPoolExecutor(
+            max_workers=max(1, config.IMAGE_PREPROCESS_WORKERS),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+async def preprocess_photo(data: bytes) -> bytes:
+    """
+    Подготовить фото к загрузке в Replicate: ограничить длинную сторону
+    (IMAGE_MAX_EDGE), убрать EXIF и перекодировать с IMAGE_JPEG_QUALITY.
+
+    Работа идёт в пуле процессов и не блокирует event loop.
+    При ошибке или без Pillow возвращаются исходные байты.
+    """
+    if Image is None or config.IMAGE_MAX_EDGE <= 0:
+        _stats['skipped'] += 1
+        return data
+
+    started = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    try:
+        result = await loop.run_in_executor(
+            _get_executor(), _preprocess_sync, data, config.IMAGE_MAX_EDGE, config.IMAGE_JPEG_QUALITY
+        )
+    except Exception as e:
+        _stats['errors'] += 1
+        logger.warning(f"⚠️ Не удалось обработать фото, отправляем оригинал: {e}")
+        return data
+
+    elapsed = time.perf_counter() - started
+    _stats['processed'] += 1
+    _stats['bytes_before'] += len(data)
+    _stats['bytes_after'] += len(result)
+    _stats['time_total'] += elapsed
+
+    logger.info(f"🖼 Фото обработано: {len(data) / 1024:.0f} КБ → {len(result) / 1024:.0f} КБ за {elapsed:.2f}с")
+    return result
+
+
+def get_preprocess_stats() -> Dict[str, Any]:
+    """Метрики предобработки: количество, размеры до/после, среднее время"""
+    processed = _stats['processed']
+    before = _stats['bytes_before']
+    return {
+        **_stats,
+        'saved_percent': round((1 - _stats['bytes_after'] / before) * 100, 1) if before else 0.0,
+        'avg_time_ms': round(_stats['time_total'] / processed * 1000, 1) if processed else 0.0,
+    }
+
+
+def shutdown_preprocess_pool():
+    """Остановить пул процессов (при остановке бота)"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -1,8 +1,11 @@
 # bot/services/replicate_api.py
 
+import asyncio
+import functools
+import hashlib
+import io
 import logging
 import os
-import tempfile
 import time
 from typing import Optional
 
@@ -10,6 +13,9 @@ import aiohttp
 import replicate
 
 from config import config
+from services.generation_cache import GenerationResult, generation_cache
+from services.http_client import http_client
+from services.image_preprocess import preprocess_photo
 
 logger = logging.getLogger(__name__)
 
@@ -53,8 +59,42 @@ Prohibited:
 
 """
 
+# Версия промпта для ключа кэша генераций: правка CUSTOM_PROMPT
+# автоматически делает старые закэшированные результаты недействительными
+PROMPT_VERSION = hashlib.sha256(CUSTOM_PROMPT.encode()).hexdigest()[:12]
+
+
+# Ограничение числа одновременных генераций (создаётся лениво внутри event loop)
+_generation_semaphore: Optional[asyncio.Semaphore] = None
+
 
 # ===== HELPER FUNCTIONS =====
+def _get_generation_semaphore() -> asyncio.Semaphore:
+    global _generation_semaphore
+    if _generation_semaphore is None:
+        _generation_semaphore = asyncio.Semaphore(max(1, config.REPLICATE_MAX_CONCURRENCY))
+    return _generation_semaphore
+
+
+async def _run_model(model_input: dict):
+    """
+    Запускает модель, не блокируя event loop.
+
+    Используется асинхронный клиент Replicate (replicate.async_run);
+    для старых версий библиотеки — синхронный replicate.run в пуле потоков.
+    Число одновременных предсказаний ограничено REPLICATE_MAX_CONCURRENCY.
+    """
+    async with _get_generation_semaphore():
+        if hasattr(replicate, 'async_run'):
+            return await replicate.async_run(REPLICATE_MODEL, input=model_input)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None,
+            functools.partial(replicate.run, REPLICATE_MODEL, input=model_input)
+        )
+
+
 def _build_full_prompt(custom_prompt: str, room: str, style: str) -> str:
     """
     Строит финальный промпт: CUSTOM_PROMPT + room + style
@@ -78,13 +118,15 @@ def _build_full_prompt(custom_prompt: str, room: str, style: str) -> str:
     return full_prompt
 
 
-async def _download_telegram_photo(bot_token: str, file_id: str) -> Optional[bytes]:
+async def _download_telegram_photo(bot_token: str, file_id: str,
+                                   session: Optional[aiohttp.ClientSession] = None) -> Optional[bytes]:
     """
     Скачивает фото из Telegram
 
     Args:
         bot_token: Токен Telegram бота
         file_id: ID файла в Telegram
+        session: HTTP-сессия (по умолчанию — общая сессия http_client)
 
     Returns:
         Байты изображения или None при ошибке
@@ -92,43 +134,28 @@ async def _download_telegram_photo(bot_token: str, file_id: str) -> Optional[byt
     url = TELEGRAM_FILE_URL.format(bot_token=bot_token, file_id=file_id)
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as resp:
-                if resp.status != 200:
-                    logger.error(f"❌ Не удалось скачать фото: HTTP {resp.status}")
-                    return None
-                return await resp.read()
+        session = session or await http_client.get_session()
+        async with session.get(url) as resp:
+            if resp.status != 200:
+                logger.error(f"❌ Не удалось скачать фото: HTTP {resp.status}")
+                return None
+            return await resp.read()
     except Exception as e:
         logger.error(f"❌ Ошибка при скачивании фото: {e}")
         return None
 
 
-def _save_temp_file(data: bytes) -> Optional[str]:
+def _as_upload_stream(data: bytes, filename: str = "photo.jpg") -> io.BytesIO:
     """
-    Сохраняет данные во временный файл
+    Оборачивает байты фото в файловый объект для загрузки в Replicate.
 
-    Args:
-        data: Байты для сохранения
-
-    Returns:
-        Путь к временному файлу или None при ошибке
+    BytesIO, созданный из bytes, не копирует буфер до первой записи,
+    поэтому фото идёт из ответа Telegram в запрос к Replicate без диска
+    и без лишних копий. Имя нужно клиенту Replicate для определения MIME-типа.
     """
-    try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp_file:
-            tmp_file.write(data)
-            return tmp_file.name
-    except Exception as e:
-        logger.error(f"❌ Ошибка создания временного файла: {e}")
-        return None
-
-
-def _cleanup_temp_file(file_path: str) -> None:
-    """Удаляет временный файл"""
-    try:
-        if file_path and os.path.exists(file_path):
-            os.unlink(file_path)
-    except Exception as e:
-        logger.warning(f"⚠️ Не удалось удалить временный файл {file_path}: {e}")
+    stream = io.BytesIO(data)
+    stream.name = filename
+    return stream
 
 
 def _extract_image_url(output) -> Optional[str]:
@@ -161,7 +188,7 @@ async def generate_image(
     room: str,
     style: str,
     bot_token: str
-) -> Optional[str]:
+) -> Optional[GenerationResult]:
     """
     Генерирует изображение используя Google Nano Banana
 
@@ -172,7 +199,8 @@ async def generate_image(
         bot_token: Токен Telegram бота
 
     Returns:
-        URL сгенерированного изображения или None при ошибке
+        GenerationResult (URL и, для результата из кэша генераций,
+        Telegram file_id) либо None при ошибке
     """
 
     # Проверка API токена
@@ -187,7 +215,7 @@ async def generate_image(
     prompt = _build_full_prompt(CUSTOM_PROMPT, room, style)
 
     start_time = time.time()
-    tmp_file_path: Optional[str] = None
+    cache_key: Optional[str] = None
 
     try:
         if photo_file_id:
@@ -200,29 +228,27 @@ async def generate_image(
             if not photo_data:
                 return None
 
-            # Сохраняем во временный файл
-            tmp_file_path = _save_temp_file(photo_data)
-            if not tmp_file_path:
-                return None
-
-            # Генерируем изображение
-            with open(tmp_file_path, 'rb') as img_file:
-                output = replicate.run(
-                    REPLICATE_MODEL,
-                    input={
-                        "prompt": prompt,
-                        "image_input": [img_file]
-                    }
-                )
+            # Проверяем кэш: то же фото в той же комнате и стиле уже генерировалось
+            cache_key = generation_cache.make_key(photo_data, room, style, PROMPT_VERSION, REPLICATE_MODEL)
+            cached_result = await generation_cache.get(cache_key)
+            if cached_result:
+                return cached_result
+
+            # Уменьшаем и перекодируем фото (в пуле процессов)
+            photo_data = await preprocess_photo(photo_data)
+
+            # Генерируем изображение (фото передаётся из памяти, без временного файла)
+            with _as_upload_stream(photo_data) as img_file:
+                output = await _run_model({
+                    "prompt": prompt,
+                    "image_input": [img_file]
+                })
         else:
             # ===== TEXT-TO-IMAGE MODE =====
             logger.info(f"🎨 Nano Banana (Text-to-Image): {room} → {style}")
             logger.debug(f"📝 Промпт: {prompt}")
 
-            output = replicate.run(
-                REPLICATE_MODEL,
-                input={"prompt": prompt}
-            )
+            output = await _run_model({"prompt": prompt})
 
         # Извлекаем URL из ответа
         image_url = _extract_image_url(output)
@@ -231,7 +257,9 @@ async def generate_image(
             elapsed_time = time.time() - start_time
             logger.info(f"✅ Nano Banana готово за {elapsed_time:.2f}с")
             logger.debug(f"📸 Image URL: {image_url}")
-            return image_url
+            if cache_key:
+                await generation_cache.put(cache_key, image_url)
+            return GenerationResult(url=image_url)
         else:
             logger.error("❌ Пустой ответ от Nano Banana")
             return None
@@ -240,8 +268,3 @@ async def generate_image(
         logger.error(f"❌ Ошибка Nano Banana: {e}")
         logger.exception("Полный traceback:")
         return None
-
-    finally:
-        # Всегда очищаем временный файл
-        if tmp_file_path:
-            _cleanup_temp_file(tmp_file_path)
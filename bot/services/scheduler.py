@@ -0,0 +1,140 @@
+# bot/services/scheduler.py
+
+import asyncio
+import heapq
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import Bot
+
+from config import config
+from database.db import db
+from services.deletion_batcher import deletion_batcher
+
+logger = logging.getLogger(__name__)
+
+ActionHandler = Callable[[Bot, Dict[str, Any]], Awaitable[None]]
+
+
+class Scheduler:
+    """
+    Планировщик отложенных действий (удалить сообщение через N секунд и т.п.).
+
+    Хэндлер ставит действие и сразу возвращается — не держит слот
+    диспетчера на asyncio.sleep. Действия хранятся в scheduled_actions,
+    поэтому перезапуск не оставляет в чатах «вечных» предупреждений.
+
+    Куча в памяти хранит только моменты срабатывания своих действий, чтобы
+    проснуться вовремя; сами действия забираются из БД через DELETE ... RETURNING,
+    так что при нескольких процессах каждое выполняется один раз. Раз в
+    poll_interval проверяется ближайшее действие в БД (поставленное другим
+    процессом или до перезапуска).
+    """
+
+    def __init__(self, poll_interval: float = 30.0, batch_size: int = 100):
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+
+        self._bot: Optional[Bot] = None
+        self._handlers: Dict[str, ActionHandler] = {}
+        self._heap: List[float] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.stats = {'scheduled': 0, 'executed': 0, 'errors': 0, 'lag_max_ms': 0.0}
+
+    def register(self, kind: str, handler: ActionHandler):
+        """Зарегистрировать обработчик для типа действия"""
+        self._handlers[kind] = handler
+
+    async def start(self, bot: Bot):
+        """Запустить (вызывается из main после init_db)"""
+        self._bot = bot
+        self._wakeup = asyncio.Event()
+        next_at = await db.get_next_action_time()
+        if next_at is not None:
+            heapq.heappush(self._heap, next_at)
+        self._task = asyncio.create_task(self._loop(), name="scheduler")
+        logger.info(f"✅ Scheduler started (pending: {await db.count_scheduled_actions()})")
+
+    async def stop(self):
+        """Остановить. Невыполненные действия остаются в БД"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        logger.info("✅ Scheduler stopped")
+
+    async def schedule(self, kind: str, delay: float, **payload: Any) -> int:
+        """Выполнить действие kind через delay секунд"""
+        run_at = time.time() + delay
+        action_id = await db.create_scheduled_action(kind, json.dumps(payload), run_at)
+        self.stats['scheduled'] += 1
+
+        heapq.heappush(self._heap, run_at)
+        if self._wakeup is not None and self._heap[0] == run_at:
+            self._wakeup.set()
+        return action_id
+
+    async def delete_message_later(self, chat_id: int, message_id: int, delay: float = 3):
+        """Удалить сообщение через delay секунд"""
+        await self.schedule("delete_message", delay, chat_id=chat_id, message_id=message_id)
+
+    # ===== ЦИКЛ =====
+
+    async def _loop(self):
+        while True:
+            try:
+                now = time.time()
+                due = await db.claim_due_actions(now, self.batch_size)
+                if due:
+                    await asyncio.gather(*[self._execute(action, now) for action in due])
+                    continue
+
+                while self._heap and self._heap[0] <= now:
+                    heapq.heappop(self._heap)
+                timeout = self.poll_interval
+                if self._heap:
+                    timeout = min(timeout, self._heap[0] - now)
+
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=max(0.0, timeout))
+                except asyncio.TimeoutError:
+                    if not self._heap:
+                        next_at = await db.get_next_action_time()
+                        if next_at is not None:
+                            heapq.heappush(self._heap, next_at)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Scheduler error: {e}", exc_info=True)
+                await asyncio.sleep(1)
+
+    async def _execute(self, action: Dict[str, Any], now: float):
+        handler = self._handlers.get(action['kind'])
+        if handler is None:
+            logger.warning(f"⚠️ Scheduler: нет обработчика для '{action['kind']}'")
+            return
+
+        self.stats['lag_max_ms'] = max(self.stats['lag_max_ms'], round((now - action['run_at']) * 1000, 1))
+        try:
+            await handler(self._bot, json.loads(action['payload']))
+            self.stats['executed'] += 1
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.warning(f"⚠️ Scheduler: действие {action['kind']} #{action['id']} не выполнено: {e}")
+
+
+# ===== ОБРАБОТЧИКИ ДЕЙСТВИЙ =====
+
+async def _delete_message(bot: Bot, payload: Dict[str, Any]):
+    # Удаления, наступившие одновременно, уходят одним delete_messages
+    deletion_batcher.add(payload['chat_id'], payload['message_id'])
+
+
+scheduler = Scheduler(poll_interval=config.SCHEDULER_POLL_INTERVAL)
+scheduler.register("delete_message", _delete_message)
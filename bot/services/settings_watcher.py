@@ -0,0 +1,46 @@
+# bot/services/settings_watcher.py
+
+import asyncio
+import logging
+from typing import Optional
+
+from config import config
+from database.db import db
+
+logger = logging.getLogger(__name__)
+
+
+class SettingsWatcher:
+    """
+    Держит снимок db.settings актуальным.
+
+    Раз в poll_interval секунд читает settings_version (одна строка) и
+    перечитывает настройки, только если версия изменилась — так изменения,
+    сделанные другим процессом или вручную в БД, доходят до всех процессов.
+    """
+
+    def __init__(self, poll_interval: float = 10.0):
+        self.poll_interval = poll_interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._loop(), name="settings-watcher")
+        logger.info(f"✅ Settings watcher started (версия {db.settings.version})")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        logger.info("✅ Settings watcher stopped")
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await db.refresh_settings()
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось проверить версию настроек: {e}")
+
+
+settings_watcher = SettingsWatcher(poll_interval=config.SETTINGS_POLL_INTERVAL)
@@ -0,0 +1,68 @@
+# bot/utils/cache.py
+
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class TTLCache:
+    """
+    Кэш в памяти процесса: записи живут ttl секунд, при переполнении
+    вытесняется давно не использованная (LRU).
+
+    Защита от гонки чтения и записи: читатель берёт version перед запросом
+    к БД и передаёт его в set(); если между ними была инвалидация,
+    прочитанное (возможно, устаревшее) значение в кэш не попадёт.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, max_entries)
+        self.enabled = ttl_seconds > 0
+
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._version = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, version: Optional[int] = None):
+        if not self.enabled or (version is not None and version != self._version):
+            return
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, *keys: Hashable):
+        self._version += 1
+        for key in keys:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        self._version += 1
+        self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total * 100, 1) if total else 0.0,
+        }
@@ -1,5 +1,4 @@
 # --- Новый файл: bot/utils/helpers.py ---
-import asyncio
 import logging
 
 from aiogram.types import Message
@@ -7,6 +6,8 @@ from aiogram.fsm.context import FSMContext
 from aiogram.exceptions import TelegramBadRequest
 from aiogram.enums import ParseMode
 
+from services.scheduler import scheduler
+
 logger = logging.getLogger(__name__)
 
 # Ключ для хранения ID Пина
@@ -43,12 +44,9 @@ def format_message_with_balance(text: str, balance: int) -> str:
 async def delete_message_after_delay(message: Message, delay: int = 3):
     """
     Удаляет сообщение через указанное количество секунд.
+    Не ждёт: удаление ставится в планировщик и переживает перезапуск.
     """
-    await asyncio.sleep(delay)
-    try:
-        await message.delete()
-    except Exception as e:
-        logger.warning(f"Не удалось удалить временное сообщение (ID: {message.message_id}): {e}")
+    await scheduler.delete_message_later(message.chat.id, message.message_id, delay)
 
 
 async def edit_nav_message(bot, chat_id, state: FSMContext, text: str, reply_markup=None):
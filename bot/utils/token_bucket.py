@@ -0,0 +1,35 @@
+# bot/utils/token_bucket.py
+
+
+class TokenBucket:
+    """GCRA: rate запросов в секунду со всплеском до burst"""
+
+    __slots__ = ("interval", "tolerance", "tat", "last_used")
+
+    def __init__(self, rate: float, burst: int):
+        self.interval = 1.0 / rate
+        self.tolerance = self.interval * max(0, burst - 1)
+        self.tat = 0.0
+        self.last_used = 0.0
+
+    def delay(self, now: float) -> float:
+        """Сколько ждать до следующего разрешённого запроса"""
+        return max(0.0, max(self.tat, now) - self.tolerance - now)
+
+    def reserve(self, now: float) -> float:
+        """Занять слот; возвращает задержку до него"""
+        tat = max(self.tat, now)
+        self.tat = tat + self.interval
+        self.last_used = now
+        return max(0.0, tat - self.tolerance - now)
+
+    def pause(self, now: float, seconds: float):
+        """Не выпускать запросы ближайшие seconds секунд (после 429)"""
+        self.tat = max(self.tat, now + seconds + self.tolerance)
+
+    def try_acquire(self, now: float) -> bool:
+        """Занять слот, только если он свободен прямо сейчас"""
+        if self.delay(now) > 0:
+            return False
+        self.reserve(now)
+        return True